@@ -51,7 +51,7 @@ __all__ = [
 	'environ', 'fs', 'newfs',
 	'config', 'applications',
 	'parsing', 'tokenparser', 'formats', 'templates', 'objectmanager',
-	'indexers', 'indexviews', 'operations', 'notebook', 'history',
+	'indexers', 'indexviews', 'operations', 'notebook', 'parsetreecache', 'history',
 	'export', 'www', 'search',
 	'widgets', 'pageindex', 'pageview', 'save_page', 'clipboard', 'gui',
 	'main', 'plugins',
@@ -617,6 +617,32 @@ def new_page_from_text(text, format='wiki'):
 
 _notebook_data = None
 
+def dump_database(db):
+	'''Returns a SQL script that re-creates a sqlite database
+
+	Like C{db.iterdump()} but handles virtual tables, like the table for
+	full text search. The data of a virtual table is restored through
+	the tables that are created implicitly for it.
+
+	@param db: a C{sqlite3.Connection}
+	@returns: the SQL script as string
+	'''
+	import re
+	virtual_tables = [
+		row[0] for row in db.execute(
+			'SELECT name FROM sqlite_master '
+			'WHERE type="table" and sql LIKE "CREATE VIRTUAL TABLE%"'
+		)
+	]
+	skip = []
+	for name in virtual_tables:
+		skip.append(re.compile(r'^INSERT INTO "%s" ' % re.escape(name)))
+		skip.append(re.compile(r'^CREATE TABLE \'%s_\w+\'' % re.escape(name)))
+
+	lines = [l for l in db.iterdump() if not any(r.match(l) for r in skip)]
+	return '\n'.join(lines)
+
+
 def new_notebook(fakedir=None):
 	'''Returns a new Notebook object with all data in memory
 
@@ -653,8 +679,7 @@ def new_notebook(fakedir=None):
 
 		index = Index(':memory:', layout)
 		index.check_and_update()
-		lines = list(index._db.iterdump())
-		sql = '\n'.join(lines)
+		sql = dump_database(index._db)
 
 		_notebook_data = (templfolder, sql, manifest)
 
@@ -676,7 +701,7 @@ def new_notebook(fakedir=None):
 		'WHERE type="table" and name NOT LIKE "sqlite%"'
 	)]
 	for table in tables:
-		index._db.execute('DROP TABLE %s' % table)
+		index._db.execute('DROP TABLE IF EXISTS %s' % table)
 	index._db.executescript(sql)
 	index._db.commit()
 
@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017 Jaap Karssenberg <jaap.karssenberg@gmail.com>
+
+'''Benchmarks for the index and search layer
+
+These are not part of the test suite. They generate a deterministic
+synthetic notebook in a temporary folder and time indexing, checking
+and a number of canned queries on it. Results are written as JSON so
+that runs from different revisions can be compared.
+
+Usage: python -m tests.benchmarks [OPTIONS]
+
+See "python -m tests.benchmarks --help" for the options. The notebook
+generator is in L{tests.benchmarks.generator}, the timings are done by
+L{tests.benchmarks.runner}.
+'''
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017 Jaap Karssenberg <jaap.karssenberg@gmail.com>
+
+'''Command line interface for the benchmarks, see L{tests.benchmarks}'''
+
+from __future__ import with_statement
+
+import sys
+import json
+import getopt
+import logging
+
+from .generator import NotebookSpec
+from .runner import run_benchmark, environment_info
+
+
+usage = '''\
+usage: python -m tests.benchmarks [OPTIONS]
+
+Options:
+  -h, --help          print this text
+  -o, --output FILE   write JSON results to FILE instead of stdout
+  --pages N           number of pages in the notebook (default: 1000)
+  --depth N           maximum namespace depth (default: 3)
+  --links N           number of links per page (default: 5)
+  --tags N            number of distinct tags (default: 100)
+  --tags-per-page N   number of tags on each page (default: 2)
+  --tasks N           number of tasks on each page (default: 2)
+  --words N           number of words of text per page (default: 100)
+  --seed N            seed for the random generator (default: 0)
+  --edits N           number of pages to edit before the
+                      incremental update (default: 100)
+  --reps N            number of calls per canned query (default: 100)
+  --dir FOLDER        generate the notebook in FOLDER and keep it
+  -V, --verbose       print progress to stderr
+'''
+
+
+def main(argv=None):
+	if argv is None:
+		argv = sys.argv
+
+	specargs = {}
+	kwargs = {}
+	output = None
+	loglevel = logging.WARNING
+	opts, args = getopt.gnu_getopt(argv[1:], 'ho:V', [
+		'help', 'output=', 'pages=', 'depth=', 'links=', 'tags=',
+		'tags-per-page=', 'tasks=', 'words=', 'seed=', 'edits=', 'reps=',
+		'dir=', 'verbose'
+	])
+	specopts = {
+		'--pages': 'n_pages',
+		'--depth': 'depth',
+		'--links': 'n_links',
+		'--tags': 'n_tags',
+		'--tags-per-page': 'tags_per_page',
+		'--tasks': 'tasks_per_page',
+		'--words': 'n_words',
+		'--seed': 'seed',
+	}
+	for o, a in opts:
+		if o in ('-h', '--help'):
+			print usage
+			return
+		elif o in specopts:
+			specargs[specopts[o]] = int(a)
+		elif o == '--edits':
+			kwargs['n_edits'] = int(a)
+		elif o == '--reps':
+			kwargs['reps'] = int(a)
+		elif o == '--dir':
+			kwargs['tmpdir'] = a
+		elif o in ('-o', '--output'):
+			output = a
+		elif o in ('-V', '--verbose'):
+			loglevel = logging.INFO
+		else:
+			assert False, 'Unkown option: %s' % o
+
+	if args:
+		print >>sys.stderr, usage
+		sys.exit(1)
+
+	logging.basicConfig(level=loglevel, format='%(levelname)s: %(message)s')
+
+	spec = NotebookSpec(**specargs)
+	results = run_benchmark(spec, **kwargs)
+	results['environment'] = environment_info()
+
+	text = json.dumps(results, indent=2, sort_keys=True)
+	if output:
+		with open(output, 'w') as fh:
+			fh.write(text + '\n')
+	else:
+		print text
+
+
+if __name__ == '__main__':
+	main()
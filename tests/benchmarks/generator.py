@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017 Jaap Karssenberg <jaap.karssenberg@gmail.com>
+
+'''Generator for deterministic synthetic notebooks
+
+The notebook is a tree of namespaces of at most C{depth} levels where
+each namespace has the same number of pages. Each page has some tags,
+links to other pages, tasks and a paragraph of text. All choices are
+made by a random generator with a fixed seed, so the same parameters
+always give the same notebook.
+'''
+
+import random
+
+
+WORDS = (
+	'lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur',
+	'adipiscing', 'elit', 'sed', 'do', 'eiusmod', 'tempor',
+	'incididunt', 'ut', 'labore', 'et', 'dolore', 'magna', 'aliqua',
+	'enim', 'ad', 'minim', 'veniam', 'quis', 'nostrud', 'exercitation',
+	'ullamco', 'laboris', 'nisi', 'aliquip', 'ex', 'ea', 'commodo',
+	'consequat', 'duis', 'aute', 'irure', 'in', 'reprehenderit',
+	'voluptate', 'velit', 'esse', 'cillum', 'fugiat', 'nulla',
+	'pariatur', 'excepteur', 'sint', 'occaecat', 'cupidatat', 'non',
+	'proident', 'sunt', 'culpa', 'qui', 'officia', 'deserunt',
+	'mollit', 'anim', 'id', 'est', 'laborum',
+)
+
+
+class NotebookSpec(object):
+	'''Parameters for a synthetic notebook
+
+	@ivar n_pages: total number of pages
+	@ivar depth: maximum namespace depth, the number of pages per
+	namespace is chosen such that all pages fit in this depth
+	@ivar n_links: number of links per page
+	@ivar n_tags: number of distinct tags in the notebook
+	@ivar tags_per_page: number of tags on each page
+	@ivar tasks_per_page: number of tasks on each page
+	@ivar n_words: number of words of text per page
+	@ivar seed: seed for the random generator
+	'''
+
+	def __init__(self, n_pages=1000, depth=3, n_links=5, n_tags=100,
+		tags_per_page=2, tasks_per_page=2, n_words=100, seed=0
+	):
+		assert n_pages > 0 and depth > 0
+		self.n_pages = n_pages
+		self.depth = depth
+		self.n_links = n_links
+		self.n_tags = n_tags
+		self.tags_per_page = tags_per_page
+		self.tasks_per_page = tasks_per_page
+		self.n_words = n_words
+		self.seed = seed
+
+	@property
+	def width(self):
+		'''Number of pages per namespace'''
+		width = 1
+		while sum(width ** d for d in range(1, self.depth + 1)) < self.n_pages:
+			width += 1
+		return width
+
+	def to_dict(self):
+		return dict(
+			(k, getattr(self, k)) for k in (
+				'n_pages', 'depth', 'width', 'n_links', 'n_tags',
+				'tags_per_page', 'tasks_per_page', 'n_words', 'seed'
+			)
+		)
+
+
+def list_page_names(spec):
+	'''Returns the names of all pages for a notebook spec in breadth
+	first order. Pages are named "PageN" with N a unique number.
+	'''
+	width = spec.width
+	names = []
+	parents = [None]
+	while len(names) < spec.n_pages:
+		children = []
+		for parent in parents:
+			for i in range(width):
+				n = len(names)
+				if n == spec.n_pages:
+					break
+				name = 'Page%i' % n if parent is None \
+					else parent + ':Page%i' % n
+				names.append(name)
+				children.append(name)
+		parents = children
+	return names
+
+
+def page_text(spec, name, names, rand, revision=0):
+	'''Returns the wiki text for a single page
+	@param spec: a L{NotebookSpec}
+	@param name: the page name
+	@param names: list of all page names, used to pick link targets
+	@param rand: a C{random.Random} object
+	@param revision: revision number, used to generate distinct
+	content when a page is edited
+	'''
+	lines = [
+		'Content-Type: text/x-zim-wiki',
+		'Wiki-Format: zim 0.4',
+		'',
+		'====== %s ======' % name.split(':')[-1],
+	]
+	if revision:
+		lines.append('Revision %i' % revision)
+
+	if spec.n_tags and spec.tags_per_page:
+		lines.append(' '.join(
+			'@tag%i' % rand.randrange(spec.n_tags)
+				for i in range(spec.tags_per_page)
+		))
+	lines.append('')
+
+	for i in range(spec.n_links):
+		target = rand.choice(names)
+		if i % 2:
+			lines.append('[[:%s]]' % target)
+		else:
+			lines.append('[[%s]]' % target.split(':')[-1])
+	lines.append('')
+
+	for i in range(spec.tasks_per_page):
+		if i % 3 == 2:
+			lines.append('[*] Task %i done' % i)
+		else:
+			lines.append('[ ] TODO task %i %s <2017-%02i-%02i' % (
+				i, rand.choice(WORDS), rand.randint(1, 12), rand.randint(1, 28)))
+	lines.append('')
+
+	words = [rand.choice(WORDS) for i in range(spec.n_words)]
+	lines.append(' '.join(words).capitalize() + '.')
+
+	return '\n'.join(lines) + '\n'
+
+
+def generate_notebook(folder, spec):
+	'''Write a synthetic notebook to a folder
+	@param folder: a L{Folder} object
+	@param spec: a L{NotebookSpec}
+	@returns: a list with all page names
+	'''
+	rand = random.Random(spec.seed)
+	names = list_page_names(spec)
+	for name in names:
+		file = folder.file(name.replace(':', '/') + '.txt')
+		file.write(page_text(spec, name, names, rand))
+	return names
+
+
+def edit_pages(folder, spec, names, n_edits, revision=1):
+	'''Rewrite a number of pages in a notebook with new content
+	@param folder: the L{Folder} of the notebook
+	@param spec: the L{NotebookSpec} used to generate the notebook
+	@param names: the page names returned by L{generate_notebook()}
+	@param n_edits: the number of pages to edit
+	@param revision: revision number for the new content
+	@returns: a list with the names of the pages that were edited
+	'''
+	rand = random.Random(spec.seed + revision)
+	edited = rand.sample(names, min(n_edits, len(names)))
+	for name in edited:
+		file = folder.file(name.replace(':', '/') + '.txt')
+		file.write(page_text(spec, name, names, rand, revision))
+	return edited
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017 Jaap Karssenberg <jaap.karssenberg@gmail.com>
+
+'''Runner for the index and search benchmarks
+
+Each benchmark generates a notebook with L{generate_notebook()} and
+times the following steps:
+
+  - C{cold_index}: building the index for the new notebook
+  - C{warm_check}: checking the index again without any changes
+  - C{incremental_update}: checking and updating the index after a
+    number of pages have been edited
+  - C{queries}: a set of canned queries, each repeated a number of
+    times on random pages and tags
+
+The results are returned as a dict that can be dumped as JSON.
+'''
+
+from __future__ import with_statement
+
+import time
+import random
+import shutil
+import sqlite3
+import platform
+import tempfile
+import logging
+
+logger = logging.getLogger('tests.benchmarks')
+
+
+import zim
+
+from zim.fs import Dir
+from zim.newfs import LocalFolder
+from zim.notebook import init_notebook, Notebook, Path, HRef, \
+	LINK_DIR_FORWARD, LINK_DIR_BACKWARD, IndexNotFoundError
+from zim.search import SearchSelection, Query
+
+from .generator import NotebookSpec, generate_notebook, edit_pages, WORDS
+
+try:
+	from zim.plugins.tasklist.indexer import TasksIndexer, TasksView
+except ImportError:
+	# The tasklist plugin depends on gtk for its user interface
+	TasksIndexer = None
+
+
+TASKLIST_PREFERENCES = {
+	'labels': 'TODO, FIXME',
+	'all_checkboxes': True,
+	'integrate_with_journal': 'none',
+	'included_subtrees': '',
+	'excluded_subtrees': '',
+}
+
+
+class Timer(object):
+	'''Context manager that measures wall clock time, after the
+	C{with} block the time in seconds is in the C{time} attribute
+	'''
+
+	def __init__(self):
+		self.time = None
+
+	def __enter__(self):
+		self._start = time.time()
+		return self
+
+	def __exit__(self, *exc_info):
+		self.time = time.time() - self._start
+		return False # re-raise error
+
+
+def open_notebook(dir):
+	'''Open a notebook and add the tasks indexer when available'''
+	notebook = Notebook.new_from_dir(dir)
+	if TasksIndexer is not None:
+		notebook._benchmark_tasksindexer = \
+			TasksIndexer.new_from_index(notebook.index, TASKLIST_PREFERENCES)
+			# keep reference, else signals get disconnected
+	return notebook
+
+
+def list_queries(notebook, spec, names, reps, seed=0):
+	'''Returns the canned queries for a generated notebook. Each
+	query is a function that takes a single argument, arguments are
+	random pages, namespaces or tags from the notebook.
+	@returns: a list of 3-tuples of a label, a function and a list of
+	C{reps} arguments
+	'''
+	rand = random.Random(seed)
+	paths = [Path(rand.choice(names)) for i in range(reps)]
+	namespaces = [Path(rand.choice(names[:spec.width])) for i in range(reps)]
+	tags = []
+	for i in range(reps):
+		try:
+			tag = notebook.tags.lookup_by_tagname('tag%i' % rand.randrange(spec.n_tags or 1))
+		except IndexNotFoundError:
+			pass
+		else:
+			tags.append([tag])
+	tagpairs = [
+		t + u for t, u in zip(tags, reversed(tags)) if t[0].id != u[0].id
+	]
+	words = [rand.choice(WORDS) for i in range(reps)]
+
+	def search(string):
+		selection = SearchSelection(notebook)
+		selection.search(Query(string))
+		return len(selection)
+
+	queries = [
+		('PagesView.walk', lambda p: list(notebook.pages.walk(p)), namespaces),
+		('PagesView.list_pages', lambda p: list(notebook.pages.list_pages(p)), paths),
+		('PagesView.resolve_link', lambda p: notebook.pages.resolve_link(
+			p, HRef.new_from_wiki_link(p.basename)), paths),
+		('LinksView.list_links_section (forward)', lambda p: list(
+			notebook.links.list_links_section(p, LINK_DIR_FORWARD)), namespaces),
+		('LinksView.list_links_section (backward)', lambda p: list(
+			notebook.links.list_links_section(p, LINK_DIR_BACKWARD)), namespaces),
+		('TagsView.list_pages', lambda t: list(notebook.tags.list_pages(t[0])), tags),
+		('TagsView.list_intersecting_tags', lambda t: list(
+			notebook.tags.list_intersecting_tags(t)), tagpairs),
+		('SearchSelection.search (content)', search, words[:max(1, reps // 10)]),
+		('SearchSelection.search (name)', search,
+			['Name: *%s*' % p.basename for p in paths[:max(1, reps // 10)]]),
+		('SearchSelection.search (tag)', search,
+			['@%s' % t[0].name for t in tags[:max(1, reps // 10)]]),
+		('SearchSelection.search (linksto)', search,
+			['LinksTo: "%s"' % p.name for p in paths[:max(1, reps // 10)]]),
+	]
+
+	if TasksIndexer is not None:
+		view = TasksView.new_from_index(notebook.index)
+		queries.append(
+			('TasksView.list_open_tasks', lambda i: list(view.list_open_tasks()), range(reps))
+		)
+
+	return queries
+
+
+def time_queries(queries):
+	'''Time queries as returned by L{list_queries()}
+	@returns: a dict mapping labels to dicts with the number of
+	calls, total time and time per call in milliseconds
+	'''
+	results = {}
+	for label, func, args in queries:
+		if not args:
+			continue
+		with Timer() as timer:
+			for arg in args:
+				func(arg)
+		results[label] = {
+			'calls': len(args),
+			'total': timer.time,
+			'msec_per_call': 1E+3 * timer.time / len(args),
+		}
+	return results
+
+
+def run_benchmark(spec, n_edits=100, reps=100, tmpdir=None):
+	'''Generate a notebook and run all benchmarks on it
+	@param spec: a L{NotebookSpec}
+	@param n_edits: number of pages edited before the incremental update
+	@param reps: number of calls for each canned query
+	@param tmpdir: folder path to create the notebook in, if C{None}
+	a temporary folder is used and removed afterwards
+	@returns: a dict with results
+	'''
+	cleanup = tmpdir is None
+	if tmpdir is None:
+		tmpdir = tempfile.mkdtemp(prefix='zim-benchmark-')
+	dir = Dir(tmpdir)
+
+	try:
+		init_notebook(dir)
+		logger.info('Generating notebook with %i pages in %s', spec.n_pages, dir.path)
+		with Timer() as generate:
+			names = generate_notebook(LocalFolder(dir.path), spec)
+
+		notebook = open_notebook(dir)
+
+		logger.info('Cold index')
+		with Timer() as cold_index:
+			notebook.index.check_and_update()
+		n_pages = notebook.pages.n_all_pages()
+
+		logger.info('Warm check')
+		with Timer() as warm_check:
+			notebook.index.check_and_update()
+
+		logger.info('Editing %i pages', n_edits)
+		edited = edit_pages(LocalFolder(dir.path), spec, names, n_edits)
+		with Timer() as incremental_update:
+			notebook.index.check_and_update()
+
+		logger.info('Timing queries')
+		queries = time_queries(list_queries(notebook, spec, names, reps, spec.seed))
+		resolve_cache = notebook.index.resolve_cache.stats()
+	finally:
+		if cleanup:
+			shutil.rmtree(tmpdir)
+
+	return {
+		'spec': spec.to_dict(),
+		'n_edits': len(edited),
+		'reps': reps,
+		'n_indexed_pages': n_pages,
+		'generate': generate.time,
+		'cold_index': cold_index.time,
+		'warm_check': warm_check.time,
+		'incremental_update': incremental_update.time,
+		'queries': queries,
+		'resolve_cache': resolve_cache,
+	}
+
+
+def environment_info():
+	'''Returns a dict with information about the environment that
+	can influence the results
+	'''
+	return {
+		'zim_version': zim.__version__,
+		'python_version': platform.python_version(),
+		'sqlite_version': sqlite3.sqlite_version,
+		'platform': platform.platform(),
+		'tasklist': TasksIndexer is not None,
+		'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+	}
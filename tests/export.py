@@ -38,6 +38,7 @@ from zim.templates.expression import ExpressionParameter, \
 	ExpressionFunctionCall, ExpressionList
 
 from zim.notebook import Path
+from zim.formats import StubLinker
 
 
 def md5(f):
@@ -326,6 +327,60 @@ class TestExportTemplateContext(tests.TestCase):
 
 
 
+class TestIndexFunction(tests.TestCase):
+
+	def runTest(self):
+		paths = [Path(n) for n in (
+			'Bar', 'Bar:Child', 'Foo', 'Foo:A', 'Foo:A:AA', 'Foo:B', 'Foo:B:BB'
+		)]
+		walks = []
+		def index_generator(namespace):
+			walks.append(namespace)
+			return iter(paths)
+
+		snapshot = IndexSnapshot(index_generator)
+		self.assertEqual(list(snapshot()), paths)
+
+		def index(page, collapse=True):
+			context = ExportTemplateContext(
+				None, lambda source=None: StubLinker(), get_format('wiki').Dumper,
+				'Test', [],
+				index_generator=snapshot,
+				index_page=Path(page) if page else None,
+			)
+			return context.index_function(None, collapse)
+
+		self.assertEqual(index('Foo:A'),
+			'* [[:Bar|Bar]]\n'
+			'* [[:Foo|Foo]]\n'
+			'\t* **A**\n'
+			'\t\t* [[:Foo:A:AA|AA]]\n'
+			'\t* [[:Foo:B|B]]\n'
+		)
+		self.assertEqual(index('Foo:A', collapse=False),
+			'* [[:Bar|Bar]]\n'
+			'\t* [[:Bar:Child|Child]]\n'
+			'* [[:Foo|Foo]]\n'
+			'\t* **A**\n'
+			'\t\t* [[:Foo:A:AA|AA]]\n'
+			'\t* [[:Foo:B|B]]\n'
+			'\t\t* [[:Foo:B:BB|BB]]\n'
+		)
+		self.assertEqual(index('Bar', collapse=False),
+			'* **Bar**\n'
+			'\t* [[:Bar:Child|Child]]\n'
+			'* [[:Foo|Foo]]\n'
+			'\t* [[:Foo:A|A]]\n'
+			'\t\t* [[:Foo:A:AA|AA]]\n'
+			'\t* [[:Foo:B|B]]\n'
+			'\t\t* [[:Foo:B:BB|BB]]\n'
+		)
+		self.assertEqual(index(None), index('Bar', collapse=False).replace('**Bar**', '[[:Bar|Bar]]'))
+
+		# The index is walked only once for all pages
+		self.assertEqual(walks, [None])
+
+
 class TestPageSelections(tests.TestCase):
 
 	def _test_iface(self, selection):
@@ -379,6 +434,174 @@ class TestMultiFileExporter(tests.TestCase):
 		self.assertIn('<li><a href="./roundtrip.html" title="roundtrip" class="page">roundtrip</a></li>', text)
 
 
+@tests.slowTest
+class TestParallelMultiFileExporter(tests.TestCase):
+
+	def runTest(self):
+		tmpdir = self.create_tmp_dir()
+		notebook = tests.new_files_notebook(os.path.join(tmpdir, 'notebook'))
+		for name in ('Test:foo', 'roundtrip'):
+			folder = notebook.get_attachments_dir(Path(name))
+			for i in range(3):
+				folder.file('attachment%i.bin' % i).write_binary(name * 1000 * i)
+
+		def export(name, jobs, template='Default', fail=None):
+			dir = Dir(os.path.join(tmpdir, name))
+			exporter = build_notebook_exporter(dir, 'html', template, index_page='Index', jobs=jobs)
+			if fail:
+				# Set before the workers are forked
+				export_page = exporter.export_page
+				def failing_export_page(notebook, page, *a, **kw):
+					if page.name == fail:
+						raise AssertionError('Test error')
+					return export_page(notebook, page, *a, **kw)
+				exporter.export_page = failing_export_page
+
+			items = list(exporter.export_iter(AllPages(notebook)))
+			contents = {}
+			for root, dirs, files in os.walk(dir.path):
+				for f in files:
+					path = os.path.join(root, f)
+					contents[path[len(dir.path):]] = open(path, 'rb').read()
+			return items, contents
+
+		for template in ('Default', 'Default_with_index'):
+			serial_items, serial = export('serial_' + template, 1, template)
+			parallel_items, parallel = export('parallel_' + template, 3, template)
+
+			self.assertEqual(
+				[getattr(i, 'name', None) or i.basename for i in parallel_items],
+				[getattr(i, 'name', None) or i.basename for i in serial_items]
+			)
+			self.assertIn('/roundtrip/attachment2.bin', parallel)
+			self.assertEqual(sorted(parallel.keys()), sorted(serial.keys()))
+			for path in serial:
+				self.assertEqual(parallel[path], serial[path], 'Differs: %s' % path)
+
+		# Template with index uses the index in the worker processes
+		self.assertIn('href="../roundtrip.html"', parallel['/Test/foo.html'])
+
+		# Error for one page does not stop the export of other pages
+		with tests.LoggingFilter('zim.export', 'Error while exporting'):
+			failed_items, failed = export('failed', 3, 'Default_with_index', fail='roundtrip')
+		self.assertEqual(len(failed_items), len(serial_items))
+		self.assertNotIn('/roundtrip.html', failed)
+		self.assertIn('/roundtrip/attachment2.bin', failed)
+		for path in serial:
+			if path != '/roundtrip.html':
+				self.assertEqual(failed[path], serial[path], 'Differs: %s' % path)
+
+
+class TestIncrementalMultiFileExporter(tests.TestCase):
+
+	def runTest(self):
+		tmpdir = self.create_tmp_dir()
+		notebook = tests.new_files_notebook(os.path.join(tmpdir, 'notebook'))
+		folder = notebook.get_attachments_dir(Path('roundtrip'))
+		for i in range(3):
+			folder.file('attachment%i.bin' % i).write_binary('data' * i)
+
+		dir = Dir(os.path.join(tmpdir, 'output'))
+		resources = Dir(os.path.join(tmpdir, 'resources'))
+		resources.file('style.css').write('body {}\n')
+
+		def export(selection=None):
+			exporter = build_notebook_exporter(dir, 'html', 'Default', incremental=True)
+			exporter.template.resources_dir = resources
+			exporter.export(selection or AllPages(notebook))
+
+		def list_files():
+			files = set()
+			for root, dirs, names in os.walk(dir.path):
+				for name in names:
+					path = os.path.join(root, name)
+					files.add(path[len(dir.path):])
+			return files
+
+		def touch_all():
+			for path in list_files():
+				os.utime(dir.path + path, (1000, 1000))
+
+		def list_written():
+			return set(
+				p for p in list_files()
+					if os.stat(dir.path + p).st_mtime != 1000
+						and p != '/' + MultiFileExporter.MANIFEST_FILE
+			)
+
+		export()
+		files = list_files()
+		self.assertIn('/roundtrip.html', files)
+		self.assertIn('/roundtrip/attachment2.bin', files)
+		self.assertIn('/' + MultiFileExporter.MANIFEST_FILE, files)
+
+		# Nothing changed
+		touch_all()
+		export()
+		self.assertEqual(list_written(), set())
+
+		# Partial export does not remove output of other pages
+		export(SinglePage(notebook, Path('roundtrip')))
+		self.assertEqual(list_files(), files)
+		touch_all()
+		export() # page has no previous and next page in the partial export
+		self.assertEqual(list_written(), set(['/roundtrip.html']))
+
+		# Template resource changed
+		resources.file('style.css').write('body { color: red }\n')
+		touch_all()
+		export()
+		self.assertEqual(list_written(), set(['/_resources/style.css']))
+
+		# Page content changed
+		page = notebook.get_page(Path('roundtrip'))
+		page.parse('wiki', page.dump('wiki') + ['\nSome more text\n'])
+		notebook.store_page(page)
+		touch_all()
+		export()
+		self.assertEqual(list_written(), set(['/roundtrip.html']))
+		self.assertIn('Some more text', dir.file('roundtrip.html').read())
+
+		# Attachment changed, page lists attachments in the template
+		folder.file('attachment1.bin').write_binary('new data')
+		touch_all()
+		export()
+		self.assertEqual(list_written(),
+			set(['/roundtrip.html', '/roundtrip/attachment1.bin']))
+
+		# Attachment removed
+		folder.file('attachment0.bin').remove()
+		export()
+		self.assertNotIn('/roundtrip/attachment0.bin', list_files())
+
+		# Output removed by user
+		dir.file('roundtrip.html').remove()
+		export()
+		self.assertIn('/roundtrip.html', list_files())
+
+		# Page removed, also re-renders the previous and next page
+		notebook.delete_page(Path('roundtrip'))
+		touch_all()
+		export()
+		files = list_files()
+		self.assertNotIn('/roundtrip.html', files)
+		self.assertNotIn('/roundtrip/attachment2.bin', files)
+		self.assertTrue(len(list_written()) > 0)
+
+		# Same output as non-incremental export
+		other = Dir(os.path.join(tmpdir, 'other'))
+		exporter = build_notebook_exporter(other, 'html', 'Default')
+		exporter.template.resources_dir = resources
+		exporter.export(AllPages(notebook))
+		for path in list_files():
+			if path != '/' + MultiFileExporter.MANIFEST_FILE:
+				self.assertEqual(
+					open(dir.path + path, 'rb').read(),
+					open(other.path + path, 'rb').read(),
+					'Differs: %s' % path
+				)
+
+
 class TestSingleFileExporter(tests.TestCase):
 
 	def runTest(self):
@@ -79,6 +79,11 @@ class TestFormatMixin(object):
 		self.assertMultiLineEqual(result, wanted)
 		self.assertNoTextMissing(result, reftree)
 
+		# Streaming dumper gives same result in parts
+		parts = list(dumper.dump_iter(reftree))
+		self.assertTrue(len(parts) > 1)
+		self.assertMultiLineEqual(''.join(parts), wanted)
+
 		# Check that dumper did not modify the tree
 		self.assertMultiLineEqual(reftree.tostring(), self.reference_xml)
 
@@ -181,6 +186,38 @@ class TestParseTree(tests.TestCase):
 		text = tree.tostring()
 		self.assertEqual(text, self.xml)
 
+	def testcopy(self):
+		'''Test ParseTree.copy()'''
+		tree = ParseTree().fromstring(self.xml)
+		tree.meta['Foo'] = 'Bar'
+		copy = tree.copy()
+		self.assertEqual(copy.tostring(), self.xml)
+		self.assertEqual(copy.meta.items(), [('Foo', 'Bar')])
+
+		# Modifying the copy does not modify the original
+		copy.cleanup_headings(offset=1, max=4)
+		self.assertEqual(tree.tostring(), self.xml)
+		self.assertNotEqual(copy.tostring(), self.xml)
+
+		# Attributes are converted to strings, like with a round trip
+		# through XML, the original is not modified
+		builder = ParseTreeBuilder()
+		builder.start(FORMATTEDTEXT)
+		builder.append(HEADING, {'level': 1}, 'Head')
+		builder.append(LINK, {'href': u'\u4e2d\u6587'}, 'Link')
+		builder.end(FORMATTEDTEXT)
+		tree = builder.get_parsetree()
+		copy = tree.copy()
+		self.assertEqual(list(copy.findall(HEADING))[0].attrib, {'level': '1'})
+		self.assertEqual(list(copy.findall(LINK))[0].attrib, {'href': u'\u4e2d\u6587'})
+		self.assertEqual(list(tree.findall(HEADING))[0].attrib, {'level': 1})
+		self.assertEqual(
+			copy.tostring(),
+			ParseTree().fromstring(tree.tostring()).tostring()
+		)
+
+		self.assertIsNone(ParseTree().copy()._etree.getroot())
+
 	def testcleanup_headings(self):
 		'''Test ParseTree.cleanup_headings()'''
 		tree = ParseTree().fromstring(self.xml)
@@ -406,6 +443,33 @@ test 4 5 6
 		output = self.format.Dumper().dump(t)
 		self.assertEqual(output, wanted.splitlines(True))
 
+	def testConcurrentParsing(self):
+		'''Test parsing from multiple threads gives same result as serial'''
+		from multiprocessing.pool import ThreadPool
+
+		old = u'test 1 2 3\n\n\tSome Verbatim block\n\there ....\n\ntest 4 5 6\n'
+		inputs = [(None, text) for name, text in tests.WikiTestData]
+		inputs.append(('Unknown', old)) # backward compatible parsing
+		inputs.append((None, old))
+		inputs = inputs * (2000 // len(inputs) + 1)
+
+		def parse(args):
+			version, text = args
+			if version:
+				tree = self.format.Parser(version=version).parse(text)
+			else:
+				tree = self.format.Parser().parse(text)
+			return tree.tostring()
+
+		wanted = map(parse, inputs)
+		pool = ThreadPool(8)
+		try:
+			result = pool.map(parse, inputs, chunksize=1)
+		finally:
+			pool.close()
+			pool.join()
+		self.assertEqual(result, wanted)
+
 	def testList(self):
 		def check(text, xml, wanted=None):
 			if wanted is None:
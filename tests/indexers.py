@@ -17,8 +17,9 @@ from zim.notebook.layout import FilesLayout
 from zim.newfs import LocalFolder, File
 from zim.newfs.mock import os_native_path
 
-from zim.notebook import Path
-from zim.notebook.index.files import FilesIndexer, TestFilesDBTable, FilesIndexChecker
+from zim.notebook import Path, HRef
+from zim.notebook.index.files import FilesIndexer, TestFilesDBTable, FilesIndexChecker, \
+	FilesIndexWatcher, STATUS_NEED_UPDATE, STATUS_CHECK
 from zim.notebook.index.pages import PagesIndexer, TestPagesDBTable
 from zim.notebook.index.links import LinksIndexer
 from zim.notebook.index.tags import TagsIndexer
@@ -62,6 +63,8 @@ class TestFilesIndexer(tests.TestCase, TestFilesDBTable):
 	)
 	PAGE_TEXT = 'test 123\n'
 
+	BATCH_SIZE = None
+
 	def runTest(self):
 		# Test in 3 parts:
 		#   1. Index existing files structure
@@ -73,12 +76,18 @@ class TestFilesIndexer(tests.TestCase, TestFilesDBTable):
 		db.row_factory = sqlite3.Row
 
 		indexer = FilesIndexer(db, self.root)
+		if self.BATCH_SIZE:
+			indexer.BATCH_SIZE = self.BATCH_SIZE
 
 		def cb_filter_func(name, o, a):
 			#~ print '>>', name
 			if name in ('start-update', 'finish-update'):
 				self.assertFalse(a)
 				return ()
+			elif name == 'file-rows-queued':
+				rows, = a
+				self.assertTrue(rows)
+				return [r['path'] for r in rows]
 			else:
 				row, = a
 				self.assertIsInstance(row, sqlite3.Row)
@@ -158,6 +167,159 @@ class TestFilesIndexer(tests.TestCase, TestFilesDBTable):
 				self.root.child(name).remove()
 
 
+class TestFilesIndexerSmallBatches(TestFilesIndexer):
+
+	# Batch size smaller than the number of folders, to make sure
+	# we still process folders before files
+
+	BATCH_SIZE = 2
+
+
+class TestFilesIndexWatcher(tests.TestCase):
+
+	def runTest(self):
+		root = self.setUpFolder(mock=tests.MOCK_ALWAYS_REAL)
+		for name in ('foo.txt', 'foo/bar.txt', 'dus.txt'):
+			root.file(os_native_path(name)).write('test 123\n')
+
+		db = sqlite3.connect(':memory:')
+		db.row_factory = sqlite3.Row
+		indexer = FilesIndexer(db, root)
+		for i in indexer.update_iter():
+			pass
+
+		def flagged():
+			return sorted(r[0] for r in db.execute(
+				'SELECT path FROM files WHERE index_status = ?',
+				(STATUS_NEED_UPDATE,)
+			))
+
+		watcher = FilesIndexWatcher(db, root)
+		signals = tests.SignalLogger(watcher)
+
+		# No change - e.g. event for our own write
+		watcher.on_monitor_changed(None, root.file('foo.txt').path, None)
+		self.assertEqual(flagged(), [])
+		self.assertEqual(signals['out-of-date'], [])
+
+		# Changed file
+		file = root.file('dus.txt')
+		file.write('test 123\nmore text\n')
+		file._set_mtime(file.mtime() + 10)
+		watcher.on_monitor_changed(None, file.path, None)
+		self.assertEqual(flagged(), ['dus.txt'])
+		self.assertEqual(len(signals['out-of-date']), 1)
+
+		# New file in new folder flags existing parent
+		newfile = root.file(os_native_path('foo/new/page.txt'))
+		newfile.write('test 123\n')
+		folder = root.folder('foo')
+		folder._set_mtime(folder.mtime() + 10)
+		watcher.on_monitor_changed(None, newfile.path, None)
+		self.assertEqual(flagged(), ['dus.txt', 'foo'])
+
+		# Removed file
+		root.file(os_native_path('foo/bar.txt')).remove()
+		watcher.on_monitor_changed(None, root.file(os_native_path('foo/bar.txt')).path, None)
+		self.assertEqual(flagged(), ['dus.txt', 'foo', os_native_path('foo/bar.txt')])
+
+		for i in indexer.update_iter():
+			pass
+		self.assertEqual(flagged(), [])
+		self.assertFilesIndexed(db, ['dus.txt', 'foo', 'foo.txt', os_native_path('foo/new'), os_native_path('foo/new/page.txt')])
+
+		# Monitors follow the folders updated in the index
+		watcher.connect_to_indexer(indexer)
+		watcher.running = True # do not depend on gio support
+		watcher.update_monitors()
+		self.assertEqual(sorted(watcher._monitors), ['.', 'foo', os_native_path('foo/new')])
+
+		root.file(os_native_path('baz/page.txt')).write('test 123\n')
+		root._set_mtime(root.mtime() + 10)
+		watcher.flag_path('.')
+		for i in indexer.update_iter():
+			pass
+		watcher.update_monitors()
+		self.assertEqual(sorted(watcher._monitors), ['.', 'baz', 'foo', os_native_path('foo/new')])
+
+		root.folder('foo').remove_children()
+		root.folder('foo').remove()
+		root._set_mtime(root.mtime() + 20)
+		watcher.flag_path('.')
+		for i in indexer.update_iter():
+			pass
+		watcher.update_monitors()
+		self.assertEqual(sorted(watcher._monitors), ['.', 'baz'])
+
+	def assertFilesIndexed(self, db, paths):
+		self.assertEqual(
+			sorted(r[0] for r in db.execute('SELECT path FROM files WHERE id > 1')),
+			paths
+		)
+
+
+class TestFilesIndexCheckerFoldersOnly(tests.TestCase):
+
+	def runTest(self):
+		root = self.setUpFolder(mock=tests.MOCK_ALWAYS_REAL)
+		for name in ('foo.txt', 'foo/bar.txt', 'foo/baz.txt', 'dus.txt'):
+			root.file(os_native_path(name)).write('test 123\n')
+		for folder in (root, root.folder('foo')):
+			folder._set_mtime(int(folder.mtime())) # can be restored exactly
+
+		db = sqlite3.connect(':memory:')
+		db.row_factory = sqlite3.Row
+		indexer = FilesIndexer(db, root)
+		for i in indexer.update_iter():
+			pass
+
+		def indexed_mtime(path):
+			return db.execute(
+				'SELECT mtime FROM files WHERE path = ?', (path,)
+			).fetchone()[0]
+
+		# File replaced in "foo" changes the folder, "dus.txt" is
+		# modified in place without changing the root folder
+		folder = root.folder('foo')
+		mtime = folder.mtime()
+		bar = root.file(os_native_path('foo/bar.txt'))
+		bar.write('test 123\nmore text\n')
+		bar._set_mtime(bar.mtime() + 10)
+		folder._set_mtime(mtime + 10)
+
+		mtime = root.mtime()
+		dus = root.file('dus.txt')
+		dus.write('test 123\nmore text\n')
+		dus._set_mtime(dus.mtime() + 10)
+		root._set_mtime(mtime)
+
+		# Only folders are queued
+		checker = FilesIndexChecker(db, root)
+		checker.queue_check(folders_only=True)
+		self.assertEqual(
+			sorted(r[0] for r in db.execute(
+				'SELECT path FROM files WHERE index_status = ?', (STATUS_CHECK,)
+			)),
+			['.', 'foo']
+		)
+
+		# Files in the changed folder are checked, others are not
+		for out_of_date in checker.check_iter():
+			if out_of_date:
+				for i in indexer.update_iter():
+					pass
+		self.assertEqual(indexed_mtime(os_native_path('foo/bar.txt')), bar.mtime())
+		self.assertNotEqual(indexed_mtime('dus.txt'), dus.mtime())
+
+		# Full check finds the file modified in place
+		checker.queue_check()
+		for out_of_date in checker.check_iter():
+			if out_of_date:
+				for i in indexer.update_iter():
+					pass
+		self.assertEqual(indexed_mtime('dus.txt'), dus.mtime())
+
+
 class TestPagesIndexer(TestPagesDBTable, tests.TestCase):
 
 	FILES = tuple(map(os_native_path, (
@@ -353,6 +515,26 @@ class TestLinksIndexer(tests.TestCase):
 		)
 		self.assertEqual(links, [(3, 2), (3, 4)])
 
+		### Only the delta is resolved on update
+		resolved = []
+		resolve_link = indexer._pages.resolve_link
+		def count_resolve_link(source, href):
+			resolved.append(href.names)
+			return resolve_link(source, href)
+		indexer._pages.resolve_link = count_resolve_link
+
+		row = {'id': 3, 'name': 'Foo'}
+		indexer.on_page_changed(pageindexer, row, WikiParser().parse('[[Dus]]\n[[Bar]]\n'))
+		self.assertEqual(resolved, [])
+
+		indexer.on_page_changed(pageindexer, row, WikiParser().parse('[[Bar]]\n[[Baz]]\n'))
+		self.assertEqual(resolved, ['Baz'])
+		links = sorted(
+			(r['target'], r['names'])
+				for r in db.execute('SELECT * FROM links')
+		)
+		self.assertEqual(links, [(2, 'Bar'), (5, 'Baz')])
+
 		###
 		pageindexer.setObjectAccess('remove_page')
 		for i, name, cont in self.PAGES:
@@ -407,6 +589,56 @@ class TestTagsIndexer(tests.TestCase):
 		self.assertEqual(tagsources, wantedsources)
 
 
+from zim.notebook.index.fulltext import FullTextIndexer, FullTextView
+
+
+class TestFullTextIndexer(tests.TestCase):
+
+	PAGES = (
+		(2, 'foo', 'Lorem ipsum dolor\n**ipsum** and more\n'),
+		(3, 'bar', 'dolorem ipsum\n'),
+	)
+
+	def runTest(self):
+		db = sqlite3.connect(':memory:')
+		db.row_factory = sqlite3.Row
+		pi = PagesIndexer(db, None, tests.MockObject())
+		for i, name, text in self.PAGES:
+			db.execute(
+				'INSERT INTO pages(id, name, sortkey, parent, source_file) VALUES (?, ?, ?, 1, 1)',
+				(i, name, natural_sort_key(name))
+			)
+
+		indexer = FullTextIndexer(db, tests.MockObject())
+		if not indexer.enabled:
+			self.skipTest('No FTS4 support in sqlite')
+
+		for i, name, text in self.PAGES:
+			tree = WikiParser().parse(text)
+			row = {'id': i, 'name': name}
+			indexer.on_page_changed(None, row, tree)
+
+		view = FullTextView(db)
+		self.assertTrue(view.enabled)
+
+		def matching(word, prefix=False):
+			return sorted(
+				(p.name, c) for p, c in view.list_matching_pages(word, prefix)
+			)
+
+		self.assertEqual(matching('ipsum'), [('bar', 1), ('foo', 2)])
+		self.assertEqual(matching('IPSUM'), [('bar', 1), ('foo', 2)])
+		self.assertEqual(matching('dolor'), [('foo', 1)])
+		self.assertEqual(matching('dolor', prefix=True), [('bar', 1), ('foo', 1)])
+		self.assertEqual(matching('notthere'), [])
+
+		for i, name, text in self.PAGES:
+			row = {'id': i, 'name': name}
+			indexer.on_page_row_deleted(None, row)
+
+		self.assertEqual(matching('ipsum'), [])
+
+
 from zim.notebook.index import IndexUpdateIter
 
 
@@ -448,3 +680,213 @@ class TestFullIndexer(TestFilesIndexer):
 		# 3. Check and update after files disappear
 		self.remove_files(self.FILES_UPDATE)
 		update_iter.check_and_update()
+
+
+class TestMovePages(tests.TestCase):
+
+	def dumpIndex(self, db):
+		pages = sorted(
+			(r['name'], r['n_children'], r['source_file'] is not None, bool(r['is_link_placeholder']))
+				for r in db.execute('SELECT * FROM pages')
+		)
+		links = sorted(tuple(r) for r in db.execute(
+			'SELECT s.name, t.name, links.names FROM links '
+			'JOIN pages AS s ON links.source = s.id '
+			'JOIN pages AS t ON links.target = t.id'
+		))
+		tags = sorted(tuple(r) for r in db.execute(
+			'SELECT tags.name, pages.name FROM tagsources '
+			'JOIN tags ON tagsources.tag = tags.id '
+			'JOIN pages ON tagsources.source = pages.id'
+		))
+		return pages, links, tags
+
+	def runTest(self):
+		from zim.notebook.index import Index
+
+		notebook = tests.new_files_notebook(self.create_tmp_dir())
+		notebook.index.flush() # start from a clean index for the compare below
+		notebook.index.check_and_update()
+		db = notebook.index._db
+		ids = dict(db.execute('SELECT name, id FROM pages').fetchall())
+
+		changed = []
+		notebook.index.update_iter.pages.connect('page-changed',
+			lambda o, row, content: changed.append(row['name']))
+		moved = []
+		notebook.index.update_iter.pages.connect('page-row-moved',
+			lambda o, row, oldrow: moved.append((oldrow['name'], row['name'])))
+
+		# Without updating links, no page needs to be indexed again
+		notebook.move_page(Path('Parent'), Path('Test:Parent'), update_links=False)
+		self.assertEqual(changed, [])
+		self.assertIn(('Parent:Son', 'Test:Parent:Son'), moved)
+		for name in ('Parent', 'Parent:Son:Grandson', 'Parent:Daughter:SomeOne:Foo'):
+			row = db.execute('SELECT id FROM pages WHERE name=?', ('Test:' + name,)).fetchone()
+			self.assertEqual(row['id'], ids[name])
+
+		# Moving to a placeholder, with links updated
+		notebook.move_page(Path('Linking'), Path('Other:Linking'))
+		notebook.move_page(Path('TaskList'), Path('Linking'))
+		notebook.move_page(Path('utf8'), Path('Test:utf8'))
+
+		# Result must be the same as indexing the notebook from scratch
+		index = Index(':memory:', notebook.layout)
+		index.check_and_update()
+		self.assertEqual(self.dumpIndex(db), self.dumpIndex(index._db))
+
+
+class TestLinkResolverCache(tests.TestCase):
+
+	def assertResolveEqual(self, notebook, names=None, links=None):
+		from zim.notebook.index.pages import PagesViewInternal
+
+		cached = notebook.pages._pages
+		uncached = PagesViewInternal(notebook.index._db)
+		names = names or [p.name for p in notebook.pages.walk()]
+		links = links or ['foo', 'Foo:Bar', ':Test:foo', '+Child', 'Parent', 'Son', 'New:Page']
+		for name in names:
+			for link in links:
+				href = HRef.new_from_wiki_link(link)
+				self.assertEqual(
+					cached.resolve_link(Path(name), href),
+					uncached.resolve_link(Path(name), href),
+					'Resolve "%s" from "%s"' % (link, name)
+				)
+
+	def testResolve(self):
+		notebook = tests.new_files_notebook(self.create_tmp_dir())
+		cache = notebook.index.resolve_cache
+		cache.clear()
+		self.assertResolveEqual(notebook)
+		self.assertResolveEqual(notebook)
+		self.assertTrue(cache.stats()['hits'] > 0)
+
+		for path in (Path('Test:Foo'), Path('New'), Path('Parent:Son:Child')):
+			page = notebook.get_page(path)
+			page.parse('wiki', 'test 123\n')
+			notebook.store_page(page)
+			self.assertResolveEqual(notebook)
+
+		notebook.delete_page(Path('Test:Foo'))
+		self.assertResolveEqual(notebook)
+
+		notebook.move_page(Path('Parent'), Path('Test:Parent'))
+		self.assertResolveEqual(notebook)
+
+	def testSourceNotInIndex(self):
+		# Floating links from pages that are not in the index depend
+		# on the source name, not only on the namespace
+		notebook = self.setUpNotebook(mock=tests.MOCK_ALWAYS_REAL, content={'A': 'test 123\n'})
+		notebook.index.check_and_update()
+		notebook.index.resolve_cache.clear()
+		self.assertResolveEqual(notebook, ['A:B:C', 'A:B:D', 'A:B:C', 'A:E'], ['x', 'x:y'])
+
+
+class TestParallelIndexer(TestFullIndexer):
+
+	def runTest(self):
+		self.root = self.setUpFolder(mock=tests.MOCK_ALWAYS_REAL)
+		self.create_files(self.FILES + self.FILES_UPDATE)
+
+		serial_iter = buildUpdateIter(self.root)
+		for i in serial_iter:
+			pass
+
+		parallel_iter = buildUpdateIter(self.root)
+		for i in parallel_iter.parallel_update_iter(2):
+			pass
+
+		for sql in (
+			'SELECT name, n_children, source_file, is_link_placeholder FROM pages',
+			'SELECT source, target, names FROM links',
+			'SELECT tag, source FROM tagsources',
+		):
+			self.assertEqual(
+				sorted(tuple(r) for r in parallel_iter.db.execute(sql)),
+				sorted(tuple(r) for r in serial_iter.db.execute(sql))
+			)
+
+
+from zim.notebook.index import IndexUpdateStats
+
+
+class TestResumeIndexUpdate(TestFullIndexer):
+
+	def runTest(self):
+		self.root = self.setUpFolder(mock=tests.MOCK_ALWAYS_REAL)
+		self.create_files(self.FILES)
+
+		serial_iter = buildUpdateIter(self.root)
+		for i in serial_iter:
+			pass
+		n_files = serial_iter.files.n_updated
+
+		# Interrupt an update half way, updates are committed in
+		# batches, so the "files" table has the state to continue
+		update_iter = buildUpdateIter(self.root)
+		update_iter.files.BATCH_SIZE = 5
+		my_iter = iter(update_iter)
+		for i in range(n_files // 2):
+			next(my_iter)
+		del my_iter
+		update_iter.db.rollback() # drop changes after last commit
+
+		# Handlers can be connected and disconnected during the run
+		calls = []
+		def on_page_changed(o, row, content):
+			calls.append(row['name'])
+			if len(calls) == 1:
+				update_iter.pages.disconnect(handler_id)
+				new_ids.append(update_iter.pages.connect('page-changed', on_page_changed_2))
+		def on_page_changed_2(o, row, content):
+			calls.append('2')
+		new_ids = []
+		handler_id = update_iter.pages.connect('page-changed', on_page_changed)
+
+		progress = []
+		stats = IndexUpdateStats(update_iter, progress_interval=0)
+		self.assertGreater(stats.count_pending(), 0)
+		result = stats.run(iter(update_iter), progress.append)
+
+		self.assertEqual(len([c for c in calls if c != '2']), 1)
+		self.assertGreater(len([c for c in calls if c == '2']), 0)
+		handlers = [h[2] for h in update_iter.pages._signal_handlers['page-changed']]
+		self.assertNotIn(on_page_changed, handlers)
+		self.assertIn(on_page_changed_2, handlers)
+		update_iter.pages.disconnect(new_ids[0])
+		self.assertEqual(stats.count_pending(), 0)
+		for sql in (
+			'SELECT name, n_children, source_file, is_link_placeholder FROM pages',
+			'SELECT source, target, names FROM links',
+			'SELECT tag, source FROM tagsources',
+		):
+			self.assertEqual(
+				sorted(tuple(r) for r in update_iter.db.execute(sql)),
+				sorted(tuple(r) for r in serial_iter.db.execute(sql))
+			)
+
+		# Statistics only cover the resumed part
+		self.assertGreater(result['files'], 0)
+		self.assertLess(result['files'], n_files)
+		self.assertGreater(result['pages_parsed'], 0)
+		self.assertGreater(result['rows_written'], 0)
+		indexers = result['indexers']
+		for name in ('files', 'pages', 'links', 'tags', 'fulltext', 'plugins'):
+			self.assertIn(name, indexers)
+		self.assertGreater(indexers['pages']['rows_written'], 0)
+		self.assertGreater(indexers['links']['rows_written'], 0)
+		self.assertEqual(
+			sum(i['rows_written'] for i in indexers.values()),
+			result['rows_written']
+		)
+		self.assertAlmostEqual(
+			sum(i['seconds'] for i in indexers.values()),
+			result['seconds'], places=3
+		)
+
+		self.assertTrue(progress)
+		self.assertEqual(
+			sorted(progress[-1].keys()),
+			['done', 'eta', 'files_per_second', 'pending']
+		)
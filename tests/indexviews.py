@@ -80,8 +80,7 @@ def new_test_database():
 		for path, text in FILES:
 			folder.file(path).write(text)
 		indexer.check_and_update()
-		lines = list(indexer.db.iterdump())
-		_SQL = '\n'.join(lines)
+		_SQL = tests.dump_database(indexer.db)
 		indexer.db.close()
 
 	db = sqlite3.Connection(':memory:')
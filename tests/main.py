@@ -149,6 +149,54 @@ class TestManual(tests.TestCase):
 		self.assertEqual(window.__class__.__name__, 'MainWindow')
 
 
+class TestSearchCommand(tests.TestCase):
+
+	def setUp(self):
+		self.dir = Dir(self.create_tmp_dir())
+		for i in range(10):
+			self.dir.file('Page%i.txt' % i).write('test foo%s\n' % ('bar' * i))
+
+	def tearDown(self):
+		self.clear_tmp_dir()
+
+	def search(self, *args):
+		cmd = SearchCommand('search')
+		cmd.parse_options(*(args[:-1] + (self.dir.path, args[-1])))
+		with capture_stdout() as output:
+			cmd.run()
+		return output.getvalue().splitlines()
+
+	def runTest(self):
+		self.assertEqual(
+			self.search('Content: "foo*"'),
+			['Page%i' % i for i in range(10)]
+		)
+
+		# Stream results and stop at limit
+		lines = self.search('--stream', '--limit', '3', 'Content: "foo*"')
+		self.assertEqual(len(lines), 3)
+		self.assertTrue(all(l.startswith('Page') for l in lines))
+
+		# JSON with scores
+		from zim.config import json
+		lines = self.search('--json', 'Content: "foobarbar*"')
+		results = [json.loads(l) for l in lines]
+		self.assertEqual([r['name'] for r in results], ['Page%i' % i for i in range(2, 10)])
+		self.assertTrue(all(r['score'] > 0 for r in results))
+
+		# Limit without streaming still gives sorted results
+		lines = self.search('--limit', '2', 'Page*')
+		self.assertEqual(len(lines), 2)
+		self.assertEqual(lines, sorted(lines))
+
+		# Jobs must be a positive number, the default is a single process
+		self.assertEqual(
+			self.search('--jobs', '2', 'Content: "foo*"'),
+			['Page%i' % i for i in range(10)]
+		)
+		self.assertRaises(UsageError, self.search, '--jobs', '0', 'foo')
+
+
 @tests.slowTest
 class TestServer(tests.TestCase):
 
@@ -326,6 +326,10 @@ class TestFS(object):
 		self.assertNotEqual(etag2, etag1)
 		self.assertEquals(file.readlines_with_etag(), (['test 567\n'], etag2))
 
+		# Lines can be given as an iterator
+		etag2 = file.writelines_with_etag(iter(['test ', u'567\n']), etag2)
+		self.assertEquals(file.readlines_with_etag(), (['test 567\n'], etag2))
+
 		# Check raises without etag
 		self.assertRaises(FileChangedError, file.write_with_etag, 'foo!', etag1)
 		self.assertRaises(AssertionError, file.write_with_etag, 'foo!', None)
@@ -10,6 +10,7 @@ import tests
 
 import os
 import time
+import threading
 
 from zim.fs import File, Dir
 from zim.newfs.mock import os_native_path
@@ -732,6 +733,98 @@ class TestUpdateLinksOnMovePage(tests.TestCase):
 		self.assertEqual(B.dump('wiki'), '[[C]]\n[[:C]]\n[[D]]\n[[C:A1]]\n'.splitlines(True))
 		self.assertNoDeadLinks(notebook)
 
+	def testManyBacklinks(self):
+		content = {'A': 'test 123'}
+		for i in range(20):
+			content['B:B%i' % i] = '[[A]]\n[[:A]]\n'
+		notebook = self.setUpNotebook(content=content)
+
+		changed = []
+		notebook.index.connect('changed', lambda o: changed.append(1))
+		steps = list(notebook.move_page_iter(Path('A'), Path('C')))
+		self.assertEqual(len(steps), 40)
+		self.assertEqual(steps[-1][:2], (39, 40))
+		self.assertTrue(len(changed) < 5, 'Expected a single commit for all pages')
+
+		for i in range(20):
+			page = notebook.get_page(Path('B:B%i' % i))
+			self.assertEqual(page.dump('wiki'), ['[[C]]\n', '[[:C]]\n', '\n'])
+			self.assertDoesLink(notebook, 'B:B%i' % i, 'C')
+		self.assertNoDeadLinks(notebook)
+
+	def testMoveSectionWithInternalAndExternalLinks(self):
+		# Moved pages with links to each other and to pages outside the
+		# section, "Section:Child" is updated by the rules for links in
+		# moved pages and for links to the moved section
+		notebook = self.setUpNotebook(content={
+			'Outside': '[[Section]]\n[[Section:Child]]\n[[:Section:Child:Grand]]\n',
+			'Section': '[[+Child]]\n[[Outside]]\n[[:Section:Child]]\n[[Section:Child:Grand]]\n',
+			'Section:Child': '[[Outside]]\n[[+Grand]]\n[[:Section]]\n[[Section:Child:Grand]]\n',
+			'Section:Child:Grand': '[[Child]]\n[[Outside]]\n[[:Outside]]\n',
+		})
+
+		def mapname(name):
+			if name == 'Section' or name.startswith('Section:'):
+				return 'Other:' + name
+			else:
+				return name
+
+		def list_links(names):
+			return sorted(
+				(l.source.name, l.target.name)
+					for name in names
+						for l in notebook.links.list_links(Path(name))
+			)
+
+		names = ['Outside', 'Section', 'Section:Child', 'Section:Child:Grand']
+		before = sorted((mapname(s), mapname(t)) for s, t in list_links(names))
+
+		resolve_link = notebook.pages.resolve_link
+		calls = []
+		def wrapper(source, href, *a, **kw):
+			calls.append((source.name, href.names))
+			return resolve_link(source, href, *a, **kw)
+		notebook.pages.resolve_link = wrapper
+		try:
+			notebook.move_page(Path('Section'), Path('Other:Section'))
+		finally:
+			notebook.pages.resolve_link = resolve_link
+
+		# All links still point to the same pages
+		self.assertEqual(list_links(map(mapname, names)), before)
+		self.assertNoDeadLinks(notebook)
+
+		# Each link is rewritten once, absolute links stay absolute
+		page = notebook.get_page(Path('Other:Section:Child'))
+		self.assertEqual(page.dump('wiki'), [
+			'[[Outside]]\n', '[[+Grand]]\n',
+			'[[:Other:Section]]\n', '[[Section:Child:Grand]]\n', '\n'
+		])
+		page = notebook.get_page(Path('Other:Section'))
+		self.assertEqual(page.dump('wiki'), [
+			'[[+Child]]\n', '[[Outside]]\n', '[[:Other:Section:Child]]\n',
+			'[[Section:Child:Grand]]\n', '\n'
+		])
+
+		# Link targets are taken from the index, links are not resolved
+		# again while updating
+		self.assertEqual(calls, [])
+
+	def testDryRun(self):
+		notebook = self.setUpNotebook(content={
+			'A': '[[D]]\n[[+A1]]\n',
+			'A:A1': 'test 123',
+			'B': '[[A]]\n[[A:A1]]\n',
+			'D': 'test 123',
+		})
+		report = notebook.move_page_dry_run(Path('A'), Path('C'))
+		self.assertEqual(
+			sorted((p.name, sorted(t.name for t in targets)) for p, targets in report),
+			[('A', ['A:A1', 'D']), ('B', ['A', 'A:A1'])]
+		)
+		B = notebook.get_page(Path('B'))
+		self.assertEqual(B.dump('wiki'), ['[[A]]\n', '[[A:A1]]\n', '\n'])
+
 
 class TestPath(tests.TestCase):
 	'''Test path object'''
@@ -1052,6 +1145,209 @@ class TestPageChangeFile(tests.TestCase):
 		self.assertEqual(page3.dump('wiki'), ['Test 5 6 7 8\n'])
 
 
+class TestPageChangeChecker(tests.TestCase):
+
+	def runTest(self):
+		from zim.notebook import CHECK_INTERVAL, CHECK_NOTIFY
+
+		notebook = self.setUpNotebook(
+			mock=tests.MOCK_ALWAYS_REAL,
+			content={'Foo': 'test 123\n'}
+		)
+		checker = notebook.change_checker
+
+		def change_file(page, text):
+			file = zim.newfs.LocalFile(page.source_file.path)
+			old = file.mtime()
+			file.write(text)
+			while file.mtime() == old:
+				time.sleep(0.01) # new mtime
+				file.write(text)
+
+		def get_text():
+			page = notebook.get_page(Path('Foo'))
+			return ''.join(page.dump('wiki')).strip()
+
+		# Default checks on every lookup
+		page = notebook.get_page(Path('Foo'))
+		self.assertEqual(''.join(page.dump('wiki')).strip(), 'test 123')
+		for i in range(3):
+			notebook.get_page(Path('Foo'))
+		self.assertEqual((checker.checks, checker.skipped), (3, 0))
+
+		# Interval skips checks within the interval
+		checker.mode = CHECK_INTERVAL
+		checker.interval = 3600
+		checker.reset_stats()
+		notebook.get_page(Path('Foo'))
+		change_file(page, 'test 456\n')
+		self.assertEqual(get_text(), 'test 123')
+		self.assertEqual((checker.checks, checker.skipped), (1, 1))
+		checker.interval = 0
+		self.assertEqual(get_text(), 'test 456')
+
+		# Notify only checks after a reported change, mode is set from
+		# the notebook properties
+		notebook.save_properties(page_check=CHECK_NOTIFY, page_check_interval=5)
+		self.assertEqual((checker.mode, checker.interval), (CHECK_NOTIFY, 5.0))
+		checker.reset_stats()
+		change_file(page, 'test 789\n')
+		self.assertEqual(get_text(), 'test 456')
+		notebook.index.check_and_update() # reports change
+		self.assertEqual(get_text(), 'test 789')
+		self.assertEqual(get_text(), 'test 789')
+		stats = checker.stats()
+		self.assertEqual((stats['checks'], stats['skipped']), (1, 2))
+		self.assertTrue(stats['checks_per_second'] > 0)
+
+		# Still notified after the index is flushed
+		notebook.index.flush()
+		notebook.index.check_and_update()
+		change_file(page, 'test 000\n')
+		notebook.index.check_and_update()
+		self.assertEqual(get_text(), 'test 000')
+
+		# Changes are only remembered for pages in the cache
+		checker.notify('Bar')
+		self.assertNotIn('Bar', checker._changed)
+
+
+class TestGetPages(tests.TestCase):
+
+	def runTest(self):
+		notebook = self.setUpNotebook(
+			mock=tests.MOCK_ALWAYS_REAL,
+			content=tests.FULL_NOTEBOOK
+		)
+		paths = list(notebook.pages.walk())
+		self.assertTrue(len(paths) > 10)
+
+		records = notebook.pages.lookup_by_pagenames(paths + [Path('NonExisting')])
+		self.assertEqual(sorted(records), sorted(p.name for p in paths))
+
+		pages = []
+		for i, page in enumerate(notebook.get_pages(iter(paths), prefetch=5)):
+			pages.append(page)
+			self.assertIs(page, notebook.get_page(page))
+			self.assertEqual(page.haschildren, records[page.name].haschildren)
+			if i % 2 == 0 and page.source_file.exists():
+				self.assertIsNotNone(page._prefetched)
+				text = page.source_file.read()
+				self.assertEqual(page.get_parsetree().tostring(),
+					WikiParser().parse(text).tostring())
+				self.assertIsNone(page._prefetched)
+		self.assertEqual([p.name for p in pages], [p.name for p in paths])
+
+		# Content that was not used is dropped after the page was yielded
+		for page in pages:
+			self.assertIsNone(page._prefetched)
+
+		# Content read ahead is not used when the file changed since
+		notebook.flush_page_cache(Path('Test:foo'))
+		pageiter = notebook.get_pages([Path('Test:foo')])
+		page = next(pageiter)
+		self.assertIsNotNone(page._prefetched)
+		file = zim.newfs.LocalFile(page.source_file.path)
+		old = file.mtime()
+		while file.mtime() == old:
+			time.sleep(0.01) # new mtime
+			file.write('new content\n')
+		self.assertEqual(page.dump('wiki'), ['new content\n'])
+
+		# Also when the mtime did not change, but the size did
+		mtime = int(file.mtime()) - 10
+		os.utime(file.path, (mtime, mtime))
+		notebook.flush_page_cache(Path('Test:foo'))
+		pageiter = notebook.get_pages([Path('Test:foo')])
+		page = next(pageiter)
+		self.assertIsNotNone(page._prefetched)
+		file.write('other content\n')
+		os.utime(file.path, (mtime, mtime))
+		self.assertEqual(file.mtime(), mtime)
+		self.assertEqual(page.dump('wiki'), ['other content\n'])
+
+		# Stopping early is fine
+		for page in notebook.get_pages(notebook.pages.walk()):
+			break
+
+
+class TestStorePageStreaming(tests.TestCase):
+
+	def runTest(self):
+		notebook = self.setUpNotebook(
+			mock=tests.MOCK_ALWAYS_REAL,
+			content={'Foo': 'test 123\n'}
+		)
+		page = notebook.get_page(Path('Foo'))
+		page.get_parsetree()
+		page.parse('wiki', 'para 1\n\npara 2\n')
+		notebook.store_page(page)
+		text = page.source_file.read()
+		self.assertTrue(text.startswith('Content-Type: text/x-zim-wiki\n'))
+		self.assertTrue(text.endswith('\npara 1\n\npara 2\n'))
+
+		# Error while dumping the page does not touch the file
+		tree = WikiParser().parse('para 3\n\npara 4\n')
+		tree._etree.getroot()[-1].tag = 'unknown-tag'
+		page.set_parsetree(tree)
+		self.assertRaises(AssertionError, notebook.store_page, page)
+		self.assertEqual(page.source_file.read(), text)
+		self.assertFalse(page.source_file.parent().file('Foo.txt.zim-new~').exists())
+
+
+class TestReadOnlyCopy(tests.TestCase):
+
+	def runTest(self):
+		notebook = tests.new_files_notebook(self.create_tmp_dir())
+		page = notebook.get_page(Path('Test:foo'))
+
+		other = notebook.get_read_only_copy()
+		self.assertTrue(other.readonly)
+		self.assertIsNot(other.pages.db, notebook.pages.db)
+		self.assertIsNot(other.change_checker, notebook.change_checker)
+		self.assertEqual(
+			[p.name for p in other.pages.walk()],
+			[p.name for p in notebook.pages.walk()]
+		)
+
+		# Pages and signal handlers are not shared
+		otherpage = other.get_page(Path('Test:foo'))
+		self.assertIsNot(otherpage, page)
+		self.assertIs(other.get_page(Path('Test:foo')), otherpage)
+		self.assertIs(notebook.get_page(Path('Test:foo')), page)
+
+		calls = []
+		other.connect('page-info-changed', lambda *a: calls.append(a))
+		notebook.emit('page-info-changed', page)
+		self.assertEqual(calls, [])
+
+		# The copy does not leave handlers on the shared index
+		def count_handlers(obj):
+			return sum(len(h) for h in obj._signal_handlers.values())
+		pagesindexer = notebook.index.update_iter.pages
+		n_index = count_handlers(notebook.index)
+		n_pages = count_handlers(pagesindexer)
+		copies = [notebook.get_read_only_copy() for i in range(3)]
+		self.assertEqual(count_handlers(notebook.index), n_index)
+		self.assertEqual(count_handlers(pagesindexer), n_pages)
+
+		# Without notifications the copy checks pages on each lookup
+		notebook.save_properties(page_check=CHECK_NOTIFY)
+		self.assertEqual(notebook.change_checker.mode, CHECK_NOTIFY)
+		other = notebook.get_read_only_copy()
+		self.assertEqual(other.change_checker.mode, CHECK_ALWAYS)
+
+		# The copy can be used from another thread
+		result = []
+		def walk():
+			nb = notebook.get_read_only_copy()
+			result.extend(p.name for p in nb.pages.walk())
+		thread = threading.Thread(target=walk)
+		thread.start()
+		thread.join()
+		self.assertEqual(result, [p.name for p in notebook.pages.walk()])
+
+
 try:
 	import gio
 except ImportError:
@@ -1085,6 +1381,17 @@ class TestIndexBackgroundCheck(tests.TestCase):
 		self.assertTrue(notebook.index.is_uptodate)
 		self.assertTrue(notebook.pages.n_all_pages() > 10)
 
+		# Marker for a quick check on the next start, only when the
+		# watcher kept the index up to date
+		watching = notebook.index._watcher.running
+		notebook.index.stop_background_check()
+		self.assertEqual(notebook.index.get_property('clean_shutdown'),
+			'1' if watching else None)
+
+		notebook.index.start_background_check(notebook, full_check=True)
+		self.assertIsNone(notebook.index.get_property('clean_shutdown'))
+		while notebook.index.background_check.running:
+			tests.gtk_process_events()
 		notebook.index.stop_background_check()
 
 
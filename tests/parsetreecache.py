@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017 Jaap Karssenberg <jaap.karssenberg@gmail.com>
+
+from __future__ import with_statement
+
+
+import tests
+
+from zim.newfs import LocalFolder
+from zim.formats import get_format
+from zim.notebook import Path
+from zim.notebook.parsetreecache import ParseTreeCache, tree_to_bytes, tree_from_bytes
+
+
+class TestSerialization(tests.TestCase):
+
+	def runTest(self):
+		for name, text in tests.WikiTestData:
+			tree = get_format('wiki').Parser().parse(text)
+			copy = tree_from_bytes(tree_to_bytes(tree))
+			self.assertEqual(copy.tostring(), tree.tostring(), 'Roundtrip of: %s' % name)
+			self.assertEqual(copy.meta.items(), tree.meta.items())
+
+
+class TestParseTreeCache(tests.TestCase):
+
+	def runTest(self):
+		folder = LocalFolder(self.create_tmp_dir())
+		format = get_format('wiki')
+		cache = ParseTreeCache(folder.file('cache.db').path, folder)
+
+		file = folder.file('Foo.txt')
+		file.write('test 123\n')
+		text, etag = file.read_with_etag()
+		tree = format.Parser().parse(text)
+
+		self.assertIsNone(cache.get(file, etag, format))
+		cache.set(file, etag, format, tree)
+		self.assertEqual(cache.get(file, etag, format).tostring(), tree.tostring())
+		self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+		# Changed content is a miss
+		file.write('test 456\n')
+		text, newetag = file.read_with_etag()
+		self.assertIsNone(cache.get(file, newetag, format))
+
+		# Least recently used entries are dropped above max_size
+		cache.max_size = int(1.5 * len(tree_to_bytes(tree)))
+		cache._n_stored = 0
+		other = folder.file('Bar.txt')
+		other.write('test 123\n')
+		text, otheretag = other.read_with_etag()
+		cache.set(other, otheretag, format, tree)
+		self.assertIsNone(cache.get(file, etag, format))
+		self.assertIsNotNone(cache.get(other, otheretag, format))
+
+
+class TestPageUsesCache(tests.TestCase):
+
+	def runTest(self):
+		notebook = self.setUpNotebook(
+			mock=tests.MOCK_ALWAYS_REAL,
+			content={'Foo': 'test 123 [[Bar]]'}
+		)
+		cache = notebook._parsetree_cache
+		self.assertIsNotNone(cache)
+
+		tree = notebook.get_page(Path('Foo')).get_parsetree()
+		self.assertEqual(cache.misses, 1)
+		notebook.flush_page_cache(Path('Foo'))
+		copy = notebook.get_page(Path('Foo')).get_parsetree()
+		self.assertEqual(cache.hits, 1)
+		self.assertEqual(copy.tostring(), tree.tostring())
+
+		# Storing the page changes the etag, so no stale trees
+		page = notebook.get_page(Path('Foo'))
+		page.get_parsetree()
+		page.parse('wiki', 'test 456\n')
+		notebook.store_page(page)
+		notebook.flush_page_cache(Path('Foo'))
+		page = notebook.get_page(Path('Foo'))
+		self.assertEqual(page.dump('wiki'), ['test 456\n'])
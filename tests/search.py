@@ -2,6 +2,8 @@
 
 # Copyright 2011 Jaap Karssenberg <jaap.karssenberg@gmail.com>
 
+from __future__ import with_statement
+
 import tests
 
 from zim.search import *
@@ -200,6 +202,86 @@ class TestSearch(tests.TestCase):
 		# TODO test Name
 
 
+class TestSearchFullText(tests.TestCase):
+
+	def runTest(self):
+		'''Test search with full text index gives same results as scan'''
+		notebook = tests.new_notebook()
+		notebook.index.check_and_update()
+		if not notebook.fulltext.enabled:
+			self.skipTest('No FTS4 support in sqlite')
+
+		queries = (
+			'foo', 'Foo', 'foo bar', 'foo or bar', 'foo -bar', '-foo',
+			'content:foo', 'content:foo*', 'content:"foo bar"',
+			'content:link and Tag:tags', 'Namespace:Test content:link',
+		)
+		for string in queries:
+			query = Query(string)
+			results = SearchSelection(notebook)
+			results.search(query)
+			indexed = dict((p.name, results.scores[p]) for p in results)
+
+			notebook.fulltext.enabled = False
+			try:
+				results = SearchSelection(notebook)
+				results.search(query)
+				scanned = dict((p.name, results.scores[p]) for p in results)
+			finally:
+				notebook.fulltext.enabled = True
+
+			self.assertEqual(indexed, scanned, 'query: "%s"' % string)
+
+
+class TestSearchFullTextTokenizer(tests.TestCase):
+
+	def runTest(self):
+		'''Test search with full text index for words with "_"'''
+		import zim.notebook.index.fulltext
+
+		def search(notebook, string):
+			results = SearchSelection(notebook)
+			results.search(Query(string))
+			return dict((p.name, results.scores[p]) for p in results)
+
+		content = {
+			'A': 'foo_bar and more foo_bar\n',
+			'B': 'foo and bar\n',
+			'C': 'x_foo\n',
+		}
+		tokenizers = zim.notebook.index.fulltext._TOKENIZERS
+		for name, tokenchars in (('Default', '_'), ('Fallback', '')):
+			if not tokenchars:
+				zim.notebook.index.fulltext._TOKENIZERS = tokenizers[1:]
+			try:
+				notebook = self.setUpNotebook(name=name, content=content)
+				notebook.index.check_and_update()
+			finally:
+				zim.notebook.index.fulltext._TOKENIZERS = tokenizers
+
+			if not notebook.fulltext.enabled:
+				self.skipTest('No FTS4 support in sqlite')
+			elif tokenchars and not notebook.fulltext.tokenchars:
+				self.skipTest('No "tokenchars" support in sqlite')
+			self.assertEqual(notebook.fulltext.tokenchars, tokenchars)
+
+			fulltext_word = SearchSelection(notebook)._fulltext_word
+			self.assertEqual(fulltext_word('foo'), ('foo', False))
+			if tokenchars:
+				self.assertEqual(fulltext_word('foo_bar'), ('foo_bar', False))
+			else:
+				self.assertIsNone(fulltext_word('foo_bar'))
+
+			for string in ('foo', 'foo_bar', 'foo_*', 'foo*', 'bar', 'foo -bar'):
+				indexed = search(notebook, string)
+				notebook.fulltext.enabled = False
+				try:
+					scanned = search(notebook, string)
+				finally:
+					notebook.fulltext.enabled = True
+				self.assertEqual(indexed, scanned, 'query: "%s"' % string)
+
+
 @tests.slowTest
 class TestSearchFiles(TestSearch):
 
@@ -212,6 +294,114 @@ class TestSearchFiles(TestSearch):
 		TestSearch.runTest(self)
 
 
+@tests.slowTest
+class TestSearchParallel(tests.TestCase):
+
+	def runTest(self):
+		'''Test content scan with worker processes gives same results'''
+		path = self.create_tmp_dir()
+		self.addCleanup(self.clear_tmp_dir)
+		notebook = tests.new_files_notebook(path)
+		notebook.fulltext.enabled = False # force a page scan
+
+		def search(string, jobs, callback=None):
+			results = SearchSelection(notebook, jobs=jobs)
+			results.MIN_PAGES_PARALLEL = 1
+			results.search(Query(string), callback=callback)
+			return dict((p.name, results.scores[p]) for p in results)
+
+		for string in (
+			'foo', 'foo bar', 'foo or bar', 'foo -bar', '-foo',
+			'content:foo*', 'content:*oo', 'content:"foo bar"',
+			'content:link and Tag:tags', 'Namespace:Test content:link',
+		):
+			self.assertEqual(search(string, 2), search(string, 1), 'query: "%s"' % string)
+
+		# Callback is still called per page and can cancel
+		seen = []
+		def callback(results, path):
+			if path is not None:
+				seen.append(path)
+			return len(seen) < 3
+		search('content:*oo', 2, callback)
+		self.assertEqual(len(seen), 3)
+
+		# Pages with changes in memory are scanned in this process
+		page = notebook.get_page(Path('Test:foo'))
+		page.get_parsetree()
+		page.parse('wiki', 'some unsaved text\n')
+		self.assertEqual(search('content:unsave*', 2), {'Test:foo': 1})
+
+		# Errors in a worker do not stop other pages from being scanned
+		# in workers, the failing page is scanned in this process
+		with open(notebook.layout.map_page(Path('Test:foo:bar'))[0].path, 'wb') as fh:
+			fh.write('\xff garbage\n') # not valid utf-8
+		calls = []
+		count_page_matches = SearchSelection._count_page_matches
+		def wrapper(selection, page, terms):
+			calls.append(page.name)
+			return count_page_matches(selection, page, terms)
+		SearchSelection._count_page_matches = wrapper
+		try:
+			with tests.LoggingFilter('zim.search', 'Exception while reading'):
+				serial = search('content:*oo', 1)
+				calls[:] = []
+				self.assertEqual(search('content:*oo', 2), serial)
+			self.assertEqual(sorted(calls), ['Test:foo', 'Test:foo:bar']) # unsaved and failing page
+		finally:
+			SearchSelection._count_page_matches = count_page_matches
+
+
+@tests.slowTest
+class TestSearchWorkerPool(tests.TestCase):
+
+	def runTest(self):
+		'''Test content scan with a persistent pool of worker processes'''
+		import zim.search
+
+		path = self.create_tmp_dir()
+		self.addCleanup(self.clear_tmp_dir)
+		notebook = tests.new_files_notebook(path)
+		notebook.fulltext.enabled = False # force a page scan
+
+		self.assertEqual(get_worker_pool_jobs(), 1)
+		start_worker_pool(2)
+		self.addCleanup(stop_worker_pool)
+		self.assertEqual(get_worker_pool_jobs(), 2)
+		pool = zim.search._worker_pool
+		start_worker_pool(3) # no-op, pool already running
+		self.assertIs(zim.search._worker_pool, pool)
+
+		def search(string, jobs, callback=None):
+			results = SearchSelection(notebook, jobs=jobs)
+			results.MIN_PAGES_PARALLEL = 1
+			results.search(Query(string), callback=callback)
+			return results
+
+		serial = search('content:*oo', 1)
+		parallel = search('content:*oo', get_worker_pool_jobs())
+		self.assertEqual(parallel.scores, serial.scores)
+		self.assertTrue(len(serial.scores) > 4)
+
+		# Cancel halfway through the scan like the search dialog does
+		seen = []
+		def callback(results, path):
+			if path is not None:
+				seen.append(path)
+			return len(seen) < len(serial.scores) // 2
+		results = search('content:*oo', 2, callback)
+		self.assertTrue(results.cancelled)
+		self.assertEqual(len(seen), len(serial.scores) // 2)
+
+		# The pool is not stopped by a cancelled search
+		self.assertIs(zim.search._worker_pool, pool)
+		self.assertEqual(search('content:*oo', 2).scores, serial.scores)
+
+		stop_worker_pool()
+		self.assertEqual(get_worker_pool_jobs(), 1)
+		self.assertIsNone(zim.search._worker_pool)
+
+
 class TestUnicode(tests.TestCase):
 
 	def runTest(self):
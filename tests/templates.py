@@ -18,6 +18,7 @@ from zim.templates.expression import *
 from zim.templates.expressionparser import *
 
 from zim.templates.processor import *
+from zim.templates.compiler import compile_template
 
 from zim.parser import SimpleTreeElement, SimpleTreeBuilder, BuilderTextBuffer
 
@@ -489,9 +490,11 @@ class TestTemplateLoopState(tests.TestCase):
 
 class TestTemplateProcessor(tests.TestCase):
 
+	processorclass = TemplateProcessor
+
 	def testGetSet(self):
 		# test 'GET',  'SET'
-		processor = TemplateProcessor([
+		processor = self.processorclass([
 			E('TEMPLATE', None, [
 				E('SET', {
 					'var': ExpressionParameter('aaa.bbb'),
@@ -514,7 +517,7 @@ class TestTemplateProcessor(tests.TestCase):
 
 	def testIfElifElse(self):
 		# test 'IF', 'ELIF', 'ELSE',
-		processor = TemplateProcessor([
+		processor = self.processorclass([
 			E('TEMPLATE', None, [
 				E('IF', {'expr': ExpressionParameter('a')}, ['A']),
 				E('ELIF', {'expr': ExpressionParameter('b')}, ['B']),
@@ -535,7 +538,7 @@ class TestTemplateProcessor(tests.TestCase):
 
 	def testFor(self):
 		# test 'FOR'
-		processor = TemplateProcessor([
+		processor = self.processorclass([
 			E('TEMPLATE', None, [
 				E('FOR', {
 					'var': ExpressionParameter('iter'),
@@ -557,7 +560,7 @@ class TestTemplateProcessor(tests.TestCase):
 
 	def testInclude(self):
 		# test 'INCLUDE',
-		processor = TemplateProcessor([
+		processor = self.processorclass([
 			E('TEMPLATE', None, [
 				E('INCLUDE', {'expr': ExpressionParameter('foo')}),
 				E('INCLUDE', {'expr': ExpressionParameter('foo')}),
@@ -572,6 +575,54 @@ class TestTemplateProcessor(tests.TestCase):
 
 
 
+class CompiledTemplateProcessor(object):
+
+	def __init__(self, parts):
+		self.process = compile_template(parts)
+
+
+class TestCompileTemplate(TestTemplateProcessor):
+
+	# Run all tests for the processor with compiled templates, plus
+	# some edge cases
+
+	processorclass = CompiledTemplateProcessor
+
+	def testIfChains(self):
+		for elements, wanted in (
+			# ELSE is not ended by another ELIF clause
+			([
+				E('IF', {'expr': ExpressionParameter('a')}, ['A']),
+				E('ELSE', {}, ['B']),
+				E('ELIF', {'expr': ExpressionParameter('c')}, ['C']),
+				E('ELSE', {}, ['D']),
+			], {(True, True): 'A', (False, True): 'BC', (False, False): 'BD'}),
+			# IF starts a new chain
+			([
+				E('IF', {'expr': ExpressionParameter('a')}, ['A']),
+				E('IF', {'expr': ExpressionParameter('c')}, ['C']),
+				E('ELSE', {}, ['D']),
+			], {(True, True): 'AC', (True, False): 'AD', (False, False): 'D'}),
+		):
+			processor = self.processorclass([E('TEMPLATE', None, elements)])
+			for (a, c), text in wanted.items():
+				lines = []
+				processor.process(lines, TemplateContextDict({'a': a, 'c': c}))
+				self.assertEqual(''.join(lines), text)
+
+	def testErrorsAtRuntime(self):
+		processor = self.processorclass([
+			E('TEMPLATE', None, [
+				E('IF', {'expr': ExpressionParameter('a')}, [
+					E('INCLUDE', {'expr': ExpressionParameter('nosuchblock')}),
+				]),
+			])
+		])
+		processor.process([], TemplateContextDict({'a': False}))
+		with self.assertRaises(AssertionError):
+			processor.process([], TemplateContextDict({'a': True}))
+
+
 class TestTemplateList(tests.TestCase):
 
 	def runTest(self):
@@ -667,7 +718,7 @@ class TestTemplate(tests.TestCase):
 		#~ pprint(templ.parts) # parser output
 
 		output = []
-		templ.process(output, {
+		params = {
 			'title': 'THIS IS THE TITLE',
 			'generator': {
 				'name': 'ZIM VERSION',
@@ -698,11 +749,23 @@ class TestTemplate(tests.TestCase):
 			],
 			'uri': ExpressionFunction(lambda l: "URL:%s" % l['name']),
 			'anchor': ExpressionFunction(lambda l: "ANCHOR:%s" % l['name']),
-		})
+		}
+		templ.process(output, params)
 		#~ print ''.join(output)
 
 		# TODO assert something
 
+		### Compiled template gives same result as the processor
+		self.assertNotEqual(output, [])
+		context = TemplateContextDict(dict(params))
+		context.update(Template.template_functions)
+		wanted = []
+		TemplateProcessor(templ.parts).process(wanted, context)
+		self.assertEqual(output, wanted)
+
+		### Template is not parsed again when the file did not change
+		self.assertIs(Template(file)._compiled, templ._compiled)
+
 		### Test empty template OK as well
 		dir = Dir(self.create_tmp_dir())
 		file = dir.file('empty.html')
@@ -714,3 +777,9 @@ class TestTemplate(tests.TestCase):
 		output = []
 		templ.process(output, {})
 		self.assertEqual(output, [])
+
+		file.write('[% title %]\n')
+		templ = Template(file)
+		output = []
+		templ.process(output, {'title': 'Test'})
+		self.assertEqual(output, ['Test', '\n'])
@@ -73,6 +73,35 @@ class TestOrderedDict(tests.TestCase):
 		self.assertEqual(mydict.keys(), [i[0] for i in items])
 
 
+class TestLRUCache(tests.TestCase):
+
+	def runTest(self):
+		cache = LRUCache(3)
+		for k in ('a', 'b', 'c'):
+			cache[k] = k.upper()
+		self.assertEqual(len(cache), 3)
+
+		self.assertEqual(cache['a'], 'A') # "b" now least recently used
+		cache['d'] = 'D'
+		self.assertFalse('b' in cache)
+		self.assertEqual(len(cache), 3)
+		self.assertEqual(cache.get('b'), None)
+
+		cache['c'] = 'X' # update moves "c" to the end
+		cache['e'] = 'E'
+		self.assertFalse('a' in cache)
+		self.assertEqual(cache['c'], 'X')
+		self.assertEqual(cache.keys(), ['d', 'e', 'c'])
+
+		self.assertEqual(cache.pop('c'), 'X')
+		self.assertEqual(cache.pop('c'), None)
+		self.assertEqual(len(cache), 2)
+
+		cache.clear()
+		self.assertEqual(len(cache), 0)
+		self.assertRaises(KeyError, cache.__getitem__, 'd')
+
+
 class TestMovingWindowIterBuffer(tests.TestCase):
 
 	def runTest(self):
@@ -7,6 +7,7 @@ from __future__ import with_statement
 import tests
 
 import sys
+import threading
 import os
 from cStringIO import StringIO
 import logging
@@ -67,7 +68,7 @@ class TestWWWInterface(tests.TestCase):
 		interface = WWWInterface(notebook, config=config, template=self.template)
 		validator = wsgiref.validate.validator(interface)
 
-		def call(command, path):
+		def call(command, path, **headers):
 			environ = {
 				'REQUEST_METHOD': command,
 				'SCRIPT_NAME': '',
@@ -77,6 +78,7 @@ class TestWWWInterface(tests.TestCase):
 				'SERVER_PORT': '80',
 				'SERVER_PROTOCOL': '1.0'
 			}
+			environ.update(headers)
 			rfile = StringIO('')
 			wfile = StringIO()
 			handler = wsgiref.handlers.SimpleHandler(rfile, wfile, sys.stderr, environ)
@@ -134,6 +136,34 @@ class TestWWWInterface(tests.TestCase):
 			header, body = self.assertResponseWellFormed(response)
 			self.assertEqual(header[0], 'HTTP/1.0 200 OK')
 
+		# conditional requests
+		for path in ['/Test/foo.html', '/'] + self.file_found_paths:
+			response = call('GET', path)
+			header, body = self.assertResponseWellFormed(response)
+			headers = dict(l.split(': ', 1) for l in header[1:])
+			self.assertIn('Content-Length', headers)
+			self.assertEqual(int(headers['Content-Length']), len(response.split('\r\n\r\n', 1)[1]))
+
+			response = call('GET', path, HTTP_IF_NONE_MATCH=headers['ETag'])
+			self.assertTrue(response.startswith('HTTP/1.0 304 Not Modified'))
+			self.assertNotIn('Content-Type', response)
+
+			response = call('GET', path, HTTP_IF_MODIFIED_SINCE=headers['Last-Modified'])
+			self.assertTrue(response.startswith('HTTP/1.0 304 Not Modified'))
+
+			response = call('GET', path, HTTP_IF_NONE_MATCH='"foo"')
+			self.assertTrue(response.startswith('HTTP/1.0 200 OK'))
+
+		# index change invalidates pages
+		response = call('GET', '/Test/foo.html')
+		header, body = self.assertResponseWellFormed(response)
+		etag = dict(l.split(': ', 1) for l in header[1:])['ETag']
+		self.assertTrue(len(interface._render_cache) > 0)
+		notebook.index.emit('changed')
+		self.assertEqual(len(interface._render_cache), 0)
+		response = call('GET', '/Test/foo.html', HTTP_IF_NONE_MATCH=etag)
+		self.assertTrue(response.startswith('HTTP/1.0 200 OK'))
+
 
 #~ class TestWWWInterfaceTemplate(TestWWWInterface):
 #~
@@ -169,3 +199,52 @@ class TestWWWInterfaceTemplateResources(TestWWWInterface):
 	def runTest(self):
 		'Test WWW interface with a template with resources.'
 		TestWWWInterface.runTest(self)
+
+
+@tests.slowTest
+class TestThreadPoolServer(tests.TestCase):
+
+	def runTest(self):
+		'Test WWW server with a pool of threads'
+		from urllib import urlopen
+		from zim.www import make_server, ThreadPoolWSGIServer
+
+		notebook = tests.new_files_notebook(self.create_tmp_dir())
+		httpd = make_server(notebook, port=0, public=False, threads=3)
+		self.assertIsInstance(httpd, ThreadPoolWSGIServer)
+		t = threading.Thread(target=httpd.serve_forever)
+		t.start()
+
+		results = []
+		def fetch(path):
+			re = urlopen('http://localhost:%i%s' % (httpd.server_port, path))
+			results.append((path, re.getcode(), re.read()))
+
+		paths = ['/', '/Test/foo.html', '/Test/', '/favicon.ico'] * 3
+		try:
+			clients = [threading.Thread(target=fetch, args=(p,)) for p in paths]
+			for c in clients:
+				c.start()
+			for c in clients:
+				c.join()
+		finally:
+			httpd.shutdown()
+			httpd.server_close()
+			t.join()
+
+		self.assertEqual(len(results), len(paths))
+		for path, code, body in results:
+			self.assertEqual(code, 200, path)
+		foo = [b for p, c, b in results if p == '/Test/foo.html']
+		self.assertIn('<h1>', foo[0])
+		self.assertEqual(len(set(foo)), 1)
+
+		# Other threads use their own index connection
+		interface = httpd.get_app()
+		self.assertIs(interface.notebook, notebook)
+		copies = []
+		t = threading.Thread(target=lambda: copies.append(interface.notebook))
+		t.start()
+		t.join()
+		self.assertIsNot(copies[0], notebook)
+		self.assertIsNot(copies[0].pages.db, notebook.pages.db)
@@ -0,0 +1,92 @@
+#!/usr/bin/python
+
+# -*- coding: utf-8 -*-
+
+# Copyright 2017 Jaap Karssenberg <jaap.karssenberg@gmail.com>
+
+'''Tool to time the export of a notebook to HTML with the "Default"
+template. The export is done twice: once with the template executed
+by the L{TemplateProcessor} that interprets the parse tree of the
+template and once with the compiled template. For both the number of
+pages per second is shown for the whole export and for processing
+the template alone.
+
+By default a synthetic notebook is generated in a temporary folder.
+
+Usage: tools/time_export.py [N_PAGES | NOTEBOOK_FOLDER]
+'''
+
+import sys
+sys.path.insert(0, '.')
+
+import os
+import time
+import shutil
+import tempfile
+
+from zim.fs import Dir
+from zim.notebook import Notebook
+from zim.export import build_notebook_exporter
+from zim.export.selections import AllPages
+from zim.templates.processor import TemplateProcessor
+
+sys.path.insert(0, os.path.dirname(__file__))
+from time_index_queries import generate_notebook
+
+
+N_PAGES = 1000
+
+
+def time_export(notebook, interpreted):
+	outdir = tempfile.mkdtemp()
+	try:
+		exporter = build_notebook_exporter(Dir(outdir), 'html', 'Default')
+		template = exporter.template
+		if interpreted:
+			# Same as Template.do_process() before templates were compiled
+			process = TemplateProcessor(template.parts).process
+		else:
+			process = template._compiled
+
+		timings = []
+		def timed_process(output, context):
+			start = time.time()
+			process(output, context)
+			timings.append(time.time() - start)
+		template._compiled = timed_process
+
+		start = time.time()
+		exporter.export(AllPages(notebook))
+		total = time.time() - start
+	finally:
+		shutil.rmtree(outdir)
+
+	return len(timings), total, sum(timings)
+
+
+if __name__ == '__main__':
+	arg = sys.argv[1] if len(sys.argv) > 1 else str(N_PAGES)
+	tmpdir = None
+	if arg.isdigit():
+		from zim.newfs import LocalFolder
+		tmpdir = tempfile.mkdtemp()
+		print 'Generating notebook with %s pages' % arg
+		generate_notebook(LocalFolder(tmpdir), int(arg))
+		arg = tmpdir
+
+	try:
+		notebook = Notebook.new_from_dir(Dir(arg))
+		notebook.index.check_and_update()
+
+		print 'Method\t\tPages\tExport\tTemplate [pages/sec]'
+		for name, interpreted in (
+			('interpreted', True),
+			('compiled', False),
+		):
+			n, total, template = time_export(notebook, interpreted)
+			print '%s\t%i\t%.1f\t%.1f' % (
+				name.ljust(12), n, n / total, n / template
+			)
+	finally:
+		if tmpdir:
+			shutil.rmtree(tmpdir)
@@ -0,0 +1,166 @@
+#!/usr/bin/python
+
+# -*- coding: utf-8 -*-
+
+# Copyright 2017 Jaap Karssenberg <jaap.karssenberg@gmail.com>
+
+'''Tool to time the queries of the index views on a large synthetic
+notebook. Each query is timed twice: once with the secondary indexes
+that are created by the indexers and once after dropping them, to see
+the effect of these indexes.
+
+Usage: tools/time_index_queries.py [N_PAGES]
+'''
+
+import sys
+sys.path.insert(0, '.')
+
+import os
+import time
+import random
+import shutil
+import sqlite3
+import tempfile
+
+from zim.newfs import LocalFolder
+from zim.notebook import Path, HRef
+from zim.notebook.layout import FilesLayout
+from zim.notebook.index import IndexUpdateIter, PagesView, LinksView, TagsView, \
+	LINK_DIR_FORWARD, LINK_DIR_BACKWARD, LINK_DIR_BOTH
+from zim.notebook.index.files import STATUS_NEED_UPDATE
+
+
+N_PAGES = 50000
+N_TAGS = 200
+N_LINKS = 5 # per page
+WIDTH = 20 # pages per namespace
+REPS = 100 # calls per query
+
+
+def generate_notebook(folder, n_pages, seed=0):
+	'''Write a notebook with C{n_pages} pages in a tree of namespaces
+	with C{WIDTH} pages per namespace. Each page links to C{N_LINKS}
+	other pages and has two tags.
+	@returns: a list with all page names
+	'''
+	rand = random.Random(seed)
+	names = []
+	for i in range(n_pages):
+		if i < WIDTH:
+			names.append('Page%i' % i)
+		else:
+			names.append(names[i // WIDTH - 1] + ':Page%i' % i)
+
+	for name in names:
+		lines = [
+			'Content-Type: text/x-zim-wiki',
+			'Wiki-Format: zim 0.4',
+			'',
+			'====== %s ======' % name.split(':')[-1],
+			'@tag%i @tag%i' % (rand.randrange(N_TAGS), rand.randrange(N_TAGS)),
+			'',
+		]
+		for j in range(N_LINKS):
+			if j % 2:
+				lines.append('[[:%s]]' % rand.choice(names))
+			else:
+				lines.append('[[%s]]' % rand.choice(names).split(':')[-1])
+		lines.append('Lorem ipsum dolor sit amet, consectetur adipiscing elit.')
+
+		file = folder.file(name.replace(':', '/') + '.txt')
+		file.write('\n'.join(lines) + '\n')
+
+	return names
+
+
+def build_index(folder):
+	db = sqlite3.connect(':memory:')
+	db.row_factory = sqlite3.Row
+	update_iter = IndexUpdateIter(db, FilesLayout(folder))
+	for i in update_iter:
+		pass
+	return db
+
+
+def list_queries(db, names, seed=0):
+	'''Returns a list of 2-tuples of a label and a function to time'''
+	rand = random.Random(seed)
+	paths = [Path(rand.choice(names)) for i in range(REPS)]
+	tags = ['tag%i' % rand.randrange(N_TAGS) for i in range(REPS)]
+
+	pages = PagesView(db)
+	links = LinksView(db)
+	tagsview = TagsView(db)
+
+	def each(func, args):
+		def wrapper():
+			for a in args:
+				func(a)
+		return wrapper
+
+	return [
+		('PagesView.list_pages', each(lambda p: list(pages.list_pages(p)), paths)),
+		('PagesView.n_list_pages', each(pages.n_list_pages, paths)),
+		('PagesView.get_next', each(pages.get_next, paths)),
+		('PagesView.resolve_link', each(
+			lambda p: pages.resolve_link(p, HRef.new_from_wiki_link(p.basename)), paths)),
+		('LinksView.list_links (backward)', each(
+			lambda p: list(links.list_links(p, LINK_DIR_BACKWARD)), paths)),
+		('LinksView.n_list_links (both)', each(
+			lambda p: links.n_list_links(p, LINK_DIR_BOTH), paths)),
+		('TagsView.list_pages', each(lambda t: list(tagsview.list_pages(t)), tags)),
+		('TagsView.list_tags', each(lambda p: list(tagsview.list_tags(p)), paths)),
+		('files WHERE index_status', each(
+			lambda p: db.execute(
+				'SELECT id FROM files WHERE index_status = ? ORDER BY node_type, id',
+				(STATUS_NEED_UPDATE,)
+			).fetchall(),
+			paths
+		)),
+	]
+
+
+def drop_secondary_indexes(db):
+	for name, in db.execute(
+		'SELECT name FROM sqlite_master '
+		'WHERE type="index" and sql IS NOT NULL'
+	).fetchall():
+		if name != 'pages_name': # unique constraint, not an optimization
+			db.execute('DROP INDEX %s' % name)
+	db.commit()
+
+
+def time_queries(queries):
+	result = []
+	for label, func in queries:
+		start = time.time()
+		func()
+		result.append(1E+3 * (time.time() - start) / REPS)
+	return result
+
+
+if __name__ == '__main__':
+	n_pages = int(sys.argv[1]) if len(sys.argv) > 1 else N_PAGES
+
+	tmpdir = tempfile.mkdtemp()
+	try:
+		folder = LocalFolder(tmpdir)
+		print 'Generating notebook with %i pages in %s' % (n_pages, tmpdir)
+		names = generate_notebook(folder, n_pages)
+
+		print 'Building index'
+		start = time.time()
+		db = build_index(folder)
+		print 'Index build took %.1fs' % (time.time() - start)
+	finally:
+		shutil.rmtree(tmpdir)
+
+	queries = list_queries(db, names)
+	with_indexes = time_queries(queries)
+	drop_secondary_indexes(db)
+	without_indexes = time_queries(queries)
+
+	print ''
+	print 'Query\tWith indexes\tWithout indexes [msec/call]'
+	for (label, func), a, b in zip(queries, with_indexes, without_indexes):
+		print '%s\t%.3f\t%.3f' % (label, a, b)
@@ -0,0 +1,76 @@
+#!/usr/bin/python
+
+# -*- coding: utf-8 -*-
+
+# Copyright 2017 Jaap Karssenberg <jaap.karssenberg@gmail.com>
+
+'''Compare ParseTree.copy() with a copy by round trip through XML on a
+large page. By default the test page is made by repeating the wiki test
+data up to 1 MB.
+
+Usage: tools/time_parsetree_copy.py [SIZE_IN_KB]
+'''
+
+import sys
+sys.path.insert(0, '.')
+
+import zim.formats
+import zim.fs
+
+from zim.formats import ParseTree
+
+
+def setup(size):
+	global parsetree
+	text = zim.fs.File('tests/data/formats/wiki.txt').read()
+	text = text * (size // len(text) + 1)
+	parser = zim.formats.get_parser('wiki')
+	parsetree = parser.parse(text)
+
+
+def timeCopyXML():
+	# Previous implementation of ParseTree.copy()
+	ParseTree().fromstring(parsetree.tostring())
+
+
+def timeCopy():
+	parsetree.copy()
+
+
+def timeIterHref():
+	list(parsetree.iter_href())
+
+
+def timeFindall():
+	list(parsetree.findall(zim.formats.LINK))
+
+
+if __name__ == '__main__':
+	from timeit import Timer
+	size = int(sys.argv[1]) * 1024 if len(sys.argv) > 1 else 1024 * 1024
+	reps = 5
+	passes = 5
+	funcs = sorted([n for n in dir() if n.startswith('time')])
+
+	print "Page size: %i kB, Rep: %i, Passes: %i" % (size // 1024, reps, passes)
+	print "Plan: %s" % ', '.join(funcs)
+	print ''
+	print "Func\tMin\tMax\tAvg [msec/pass]"
+
+	for func in funcs:
+		setupcode = "from __main__ import setup, %s; setup(%i)" % (func, size)
+		testcode = "%s()" % func
+
+		t = Timer(testcode, setupcode)
+		try:
+			result = t.repeat(reps, passes)
+		except:
+			print "FAILED running %s" % func
+			t.print_exc()
+		else:
+			print "%s\t%.2f\t%.2f\t%.2f" % (
+				func,
+				(1E+3 * min(result) / passes),
+				(1E+3 * max(result) / passes),
+				(1E+3 * sum(result) / (reps * passes)),
+			)
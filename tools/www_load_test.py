@@ -0,0 +1,196 @@
+#!/usr/bin/python
+
+# -*- coding: utf-8 -*-
+
+# Copyright 2017 Jaap Karssenberg <jaap.karssenberg@gmail.com>
+
+'''Load test for the web server, e.g. to compare "zim --server" with
+different values for "--threads".
+
+The tool first crawls the server starting from the index to find pages
+and attachments. Then a number of concurrent clients fetch random pages
+and attachments. The number of requests per second and the latency
+percentiles are reported per type of request.
+
+Usage: tools/www_load_test.py [OPTIONS] URL
+
+Options:
+  -c, --clients N      number of concurrent clients (default: 10)
+  -n, --requests N     total number of requests (default: 1000)
+  -a, --attachments F  fraction of requests for attachments (default: 0.2)
+  --max-pages N        maximum number of pages to crawl (default: 200)
+'''
+
+from __future__ import with_statement
+
+import sys
+import re
+import time
+import random
+import getopt
+import urllib2
+import urlparse
+import threading
+import Queue
+
+
+href_re = re.compile(r'''href=["']([^"'#?]+)["']''')
+
+
+def is_attachment(url):
+	path = urlparse.urlparse(url).path
+	return path.startswith('/%2Bfile/') or path.startswith('/+file/')
+
+
+def is_page(url):
+	path = urlparse.urlparse(url).path
+	return not '/+' in path and not '/%2B' in path \
+		and (path.endswith('.html') or path.endswith('/'))
+
+
+def crawl(base, max_pages):
+	'''Find pages and attachments by following links from C{base}
+	@returns: a 2-tuple of a list of page urls and a list of attachment
+	urls
+	'''
+	host = urlparse.urlparse(base).netloc
+	pages = [base]
+	attachments = set()
+	seen = set(pages)
+	i = 0
+	while i < len(pages) and len(pages) < max_pages:
+		html = urllib2.urlopen(pages[i]).read()
+		i += 1
+		for href in href_re.findall(html):
+			url = urlparse.urljoin(base, href)
+			if url in seen or urlparse.urlparse(url).netloc != host:
+				continue
+			seen.add(url)
+			if is_attachment(url):
+				attachments.add(url)
+			elif is_page(url) and len(pages) < max_pages:
+				pages.append(url)
+	return pages, sorted(attachments)
+
+
+def percentile(values, p):
+	'''Returns percentile C{p} of a sorted list of values'''
+	if not values:
+		return 0
+	i = min(len(values) - 1, int(round(p / 100.0 * len(values) + 0.5)) - 1)
+	return values[max(i, 0)]
+
+
+def run_clients(jobs, n_clients):
+	'''Fetch all urls in C{jobs} with C{n_clients} threads
+	@param jobs: list of 2-tuples of a label and an url
+	@returns: a 2-tuple of the total time and a list of 3-tuples of a
+	label, latency in seconds and an error or C{None}
+	'''
+	queue = Queue.Queue()
+	for job in jobs:
+		queue.put(job)
+
+	results = []
+	lock = threading.Lock()
+
+	def client():
+		while True:
+			try:
+				label, url = queue.get_nowait()
+			except Queue.Empty:
+				break
+
+			start = time.time()
+			error = None
+			try:
+				fh = urllib2.urlopen(url)
+				while fh.read(64 * 1024):
+					pass
+				fh.close()
+			except Exception as err:
+				error = str(err)
+			latency = time.time() - start
+
+			with lock:
+				results.append((label, latency, error))
+
+	threads = [threading.Thread(target=client) for i in range(n_clients)]
+	start = time.time()
+	for t in threads:
+		t.start()
+	for t in threads:
+		t.join()
+	return time.time() - start, results
+
+
+def report(elapsed, results):
+	print 'Type\tRequests\tErrors\tReq/s\tMean\tp50\tp90\tp99\tMax [msec]'
+	for label in ('page', 'attachment', 'total'):
+		latencies = sorted(
+			1E+3 * l for t, l, e in results
+				if (t == label or label == 'total') and not e
+		)
+		n_errors = len([e for t, l, e in results
+			if (t == label or label == 'total') and e])
+		n = len(latencies) + n_errors
+		if not n:
+			continue
+		mean = sum(latencies) / len(latencies) if latencies else 0
+		print '%s\t%i\t%i\t%.1f\t%.1f\t%.1f\t%.1f\t%.1f\t%.1f' % (
+			label, n, n_errors, n / elapsed, mean,
+			percentile(latencies, 50), percentile(latencies, 90),
+			percentile(latencies, 99), latencies[-1] if latencies else 0
+		)
+
+	errors = set(e for t, l, e in results if e)
+	for error in sorted(errors)[:10]:
+		print >>sys.stderr, 'Error:', error
+
+
+def main(argv):
+	n_clients = 10
+	n_requests = 1000
+	f_attachments = 0.2
+	max_pages = 200
+	opts, args = getopt.gnu_getopt(argv[1:], 'hc:n:a:',
+		['help', 'clients=', 'requests=', 'attachments=', 'max-pages='])
+	for o, a in opts:
+		if o in ('-h', '--help'):
+			print __doc__
+			return
+		elif o in ('-c', '--clients'):
+			n_clients = int(a)
+		elif o in ('-n', '--requests'):
+			n_requests = int(a)
+		elif o in ('-a', '--attachments'):
+			f_attachments = float(a)
+		elif o == '--max-pages':
+			max_pages = int(a)
+
+	if len(args) != 1:
+		print >>sys.stderr, __doc__
+		sys.exit(1)
+
+	base = args[0]
+	if not base.endswith('/'):
+		base += '/'
+
+	pages, attachments = crawl(base, max_pages)
+	print 'Found %i pages and %i attachments' % (len(pages), len(attachments))
+
+	rand = random.Random(0)
+	jobs = []
+	for i in range(n_requests):
+		if attachments and rand.random() < f_attachments:
+			jobs.append(('attachment', rand.choice(attachments)))
+		else:
+			jobs.append(('page', rand.choice(pages)))
+
+	print 'Running %i requests with %i clients' % (n_requests, n_clients)
+	elapsed, results = run_clients(jobs, n_clients)
+	report(elapsed, results)
+
+
+if __name__ == '__main__':
+	main(sys.argv)
@@ -2,23 +2,32 @@
 
 # Copyright 2008-2014 Jaap Karssenberg <jaap.karssenberg@gmail.com>
 
+import os
+import copy
+import hashlib
+
 from functools import partial
 
 import logging
 
 logger = logging.getLogger('zim.export')
 
+from zim import __version__ as ZIM_VERSION
 from zim.utils import MovingWindowIter
 
-from zim.config import data_file
-from zim.notebook import Path
+from zim.config import data_file, json
+from zim.notebook import Path, LINK_DIR_FORWARD, LINK_DIR_BACKWARD
+from zim.notebook.index import IndexNotFoundError
 from zim.formats import get_format
 
 from zim.export.exporters import Exporter, createIndexPage
 from zim.export.linker import ExportLinker
-from zim.export.template import ExportTemplateContext
+from zim.export.template import ExportTemplateContext, IndexSnapshot
+
+from zim.templates.expression import ExpressionParameter, ExpressionList, \
+	ExpressionOperator, ExpressionUnaryOperator, ExpressionFunctionCall
 
-from zim.fs import Dir
+from zim.fs import Dir, PathLookupError
 from zim.newfs import FileNotFoundError, LocalFolder
 
 
@@ -38,9 +47,13 @@ class FilesExporterBase(Exporter):
 		self.format = get_format(format) # XXX
 		self.document_root_url = document_root_url
 
-	def export_attachments_iter(self, notebook, page):
+	def export_attachments_iter(self, notebook, page, iopool=None, skip=None):
 		# XXX FIXME remove need for notebook here
 		# XXX what to do with folders that do not map to a page ?
+		# If "iopool" is given, files are copied asynchronously, the
+		# "AsyncResult" objects are yielded after the file
+		# Files with a basename in "skip" are not copied when the
+		# target exists already
 		source = notebook.get_attachments_dir(page)
 		target = self.layout.attachments_dir(page)
 		assert isinstance(target, Dir)
@@ -49,9 +62,12 @@ class FilesExporterBase(Exporter):
 			for file in source.list_files():
 					yield file
 					targetfile = target.file(file.basename)
-					if targetfile.exists():
-						targetfile.remove() # Export does overwrite by default
-					file.copyto(targetfile)
+					if skip and file.basename in skip and targetfile.exists():
+						continue
+					elif iopool:
+						yield iopool.apply_async(_copy_file, (file, targetfile))
+					else:
+						_copy_file(file, targetfile)
 		except FileNotFoundError:
 			pass
 
@@ -73,18 +89,93 @@ class FilesExporterBase(Exporter):
 			self.template.resources_dir.copyto(dir)
 
 
-class MultiFileExporter(FilesExporterBase):
-	'''Exporter that exports each page to a single file'''
+def _copy_file(file, targetfile):
+	if targetfile.exists():
+		targetfile.remove() # Export does overwrite by default
+	file.copyto(targetfile)
+
+
+# State for the worker processes of a parallel export. It is set in the
+# parent process before the workers are forked, see
+# MultiFileExporter._export_iter_parallel()
+_worker_state = None
+
+
+def _init_export_worker():
+	# The sqlite connection of the parent can not be used after fork,
+	# so the index snapshot of the parent can not be used either
+	global _worker_state
+	exporter, pages = _worker_state
+	pages = copy.copy(pages)
+	pages.notebook = pages.notebook.get_read_only_copy()
+	exporter._index_snapshot = IndexSnapshot(pages.index)
+	_worker_state = (exporter, pages)
 
-	def __init__(self, layout, template, format, index_page=None, document_root_url=None):
+
+def _export_pages_worker(batch):
+	# Batch is a list of 3-tuples of page names for the page, the
+	# previous page and the next page. Errors are logged per page, so
+	# one page that fails does not stop the export of the others.
+	exporter, pages = _worker_state
+	notebook = pages.notebook
+	for name, prevname, nextname in batch:
+		try:
+			exporter.export_page(notebook,
+				notebook.get_page(Path(name)), pages,
+				prevpage=notebook.get_page(Path(prevname)) if prevname else None,
+				nextpage=notebook.get_page(Path(nextname)) if nextname else None,
+			)
+		except:
+			logger.exception('Error while exporting: %s', name)
+
+
+class MultiFileExporter(FilesExporterBase):
+	'''Exporter that exports each page to a single file
+
+	When C{jobs} is larger than 1, pages are rendered by a pool of
+	worker processes and attachments are copied by a pool of
+	C{N_IO_THREADS} threads. The output is the same as for a serial
+	export. This requires C{os.fork()} and a notebook with an index on
+	disk, else the export falls back to serial mode. In parallel mode
+	an error while rendering a page is logged and the export continues
+	with the other pages.
+
+	When C{incremental} is C{True}, a manifest is kept in the output
+	folder that records for each page a signature of all inputs that
+	affect the rendering: the source file, the template and export
+	options, the previous and next page, links, backlinks and
+	attachments, and the notebook structure if the template uses the
+	C{index()} function. Pages for which the signature did not change
+	since the last export are not rendered again and attachments are
+	only copied when their modification time or size changed. Output
+	for pages that no longer exist is removed. Template resources are
+	copied again when any of the resource files changed.
+
+	When only part of the notebook is exported, e.g. a single page or a
+	page with sub-pages, the manifest keeps the records of the pages
+	outside the selection and no output is removed.
+	'''
+
+	N_IO_THREADS = 4 #: number of threads for copying attachments
+	BATCH_SIZE = 20 #: number of pages per task for the worker processes
+	MANIFEST_FILE = '.zim-export-manifest.json' #: basename of the manifest for incremental export
+
+	def __init__(self, layout, template, format, index_page=None, document_root_url=None, jobs=1, incremental=False):
 		'''Constructor
 		@param layout: a L{ExportLayout} to map pages to files
 		@param template: a L{Template} object
 		@param format: the format for the file content
 		@param index_page: a page to output the index or C{None}
 		@param document_root_url: optional URL for the document root
+		@param jobs: number of worker processes for rendering pages
+		@param incremental: if C{True} only export pages that changed
+		since the previous export to the same location
 		'''
 		FilesExporterBase.__init__(self, layout, template, format, document_root_url)
+		self.jobs = jobs or 1
+		self.incremental = incremental
+		self._manifest = None
+		self._index_snapshot = None
 		if index_page:
 			if isinstance(index_page, basestring):
 				self.index_page = Path(Path.makeValidPageName(index_page))
@@ -95,27 +186,208 @@ class MultiFileExporter(FilesExporterBase):
 		# TODO make index_page generic special page in output selection
 
 	def export_iter(self, pages):
-		self.export_resources()
+		# One snapshot of the index is shared by all pages, so the
+		# notebook index is not walked again for each page
+		self._index_snapshot = IndexSnapshot(pages.index)
+
+		if self.incremental:
+			self._manifest = ExportManifest(
+				self.layout.relative_root.file(self.MANIFEST_FILE),
+				self._get_base_signature(pages),
+				self._get_resources_signature()
+			)
+			if self._manifest.base_changed \
+			or self._manifest.resources_changed \
+			or not self.layout.resources_dir().exists():
+				self.export_resources()
+		else:
+			self._manifest = None
+			self.export_resources()
+
+		if self.jobs > 1 and self._can_export_parallel(pages):
+			export_pages_iter = self._export_iter_parallel(pages)
+		else:
+			export_pages_iter = self._export_iter_serial(pages)
+
+		for item in export_pages_iter:
+			yield item
+
+		if self.index_page:
+			try:
+				logger.info('Export index: %s', self.index_page)
+				yield self.index_page
+				if self._manifest is None \
+				or self._manifest.check_page(self.layout,
+					pages.prefix + self.index_page if pages.prefix else self.index_page,
+					self._structure_signature, {}
+				):
+					self.export_index(self.index_page, pages)
+			except:
+				logger.exception('Error while exporting index')
+
+		if self._manifest is not None:
+			if pages.prefix is None:
+				self._manifest.remove_stale_files(self.layout)
+			else:
+				# Partial export, other pages are not stale
+				self._manifest.keep_previous_pages()
+			self._manifest.write()
+			self._manifest = None
+
+		self._index_snapshot = None
+
+	def _get_base_signature(self, pages):
+		# Signature for inputs that affect all pages: template and
+		# export options. Also sets the signature for the structure of
+		# the notebook, used for the index.
+		template = open(self.template.filename, 'rb').read()
+		self._template_uses_index = False
+		self._template_uses_attachments = False
+		for expr in _iter_template_expressions(self.template.parts):
+			if isinstance(expr, ExpressionFunctionCall) \
+			and expr.param.name in ('index', 'pageindex'):
+				self._template_uses_index = True
+			elif isinstance(expr, ExpressionParameter) \
+			and 'attachments' in expr.parts:
+				self._template_uses_attachments = True
+
+		md5 = hashlib.md5()
+		for path in pages.index():
+			md5.update(path.name.encode('utf-8') + '\n')
+		self._structure_signature = md5.hexdigest()
+
+		home = pages.notebook.get_home_page()
+		return _signature(
+			ZIM_VERSION,
+			self.format.info['name'],
+			hashlib.md5(template).hexdigest(),
+			self.document_root_url,
+			self.index_page.name if self.index_page else None,
+			home.name if home else None,
+			pages.notebook.name,
+		)
+
+	def _get_resources_signature(self):
+		# Signature for the files in the template resources folder
+		rdir = self.template.resources_dir
+		if not (rdir and rdir.exists()):
+			return None
+
+		files = []
+		for root, dirs, names in os.walk(rdir.path):
+			for name in names:
+				path = os.path.join(root, name)
+				stat = os.stat(path)
+				files.append((path[len(rdir.path):], stat.st_mtime, stat.st_size))
+		return _signature(sorted(files))
+
+	def _get_page_signature(self, notebook, page, prevpage, nextpage, attachments):
+		file = getattr(page, 'source_file', None)
+		if file is not None and file.exists():
+			source = (file.mtime(), file.size())
+		else:
+			source = None
+
+		try:
+			links = sorted(link.target.name
+				for link in notebook.links.list_links(page, LINK_DIR_FORWARD))
+			backlinks = sorted(link.source.name
+				for link in notebook.links.list_links(page, LINK_DIR_BACKWARD))
+		except IndexNotFoundError:
+			links, backlinks = None, None
+
+		return _signature(
+			source,
+			prevpage.name if prevpage else None,
+			nextpage.name if nextpage else None,
+			links,
+			backlinks,
+			attachments if self._template_uses_attachments else None,
+			self._structure_signature if self._template_uses_index else None,
+		)
 
+	def _check_page(self, notebook, page, prevpage, nextpage):
+		# Returns a 2-tuple of a boolean whether the page needs to be
+		# rendered and a set of basenames of attachments that do not
+		# need to be copied
+		if self._manifest is None:
+			return True, None
+
+		attachments = _list_attachments(notebook, page)
+		signature = self._get_page_signature(notebook, page, prevpage, nextpage, attachments)
+		changed = self._manifest.check_page(self.layout, page, signature, attachments)
+		return changed, self._manifest.unchanged_attachments(page)
+
+	def _can_export_parallel(self, pages):
+		if not hasattr(os, 'fork'):
+			logger.info('Parallel export not supported on this platform')
+			return False
+		elif pages.notebook.index.dbpath == ':memory:':
+			logger.info('Parallel export not supported for index in memory')
+			return False
+		else:
+			return True
+
+	def _export_iter_serial(self, pages):
 		for prev, page, next in MovingWindowIter(pages):
 			yield page
 			try:
-				self.export_page(pages.notebook, page, pages, prevpage=prev, nextpage=next)
+				changed, skip = self._check_page(pages.notebook, page, prev, next)
+				if changed:
+					self.export_page(pages.notebook, page, pages, prevpage=prev, nextpage=next)
 					# XXX FIXME remove need for notebook here
-				for file in self.export_attachments_iter(pages.notebook, page):
+				for file in self.export_attachments_iter(pages.notebook, page, skip=skip):
 					yield file
 					# XXX FIXME remove need for notebook here
 			except:
 				raise
 				logger.exception('Error while exporting: %s', page.name)
 
-		if self.index_page:
-			try:
-				logger.info('Export index: %s', self.index_page)
-				yield self.index_page
-				self.export_index(self.index_page, pages)
-			except:
-				logger.exception('Error while exporting index')
+	def _export_iter_parallel(self, pages):
+		import multiprocessing
+		from multiprocessing.pool import ThreadPool, AsyncResult
+		global _worker_state
+
+		_worker_state = (self, pages)
+		try:
+			pool = multiprocessing.Pool(self.jobs, _init_export_worker)
+		finally:
+			_worker_state = None
+		iopool = ThreadPool(self.N_IO_THREADS)
+			# Create threads after forking the worker processes
+
+		results = []
+		batch = []
+		try:
+			for prev, page, next in MovingWindowIter(pages):
+				yield page
+				changed, skip = self._check_page(pages.notebook, page, prev, next)
+				if changed:
+					batch.append((
+						page.name,
+						prev.name if prev else None,
+						next.name if next else None
+					))
+				if len(batch) == self.BATCH_SIZE:
+					results.append(pool.apply_async(_export_pages_worker, (batch,)))
+					batch = []
+
+				for item in self.export_attachments_iter(pages.notebook, page, iopool, skip):
+					if isinstance(item, AsyncResult):
+						results.append(item)
+					else:
+						yield item
+
+			if batch:
+				results.append(pool.apply_async(_export_pages_worker, (batch,)))
+
+			for result in results:
+				result.get() # re-raise errors, e.g. from copying attachments
+		finally:
+			pool.terminate()
+			iopool.terminate()
+			pool.join()
+			iopool.join()
 
 	def export_page(self, notebook, page, pages, prevpage=None, nextpage=None):
 		# XXX FIXME remove need for notebook here
@@ -142,7 +414,7 @@ class MultiFileExporter(FilesExporterBase):
 			up=None, # TODO
 			prevpage=prevpage, nextpage=nextpage,
 			links={'index': self.index_page},
-			index_generator=pages.index,
+			index_generator=self._index_snapshot or pages.index,
 			index_page=page,
 		)
 
@@ -158,6 +430,157 @@ class MultiFileExporter(FilesExporterBase):
 		self.export_page(pages.notebook, page, pages)
 
 
+def _signature(*data):
+	return hashlib.md5(json.dumps(data, sort_keys=True)).hexdigest()
+
+
+def _iter_template_expressions(elements):
+	# Yields all expressions used in a parsed template, including
+	# sub-expressions like function arguments
+	def walk(expr):
+		yield expr
+		if isinstance(expr, ExpressionFunctionCall):
+			for e in walk(expr.param):
+				yield e
+			for e in walk(expr.args):
+				yield e
+		elif isinstance(expr, ExpressionList):
+			for item in expr.items:
+				for e in walk(item):
+					yield e
+		elif isinstance(expr, ExpressionOperator):
+			for e in walk(expr.lexpr):
+				yield e
+			for e in walk(expr.rexpr):
+				yield e
+		elif isinstance(expr, ExpressionUnaryOperator):
+			for e in walk(expr.rexpr):
+				yield e
+
+	for element in elements:
+		if isinstance(element, basestring):
+			continue
+		expr = element.get('expr')
+		if expr is not None:
+			for e in walk(expr):
+				yield e
+		for e in _iter_template_expressions(element): # recurs
+			yield e
+
+
+def _list_attachments(notebook, page):
+	# Returns dict mapping basenames to modification time and size
+	attachments = {}
+	try:
+		for file in notebook.get_attachments_dir(page).list_files():
+			attachments[file.basename] = [file.mtime(), file.size()]
+	except FileNotFoundError:
+		pass
+	return attachments
+
+
+class ExportManifest(object):
+	'''Manifest for incremental export, records the signature and
+	attachments of each exported page in a JSON file in the output
+	folder. See L{MultiFileExporter}.
+	'''
+
+	def __init__(self, file, base_signature, resources_signature=None):
+		'''Constructor
+		@param file: a L{File} object for the manifest
+		@param base_signature: signature for inputs that affect all
+		pages, if it differs from the one in the manifest, all pages are
+		considered changed
+		@param resources_signature: signature for the template
+		resources
+		'''
+		self.file = file
+		self.base_signature = base_signature
+		self.resources_signature = resources_signature
+		self.pages = {}
+		self._previous = {}
+
+		manifest = {}
+		if file.exists():
+			try:
+				manifest = json.loads(file.read())
+			except ValueError:
+				logger.warn('Could not read export manifest: %s', file.path)
+		self.base_changed = manifest.get('base') != base_signature
+		self.resources_changed = manifest.get('resources') != resources_signature
+		self._previous = manifest.get('pages', {})
+
+	def check_page(self, layout, page, signature, attachments):
+		'''Record a page in the manifest
+		@param layout: the L{ExportLayout}
+		@param page: the L{Path} of the page
+		@param signature: the signature for the page
+		@param attachments: dict mapping basenames of attachments to
+		modification time and size
+		@returns: C{True} if the page changed since the previous export
+		'''
+		self.pages[page.name] = {
+			'signature': signature,
+			'attachments': attachments,
+		}
+		previous = self._previous.get(page.name)
+		return self.base_changed \
+			or previous is None \
+			or previous['signature'] != signature \
+			or not layout.page_file(page).exists()
+
+	def unchanged_attachments(self, page):
+		'''Returns the set of basenames of attachments of C{page} that
+		did not change since the previous export
+		'''
+		previous = self._previous.get(page.name, {}).get('attachments', {})
+		current = self.pages[page.name]['attachments']
+		return set(k for k, v in current.items() if previous.get(k) == v)
+
+	def keep_previous_pages(self):
+		'''Keep the records of pages that were exported previously but
+		are not part of the current export. Used when only part of the
+		notebook is exported. If the base signature changed, the output
+		of these pages is outdated, so their records are dropped.
+		'''
+		if not self.base_changed:
+			for name, previous in self._previous.items():
+				if name not in self.pages:
+					self.pages[name] = previous
+
+	def remove_stale_files(self, layout):
+		'''Remove output of pages and attachments that were exported
+		previously but are not part of the current export
+		@param layout: the L{ExportLayout}
+		'''
+		for name, previous in self._previous.items():
+			path = Path(name)
+			current = self.pages.get(name)
+			try:
+				if current is None:
+					file = layout.page_file(path)
+					if file.exists():
+						logger.info('Remove stale export: %s', file.path)
+						file.remove()
+				dir = layout.attachments_dir(path)
+			except PathLookupError:
+				continue
+
+			for basename in previous['attachments']:
+				if current is None or basename not in current['attachments']:
+					file = dir.file(basename)
+					if file.exists():
+						file.remove()
+
+	def write(self):
+		'''Write the manifest file'''
+		self.file.write(json.dumps({
+			'base': self.base_signature,
+			'resources': self.resources_signature,
+			'pages': self.pages,
+		}, sort_keys=True))
+
+
 class SingleFileExporter(FilesExporterBase):
 	'''Exporter that exports all page to the same file'''
 
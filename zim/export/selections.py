@@ -43,11 +43,7 @@ class AllPages(PageSelection):
 		self.title = notebook.name # XXX implement notebook.title
 
 	def __iter__(self):
-		for path in self.notebook.pages.walk():
-			try:
-				yield self.notebook.get_page(path)
-			except PageNotFoundError:
-				pass
+		return self.notebook.get_pages(self.notebook.pages.walk())
 
 	def index(self, namespace=None):
 		return self.notebook.pages.walk(namespace)
@@ -81,8 +77,8 @@ class SubPages(SinglePage):
 
 	def __iter__(self):
 		yield self.notebook.get_page(self.page)
-		for path in self.notebook.pages.walk(self.page):
-			yield self.notebook.get_page(path)
+		for page in self.notebook.get_pages(self.notebook.pages.walk(self.page)):
+			yield page
 
 	def index(self, namespace=None):
 		if namespace is None or namespace.name == self.page.name:
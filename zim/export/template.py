@@ -98,6 +98,138 @@ from zim.notebook.index import IndexNotFoundError
 from zim.notebook import Path
 
 
+class IndexSnapshot(object):
+	'''Snapshot of the page index used by the C{index()} function in
+	export templates. The index is walked only once per namespace and
+	the parts of the index that do not depend on the current page are
+	memorized. Use a single instance for all pages of an export run, so
+	the cost of rendering the index does not grow with the number of
+	pages times the size of the index.
+	'''
+
+	def __init__(self, index_generator):
+		'''Constructor
+		@param index_generator: a generator function that provides
+		L{Path} objects for a namespace, see the C{index_generator}
+		argument of L{ExportTemplateContext}
+		'''
+		self._index_generator = index_generator
+		self._namespaces = {}
+		self._branches = {}
+
+	def __call__(self, namespace=None):
+		# Allow use as a plain index generator
+		top, children = self.get_children(namespace)
+		if top is None:
+			return iter([])
+		else:
+			return self._walk(children, top)
+
+	def _walk(self, children, parent):
+		for path in children.get(parent.name, ()):
+			yield path
+			for child in self._walk(children, path): # recurs
+				yield child
+
+	def get_children(self, namespace=None):
+		'''Returns the index for a namespace
+		@param namespace: a L{Path} or C{None}
+		@returns: a 2-tuple of the L{Path} for the top level of the
+		index and a dict that maps page names to a list of L{Path}
+		objects for the children of that page
+		'''
+		key = namespace.name if namespace else None
+		if key not in self._namespaces:
+			top = None
+			children = {}
+			for path in self._index_generator(namespace):
+				path = Path(path.name)
+				if top is None:
+					top = path.parent
+				children.setdefault(path.parent.name, []).append(path)
+			self._namespaces[key] = (top, children)
+		return self._namespaces[key]
+
+	def build(self, builder, namespace=None, current=None, collapse=True):
+		'''Build a bullet list for the index
+		@param builder: a L{ParseTreeBuilder}
+		@param namespace: a L{Path} or C{None}
+		@param current: the L{Path} for the current page or C{None}
+		@param collapse: if C{True} only the branch of the current page
+		is shown
+		@returns: C{True} if anything was added to the builder
+		'''
+		top, children = self.get_children(namespace)
+		if top is None:
+			return False
+
+		if current and collapse:
+			expanded = set([current.name] + [p.name for p in current.parents()])
+			if top.name not in expanded:
+				return False # current page is not in this namespace
+		else:
+			expanded = None
+
+		self._build(builder, children, top, current, expanded, namespace)
+		return True
+
+	def _build(self, builder, children, parent, current, expanded, namespace):
+		builder.start(BULLETLIST)
+		for path in children[parent.name]:
+			builder.start(LISTITEM)
+			if path == current:
+				# Current page is marked with the strong style
+				builder.append(STRONG, text=path.basename)
+			else:
+				# links to other pages
+				builder.append(LINK,
+					{'type': 'page', 'href': ':' + path.name},
+					path.basename)
+			builder.end(LISTITEM)
+
+			if path.name not in children:
+				continue
+			elif expanded is not None:
+				if path.name in expanded:
+					self._build(builder, children, path, current, expanded, namespace) # recurs
+			elif current and (path == current or current.ischild(path)):
+				self._build(builder, children, path, current, expanded, namespace) # recurs
+			else:
+				# Branch does not depend on the current page
+				key = (namespace.name if namespace else None, path.name)
+				if key not in self._branches:
+					tokens = BranchRecorder()
+					self._build(tokens, children, path, None, None, namespace) # recurs
+					self._branches[key] = tokens
+				self._branches[key].replay(builder)
+		builder.end(BULLETLIST)
+
+
+class BranchRecorder(object):
+	# Records builder calls for replaying them later, see IndexSnapshot
+
+	def __init__(self):
+		self.calls = []
+
+	def start(self, tag, attrib=None):
+		self.calls.append((0, tag, attrib, None))
+
+	def end(self, tag):
+		self.calls.append((1, tag, None, None))
+
+	def append(self, tag, attrib=None, text=None):
+		self.calls.append((2, tag, attrib, text))
+
+	def replay(self, builder):
+		for type, tag, attrib, text in self.calls:
+			if type == 0:
+				builder.start(tag, dict(attrib) if attrib else attrib)
+			elif type == 1:
+				builder.end(tag)
+			else:
+				builder.append(tag, dict(attrib) if attrib else attrib, text)
+
+
 class ExportTemplateContext(dict):
 	# No need to inherit from TemplateContextDict here, the template
 	# will do a copy first anyway to protect changing content in this
@@ -143,6 +275,8 @@ class ExportTemplateContext(dict):
 		the C{index()} function. This method should take a single
 		argument for the root namespace to show.
 		See the definition of L{Index.walk()} or L{PageSelection.index()}.
+		Can also be an L{IndexSnapshot} object that is shared between
+		contexts for the pages of an export run.
 		@param index_page: the current page to show in the index if any
 		'''
 		# TODO get rid of need of notebook here!
@@ -269,54 +403,24 @@ class ExportTemplateContext(dict):
 		'''
 		if not self._index_generator:
 			return ''
-
-		builder = ParseTreeBuilder()
-		builder.start(FORMATTEDTEXT)
-		if self._index_page:
-			expanded = [self._index_page] + list(self._index_page.parents())
-		else:
-			expanded = []
-		stack = []
+		elif not isinstance(self._index_generator, IndexSnapshot):
+			self._index_generator = IndexSnapshot(self._index_generator)
 
 		if isinstance(namespace, PageProxy):
 			namespace = Path(namespace.name)
 		elif isinstance(namespace, str):
 			namespace = Path(namespace)
 
-		for path in self._index_generator(namespace):
-			logger.info(path)
-			if self._index_page and collapse \
-			and not path.parent in expanded:
-				continue # skip since it is not part of current path
-			#elif ignore_empty and not (path.hascontent or path.haschildren): - bug,  should be page.hascontent,  page.haschildren
-			#	continue # skip since page is empty
-
-			if not stack:
-				stack.append(path.parent)
-				builder.start(BULLETLIST)
-			elif stack[-1] != path.parent:
-				if path.ischild(stack[-1]):
-					builder.start(BULLETLIST)
-					stack.append(path.parent)
-				else:
-					while stack and stack[-1] != path.parent:
-						builder.end(BULLETLIST)
-						stack.pop()
-
-			builder.start(LISTITEM)
-			if path == self._index_page:
-				# Current page is marked with the strong style
-				builder.append(STRONG, text=path.basename)
-			else:
-				# links to other pages
-				builder.append(LINK,
-					{'type': 'page', 'href': ':' + path.name},
-					path.basename)
-			builder.end(LISTITEM)
+		# TODO ignore_empty - needs page.hascontent and page.haschildren,
+		#      not path.hascontent and path.haschildren
 
-		for p in stack:
-			builder.end(BULLETLIST)
+		builder = ParseTreeBuilder()
+		builder.start(FORMATTEDTEXT)
+		ok = self._index_generator.build(builder, namespace,
+			current=self._index_page, collapse=collapse)
 		builder.end(FORMATTEDTEXT)
+		if not ok:
+			return ''
 
 		tree = builder.get_parsetree()
 		if not tree:
@@ -324,7 +428,7 @@ class ExportTemplateContext(dict):
 
 		#~ print "!!!", tree.tostring()
 		dumper = self.get_dumper(None)
-		return ''.join(dumper.dump(tree))
+		return u''.join(dumper.dump_iter(tree))
 
 	@ExpressionFunction
 	def uri_function(self, link):
@@ -436,8 +540,7 @@ class ParseTreeProxy(object):
 		try:
 			head, body = self._split_head()
 			if body:
-				lines = self._dumper.dump(body)
-				return u''.join(lines)
+				return u''.join(self._dumper.dump_iter(body))
 			else:
 				return ''
 		except:
@@ -448,8 +551,7 @@ class ParseTreeProxy(object):
 	def content(self):
 		try:
 			if self._tree:
-				lines = self._dumper.dump(self._tree)
-				return u''.join(lines)
+				return u''.join(self._dumper.dump_iter(self._tree))
 			else:
 				return ''
 		except:
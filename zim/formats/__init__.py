@@ -327,13 +327,16 @@ class ParseTree(object):
 		return xml.getvalue()
 
 	def copy(self):
-		# By using serialization we are absolutely sure all refs are new
-		xml = self.tostring()
-		try:
-			return ParseTree().fromstring(xml)
-		except:
-			print ">>>", xml, "<<<"
-			raise
+		'''Returns a deep copy of this tree. Copies all elements and
+		attribute dicts, so the copy can be modified without affecting
+		the original. Attribute values are converted to strings, like
+		they are after a round trip through XML.
+		'''
+		# Structural copy, much faster than a round trip through XML
+		root = self._etree.getroot()
+		tree = ParseTree(_copy_element(root) if root is not None else None)
+		tree.meta = OrderedDict(self.meta.items())
+		return tree
 
 	def iter_tokens(self):
 		tb = TokenBuilder()
@@ -514,6 +517,17 @@ class ParseTree(object):
 
 		return count
 
+	def iter_text(self):
+		'''Generator for the text in this tree
+		@returns: yields the text and tail of each element as separate
+		strings, so words are never split over two strings
+		'''
+		for element in self._etree.getiterator():
+			if element.text:
+				yield element.text
+			if element.tail:
+				yield element.tail
+
 	def countre(self, regex):
 		'''Returns the number of matches for a regular expression
 		in this tree.
@@ -560,6 +574,31 @@ class ParseTree(object):
 		except VisitorStop:
 			pass
 
+	def visit_iter(self, visitor):
+		'''Like L{visit()} but implemented as a generator that yields
+		after each top level node. This allows the visitor to process
+		the output for large trees in parts.
+
+		@param visitor: a L{Visitor} or L{Builder} object
+		@returns: yields C{None} after each top level node
+		'''
+		root = self._etree.getroot()
+		try:
+			if len(root): # Has children
+				visitor.start(root.tag, root.attrib)
+				if root.text:
+					visitor.text(root.text)
+				for child in root:
+					self._visit(visitor, child)
+					if child.tail:
+						visitor.text(child.tail)
+					yield
+				visitor.end(root.tag)
+			else:
+				visitor.append(root.tag, root.attrib, root.text)
+		except (VisitorStop, VisitorSkip):
+			pass
+
 	def _visit(self, visitor, node):
 		try:
 			if len(node): # Has children
@@ -714,6 +753,18 @@ class ParseTree(object):
 			return None
 
 
+def _copy_element(elt):
+	attrib = dict(
+		(k, v if isinstance(v, basestring) else str(v))
+			for k, v in elt.attrib.items()
+	)
+	newelt = ElementTreeModule.Element(elt.tag, attrib)
+	newelt.text = elt.text
+	newelt.tail = elt.tail
+	newelt.extend([_copy_element(child) for child in elt]) # recurs
+	return newelt
+
+
 class VisitorStop(Exception):
 	'''Exception to be raised to cancel a visitor action'''
 	pass
@@ -1189,21 +1240,41 @@ class DumperClass(Visitor):
 		'''Format a parsetree to text
 		@param tree: a parse tree object that supports a C{visit()} method
 		@returns: a list of lines
+		@implementation: sub-classes that need to initialize state
+		before dumping should overload L{dump_iter()} instead of this
+		method
+		'''
+		return u''.join(self.dump_iter(tree)).splitlines(1)
+
+	def dump_iter(self, tree):
+		'''Format a parsetree to text, yielding the output in parts
+		as soon as each top level element is done. Use this instead of
+		L{dump()} to write the output of large trees to a file without
+		keeping all of it in memory.
+		@param tree: a parse tree object that supports a C{visit()}
+		method, if it also supports C{visit_iter()} the output is
+		generated incrementally
+		@returns: yields strings, these are not split in lines
 		'''
 		# FIXME - issue here is that we need to reset state - should be in __init__
 		self._text = []
 		self.context = [DumperContextElement(None, None, self._text)]
-		tree.visit(self)
+		if hasattr(tree, 'visit_iter'):
+			for i in tree.visit_iter(self):
+				# After each top level element, the output for the
+				# open root element can be flushed
+				strings = self.context[-1].text
+				if len(self.context) == 2 and strings:
+					yield u''.join(strings)
+					del strings[:]
+		else:
+			tree.visit(self)
+
 		if len(self.context) != 1:
 			raise AssertionError('Unclosed tags on tree: %s' % self.context[-1].tag)
-		#~ import pprint; pprint.pprint(self._text)
-		return self.get_lines() # FIXME - maybe just return text ?
-
-	def get_lines(self):
-		'''Return the dumped content as a list of lines
-		Should only be called after closing the top level element
-		'''
-		return u''.join(self._text).splitlines(1)
+		if self._text:
+			yield u''.join(self._text)
+			self._text = []
 
 	def start(self, tag, attrib=None):
 		if attrib:
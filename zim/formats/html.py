@@ -56,10 +56,10 @@ class Dumper(DumperClass):
 		'line_breaks': Choice('default', ('default', 'remove')),
 	}
 
-	def dump(self, tree):
+	def dump_iter(self, tree):
 		# FIXME should be an init function for this
 		self._isrtl = None
-		return DumperClass.dump(self, tree)
+		return DumperClass.dump_iter(self, tree)
 
 	def encode_text(self, tag, text):
 		# if _isrtl is already set the direction was already
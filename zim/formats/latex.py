@@ -94,12 +94,12 @@ class Dumper(TextDumper):
 		'document_type': Choice('report', ('report', 'article', 'book'))
 	}
 
-	def dump(self, tree):
+	def dump_iter(self, tree):
 		assert isinstance(tree, ParseTree)
 		assert self.linker, 'LaTeX dumper needs a linker object'
 		self.document_type = self.template_options['document_type']
 		logger.info('used document type: %s' % self.document_type)
-		return TextDumper.dump(self, tree)
+		return TextDumper.dump_iter(self, tree)
 
 	@staticmethod
 	def encode_text(tag, text):
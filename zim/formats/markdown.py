@@ -56,9 +56,9 @@ class Dumper(TextDumper):
 		SUPERSCRIPT: ('^', '^'),
 	}
 
-	def dump(self, tree):
+	def dump_iter(self, tree):
 		assert self.linker, 'Markdown dumper needs a linker object'
-		return TextDumper.dump(self, tree)
+		return TextDumper.dump_iter(self, tree)
 
 	def dump_indent(self, tag, attrib, strings):
 		# OPEN ISSUE: no indent for para
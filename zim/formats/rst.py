@@ -47,9 +47,9 @@ class Dumper(TextDumper):
 
 	HEADING_UNDERLINE = ['=', '-', '^', '"']
 
-	def dump(self, tree):
+	def dump_iter(self, tree):
 		assert self.linker, 'rst dumper needs a linker object'
-		return TextDumper.dump(self, tree)
+		return TextDumper.dump_iter(self, tree)
 
 	def dump_h(self, tag, attrib, strings):
 		# Underlined headings
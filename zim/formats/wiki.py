@@ -78,10 +78,15 @@ class WikiParser(object):
 		'*': BULLET,
 	}
 
-	def __init__(self):
+	def __init__(self, backward=False):
+		# Instances are not modified while parsing, so a single
+		# instance can be used by multiple threads at the same time
+		self.backward = backward
 		self.inline_parser = self._init_inline_parse()
 		self.list_and_indent_parser = self._init_intermediate_parser()
 		self.block_parser = self._init_block_parser()
+		for p in (self.inline_parser, self.list_and_indent_parser, self.block_parser):
+			p.compile()
 
 	def __call__(self, builder, text):
 		builder.start(FORMATTEDTEXT)
@@ -439,6 +444,7 @@ class WikiParser(object):
 
 
 wikiparser = WikiParser() #: singleton instance
+backward_wikiparser = WikiParser(backward=True) #: singleton instance for pages before zim 0.29
 
 
 # FIXME FIXME we are redefining Parser here !
@@ -460,8 +466,10 @@ class Parser(ParserClass):
 				backward = True
 
 		builder = ParseTreeBuilder(partial=partial)
-		wikiparser.backward = backward or self.backward # HACK
-		wikiparser(builder, input)
+		if backward or self.backward:
+			backward_wikiparser(builder, input)
+		else:
+			wikiparser(builder, input)
 
 		parsetree = builder.get_parsetree()
 		if meta is not None:
@@ -498,6 +506,9 @@ class Dumper(TextDumper):
 	}
 
 	def dump(self, tree, file_output=False):
+		return u''.join(self.dump_iter(tree, file_output)).splitlines(1)
+
+	def dump_iter(self, tree, file_output=False):
 		# If file_output=True we add meta headers to the output
 		# would be nicer to handle this via a template, but works for now
 		if file_output:
@@ -505,10 +516,10 @@ class Dumper(TextDumper):
 				('Content-Type', 'text/x-zim-wiki'),
 				('Wiki-Format', WIKI_FORMAT_VERSION),
 			)
-			return [dump_header_lines(header, getattr(tree, 'meta', {})), '\n'] \
-						+ TextDumper.dump(self, tree)
-		else:
-			return TextDumper.dump(self, tree)
+			yield dump_header_lines(header, getattr(tree, 'meta', {})) + '\n'
+
+		for text in TextDumper.dump_iter(self, tree):
+			yield text
 
 	def dump_pre(self, tag, attrib, strings):
 		# Indent and wrap with "'''" lines
@@ -170,6 +170,9 @@ except ImportError:
 		pass # Ignore this error on Windows; doesn't come with xdg.Mime
 	import mimetypes
 
+_xdgmime_lock = threading.Lock()
+	# xdg.Mime loads its data on first use, which is not thread safe
+
 
 #: Extensions to determine image mimetypes - used in L{File.isimage()}
 IMAGE_EXTENSIONS = (
@@ -1397,7 +1400,8 @@ class UnixFile(FilePath):
 		@returns: the mimetype as a string, e.g. "text/plain"
 		'''
 		if xdgmime:
-			mimetype = xdgmime.get_type(self.path, name_pri=80)
+			with _xdgmime_lock:
+				mimetype = xdgmime.get_type(self.path, name_pri=80)
 			return str(mimetype)
 		else:
 			mimetype, encoding = mimetypes.guess_type(self.path, strict=False)
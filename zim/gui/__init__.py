@@ -288,6 +288,11 @@ class GtkInterface(gobject.GObject):
 		if not self.preferences['GtkInterface']['gtk_bell']:
 			gtk.rc_parse_string('gtk-error-bell = 0')
 
+		# Hidden setting to check all files on startup, also when the
+		# index was in sync when the previous session was closed. Use
+		# this when files are modified in place by other applications.
+		self.preferences['GtkInterface'].setdefault('full_index_check', False)
+
 		# Init UI
 		self._mainwindow = MainWindow(self, self.preferences, fullscreen, geometry)
 
@@ -407,7 +412,8 @@ class GtkInterface(gobject.GObject):
 			# Start a lightweight background check of the index
 			# put a small delay to ensure window is shown before we start
 			def start_background_check():
-				self.notebook.index.start_background_check(self.notebook)
+				self.notebook.index.start_background_check(self.notebook,
+					full_check=self.preferences['GtkInterface']['full_index_check'])
 				return False # only run once
 			gobject.timeout_add(500, start_background_check)
 
@@ -146,7 +146,7 @@ class SearchResultsTreeView(BrowserTreeView):
 		BrowserTreeView.__init__(self, model)
 		self.app_window = window
 		self.query = None
-		self.selection = SearchSelection(window.ui.notebook) # XXX
+		self.selection = SearchSelection(window.ui.notebook, jobs=get_worker_pool_jobs()) # XXX
 		self.cancelled = False
 
 		cell_renderer = gtk.CellRendererText()
@@ -12,6 +12,7 @@ import os
 import sys
 import logging
 import signal
+import time
 
 logger = logging.getLogger('zim')
 
@@ -66,10 +67,13 @@ GUI Options:
   --geometry       window size and position as WxH+X+Y
   --fullscreen     start in fullscreen mode
   --standalone     start a single instance, no background process
+  --jobs           number of processes to use for scanning page
+                   content in the search dialog, defaults to 1
 
 Server Options:
   --port           port to use (defaults to 8080)
   --template       name of the template to use
+  --threads        number of threads to handle requests (defaults to 1)
   --gui            run the gui wrapper for the server
 
 Export Options:
@@ -81,12 +85,23 @@ Export Options:
   -r, --recursive  when exporting a page, also export sub-pages
   -s, --singlefile export all pages to a single output file
   -O, --overwrite  force overwriting existing file(s)
+  -j, --jobs       number of processes to use for exporting pages
+  --incremental    only export pages that changed since the previous
+                   export to the same output folder
 
 Search Options:
-  None
+  --stream         print results as soon as they are found
+  --limit          stop searching after this number of results
+  --json           print results as JSON objects with name and score
+  --timing         print time spent on the search to stderr
+  --jobs           number of processes to use for scanning page
+                   content, defaults to 1
 
 Index Options:
-  None
+  --jobs           number of processes to use for parsing pages
+  --resume         continue a previous index update instead of
+                   rebuilding the index, if no update is pending
+                   all files are checked for changes
 
 Try 'zim --manual' for more help.
 '''
@@ -195,6 +210,7 @@ class GuiCommand(NotebookCommand, GtkCommand):
 		('geometry=', '', 'window size and position as WxH+X+Y'),
 		('fullscreen', '', 'start in fullscreen mode'),
 		('standalone', '', 'start a single instance, no background process'),
+		('jobs=', '', 'number of processes to use for scanning page content'),
 	)
 
 	def build_notebook(self, ensure_uptodate=False):
@@ -250,6 +266,17 @@ class GuiCommand(NotebookCommand, GtkCommand):
 	def run(self):
 		import gtk
 		import zim.gui
+		import zim.search
+
+		jobs = int(self.opts.get('jobs', 1))
+		if jobs < 1:
+			raise UsageError('--jobs needs a positive number')
+		elif jobs > 1:
+			if gtk.main_level() == 0:
+				# Fork the search workers before the main loop runs
+				zim.search.start_worker_pool(jobs)
+			else:
+				logger.warn('Ignoring --jobs, the search workers can only be started with the first window')
 
 		notebook, page = self.build_notebook()
 		if notebook is None:
@@ -301,16 +328,18 @@ class ServerCommand(NotebookCommand):
 	options = (
 		('port=', 'p', 'port number to use (defaults to 8080)'),
 		('template=', 't', 'name or path of the template to use'),
+		('threads=', '', 'number of threads to handle requests'),
 		('standalone', '', 'start a single instance, no background process'),
 	)
 
 	def run(self):
 		import zim.www
 		self.opts['port'] = int(self.opts.get('port', 8080))
+		self.opts['threads'] = int(self.opts.get('threads', 1))
 		self.opts.setdefault('template', 'Default')
 		notebook, page = self.build_notebook()
 
-		self.server = httpd = zim.www.make_server(notebook, public=True, **self.get_options('template', 'port'))
+		self.server = httpd = zim.www.make_server(notebook, public=True, **self.get_options('template', 'port', 'threads'))
 			# server attribute used in testing to stop sever in thread
 		logger.info("Serving HTTP on %s port %i...", httpd.server_name, httpd.server_port)
 		httpd.serve_forever()
@@ -358,6 +387,8 @@ class ExportCommand(NotebookCommand):
 		('recursive', 'r', 'when exporting a page, also export sub-pages'),
 		('singlefile', 's', 'export all pages to a single output file'),
 		('overwrite', 'O', 'overwrite existing file(s)'),
+		('jobs=', 'j', 'number of processes to use for exporting pages'),
+		('incremental', '', 'only export pages that changed since the previous export'),
 	)
 
 	def get_exporter(self, page):
@@ -376,7 +407,8 @@ class ExportCommand(NotebookCommand):
 			output = File(self.opts.get('output'))
 		template = self.opts.get('template', 'Default')
 
-		if output.exists() and not self.opts.get('overwrite'):
+		incremental = bool(self.opts.get('incremental'))
+		if output.exists() and not (self.opts.get('overwrite') or incremental):
 			if output.isdir():
 				if len(output.list()) > 0:
 					raise Error(_('Output folder exists and not empty, specify "--overwrite" to force export'))  # T: error message for export
@@ -385,8 +417,10 @@ class ExportCommand(NotebookCommand):
 			else:
 				raise Error(_('Output file exists, specify "--overwrite" to force export'))  # T: error message for export
 
+		jobs = int(self.opts.get('jobs', 1))
+
 		if format == 'mhtml':
-			self.ignore_options('index-page')
+			self.ignore_options('index-page', 'jobs', 'incremental')
 			if output.isdir():
 				raise UsageError(_('Need output file to export MHTML')) # T: error message for export
 
@@ -401,6 +435,7 @@ class ExportCommand(NotebookCommand):
 				output = output.file(page.basename) + '.' + ext
 
 			if self.opts.get('singlefile'):
+				self.ignore_options('jobs', 'incremental')
 				exporter = build_single_file_exporter(
 					output, format, template, namespace=page,
 					document_root_url=self.opts.get('root-url'),
@@ -409,6 +444,8 @@ class ExportCommand(NotebookCommand):
 				exporter = build_page_exporter(
 					output, format, template, page,
 					document_root_url=self.opts.get('root-url'),
+					jobs=jobs,
+					incremental=incremental,
 				)
 		else:
 			if not output.exists():
@@ -420,6 +457,8 @@ class ExportCommand(NotebookCommand):
 				output, format, template,
 				index_page=self.opts.get('index-page'),
 				document_root_url=self.opts.get('root-url'),
+				jobs=jobs,
+				incremental=incremental,
 			)
 
 		return exporter
@@ -452,9 +491,22 @@ class ExportCommand(NotebookCommand):
 
 
 class SearchCommand(NotebookCommand):
-	'''Class implementing the C{--search} command'''
+	'''Class implementing the C{--search} command
+
+	By default all results are printed sorted by name when the search
+	is done. With the "stream" option results are printed as soon as
+	they are final: pages are final once their content has been
+	searched, any other results are printed sorted by name at the end.
+	'''
 
 	arguments = ('NOTEBOOK', 'QUERY')
+	options = (
+		('stream', '', 'print results as soon as they are found'),
+		('limit=', '', 'stop searching after this number of results'),
+		('json', '', 'print results as JSON objects with name and score'),
+		('timing', '', 'print time spent on the search to stderr'),
+		('jobs=', '', 'number of processes to use for scanning page content'),
+	)
 
 	def run(self):
 		from zim.search import SearchSelection, Query
@@ -468,23 +520,114 @@ class SearchCommand(NotebookCommand):
 		else:
 			raise ValueError('Empty query')
 
-		selection = SearchSelection(notebook)
-		selection.search(query)
-		for path in sorted(selection, key=lambda p: p.name):
+		stream = bool(self.opts.get('stream'))
+		limit = int(self.opts['limit']) if self.opts.get('limit') else None
+		if limit is not None and limit < 1:
+			raise UsageError('--limit needs a positive number')
+
+		jobs = int(self.opts.get('jobs', 1))
+		if jobs < 1:
+			raise UsageError('--jobs needs a positive number')
+
+		selection = SearchSelection(notebook, jobs=jobs)
+		printed = set()
+
+		def callback(results, path):
+			# "results" only contains final results, but a result is
+			# only final with its score once the page content was seen
+			if stream and path is not None and results is not None \
+			and path in results and path not in printed:
+				self._print_result(selection, path)
+				printed.add(path)
+
+			if limit is None:
+				return True
+			elif stream:
+				return len(printed) < limit
+			else:
+				return results is None or len(results) < limit
+
+		start = time.time()
+		selection.search(query, callback=callback)
+		seconds = time.time() - start
+
+		remaining = sorted(set(selection) - printed, key=lambda p: p.name)
+		if limit is not None:
+			remaining = remaining[:max(limit - len(printed), 0)]
+		for path in remaining:
+			self._print_result(selection, path)
+
+		if self.opts.get('timing'):
+			print >>sys.stderr, 'Search took %.3fs: index %.3fs, content %.3fs%s' % (
+				seconds,
+				selection.timings['index'],
+				selection.timings['content'],
+				' (stopped at limit)' if selection.cancelled else ''
+			)
+
+	def _print_result(self, selection, path):
+		if self.opts.get('json'):
+			from zim.config import json
+			print json.dumps({'name': path.name, 'score': selection.scores.get(path, 0)}, sort_keys=True)
+		else:
 			print path.name
+		sys.stdout.flush() # allow piping results
 
 
 class IndexCommand(NotebookCommand):
-	'''Class implementing the C{--index} command'''
+	'''Class implementing the C{--index} command
+
+	Progress is printed to stderr while indexing, when done statistics
+	are printed to stdout as JSON, see L{IndexUpdateStats.run()}.
+	'''
 
 	arguments = ('NOTEBOOK',)
+	options = (
+		('jobs=', 'j', 'number of processes to use for parsing pages'),
+		('resume', '', 'continue a previous index update instead of rebuilding the index'),
+	)
 
 	def run(self):
+		from zim.config import json
+		from zim.notebook.index import IndexUpdateStats
+
+		jobs = int(self.opts.get('jobs', 1))
+		resume = bool(self.opts.get('resume'))
 		notebook, p = self.build_notebook(ensure_uptodate=False)
-		notebook.index.flush()
-		for info in notebook.index.update_iter():
-			#logger.info('Indexing %s', info)
-			pass # TODO meaningful info for above message
+		if not resume:
+			notebook.index.flush()
+
+		# Updates are committed in batches, so when resuming the
+		# "files" table keeps track of what was already done by a
+		# previous run: only the rows still pending need an update.
+		# When nothing is pending, all files are checked for changes
+		# instead, which costs a stat call for each file.
+		update_iter = notebook.index.update_iter
+		stats = IndexUpdateStats(update_iter)
+		pending = stats.count_pending() if resume else 0
+		check = resume and not pending
+		if resume:
+			logger.info('Resuming index update, %i files pending', pending)
+
+		if jobs > 1:
+			myiter = update_iter.parallel_update_iter(jobs, check=check)
+		elif check:
+			myiter = update_iter.check_and_update_iter()
+		else:
+			myiter = iter(update_iter)
+
+		result = stats.run(myiter, progress=self._print_progress)
+		result['resumed'] = resume
+		print json.dumps(result, sort_keys=True)
+
+	@staticmethod
+	def _print_progress(info):
+		if info['eta'] is None:
+			eta = '?'
+		else:
+			eta = '%i:%02i' % divmod(int(info['eta']), 60)
+		print >>sys.stderr, 'Indexed %i files, %i pending, %.1f files/s, ETA %s' % (
+			info['done'], info['pending'], info['files_per_second'], eta)
 
 
 commands = {
@@ -724,9 +724,25 @@ class File(FSObjectBase):
 		return self._write_with_etag(self.write, text, etag)
 
 	def writelines_with_etag(self, lines, etag):
-		return self._write_with_etag(self.writelines, lines, etag)
+		# Lines can be an iterator, the md5 sum is computed while
+		# writing, so the content does not need to be kept in memory
+		m = hashlib.md5()
+
+		def iter_lines():
+			for l in lines:
+				m.update(l.encode('UTF-8') if isinstance(l, unicode) else l)
+				yield l
+
+		self._check_etag_for_write(etag)
+		self.writelines(iter_lines())
+		return (self.mtime(), m.digest())
 
 	def _write_with_etag(self, func, content, etag):
+		self._check_etag_for_write(etag)
+		func(content)
+		return (self.mtime(), _md5(content))
+
+	def _check_etag_for_write(self, etag):
 		# TODO, to make rock-solid would also need to lock the file
 		# before etag check and release after write
 
@@ -738,9 +754,6 @@ class File(FSObjectBase):
 			if not self.verify_etag(etag):
 				raise FileChangedError(self)
 
-		func(content)
-		return (self.mtime(), _md5(content))
-
 	def verify_etag(self, etag):
 		if isinstance(etag, tuple) and len(etag) == 2:
 			mtime = self.mtime()
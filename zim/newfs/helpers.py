@@ -20,6 +20,7 @@ import logging
 logger = logging.getLogger('zim.newfs.helpers')
 
 
+from .base import _decode_path
 from .local import LocalFSObjectBase
 
 
@@ -84,6 +85,15 @@ class TrashHelper(object):
 
 
 class FSObjectMonitor(SignalEmitter):
+	'''Monitor a file or folder for changes, depends on the C{gio}
+	library. When monitoring a folder, changes of the direct children
+	of the folder are reported.
+
+	@signal: C{changed (path, other_path)}: file or folder changed,
+	C{path} is the full path of the object that changed, C{other_path}
+	is the new path when the object was moved, or C{None}. Paths are
+	C{None} when not known.
+	'''
 
 	__signals__ = {
 		'changed': (None, None, (None, None)),
@@ -93,6 +103,11 @@ class FSObjectMonitor(SignalEmitter):
 		self.path = path
 		self._gio_file_monitor = None
 
+	@staticmethod
+	def is_supported(path):
+		'''Returns C{True} if monitoring C{path} is supported'''
+		return gio is not None and isinstance(path, LocalFSObjectBase)
+
 	def _setup_signal(self, signal):
 		if signal == 'changed' \
 		and self._gio_file_monitor is None \
@@ -139,7 +154,12 @@ class FSObjectMonitor(SignalEmitter):
 			gio.FILE_MONITOR_EVENT_DELETED,
 			gio.FILE_MONITOR_EVENT_MOVED,
 		):
-			self.emit('changed', None, None) # TODO translate otherfile and eventtype
+			path = file.get_path() if file else None
+			other_path = other_file.get_path() if other_file else None
+			self.emit('changed',
+				_decode_path(path) if path else None,
+				_decode_path(other_path) if other_path else None
+			)
 
 
 def format_file_size(bytes):
@@ -376,17 +376,21 @@ class LocalFile(LocalFSObjectBase, File):
 				fh.write(text)
 
 	def writelines(self, lines):
-		lines = map(lambda l: l.encode('UTF-8'), lines)
+		# Lines can be an iterator, they are encoded and written one
+		# by one to avoid keeping a second copy of the content in memory
+		dos = self.endofline == 'dos'
 		if self.endofline != _EOL:
-			if self.endofline == 'dos':
-				lines = map(lambda l: l.replace('\n', '\r\n'), lines)
 			mode = 'wb'
 		else:
 			mode = 'w' # trust newlines to be handled
 
 		with self._write_decoration():
 			with AtomicWriteContext(self, mode=mode) as fh:
-				fh.writelines(lines)
+				for line in lines:
+					line = line.encode('UTF-8')
+					if dos:
+						line = line.replace('\n', '\r\n')
+					fh.write(line)
 
 	def write_binary(self, data):
 		with self._write_decoration():
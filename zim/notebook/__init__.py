@@ -43,7 +43,8 @@ from .operations import NotebookOperation, SimpleAsyncOperation, \
 	NotebookOperationOngoing, NotebookState
 
 from .notebook import Notebook, TrashNotSupportedError, \
-	PageNotFoundError, PageNotAllowedError, PageExistsError, PageReadOnlyError
+	PageNotFoundError, PageNotAllowedError, PageExistsError, PageReadOnlyError, \
+	CHECK_ALWAYS, CHECK_INTERVAL, CHECK_NOTIFY
 
 from .page import Path, Page, \
 	HRef, HREF_REL_ABSOLUTE, HREF_REL_FLOATING, HREF_REL_RELATIVE
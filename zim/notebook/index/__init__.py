@@ -20,6 +20,7 @@ except ImportError:
 from zim.newfs import LocalFile, File, Folder, FileNotFoundError
 from zim.signals import SignalEmitter
 
+from zim.notebook.layout import FILE_TYPE_ATTACHMENT
 from zim.notebook.operations import NotebookOperation, NotebookOperationOngoing, ongoing_operation
 
 from .files import *
@@ -27,9 +28,11 @@ from .base import *
 from .pages import *
 from .links import *
 from .tags import *
+from .fulltext import *
+from .stats import IndexUpdateStats
 
 
-DB_VERSION = '0.7'
+DB_VERSION = '0.9'
 
 
 class Index(SignalEmitter):
@@ -64,6 +67,7 @@ class Index(SignalEmitter):
 		'''
 		self.dbpath = dbpath
 		self.layout = layout
+		self.resolve_cache = LinkResolverCache()
 		self._db = self._new_connection()
 		self._db_check()
 		if not hasattr(self, 'update_iter'):
@@ -72,13 +76,19 @@ class Index(SignalEmitter):
 
 		self._checker = FilesIndexChecker(self._db, self.layout.root)
 		self.background_check = BackgroundCheck(self._checker, None)
+		self._watcher = FilesIndexWatcher(self._db, self.layout.root)
+		self._watcher.connect_to_indexer(self.update_iter.files)
 
 	def _update_iter_init(self):
-		self.update_iter = IndexUpdateIter(self._db, self.layout)
+		self.update_iter = IndexUpdateIter(self._db, self.layout, self.resolve_cache)
 		self.update_iter.connect('commit', self.on_commit)
+		if hasattr(self, '_watcher'): # not yet there on init
+			self._watcher.connect_to_indexer(self.update_iter.files)
 		self.emit('new-update-iter', self.update_iter)
 
 	def on_commit(self, iter):
+		if hasattr(self, '_watcher'): # not yet there on init
+			self._watcher.update_monitors()
 		self.emit('changed')
 
 	def _new_connection(self):
@@ -89,6 +99,23 @@ class Index(SignalEmitter):
 		# anyway. Allows us to use commit more frequently.
 		return db
 
+	def new_read_only_connection(self):
+		'''Open a new connection to the index database that is only
+		used for reading. Sqlite connections can not be shared between
+		threads, so use this to query the index from another thread,
+		e.g. by constructing index views with the connection.
+		Not supported for an index in memory.
+		@returns: a C{sqlite3.Connection}
+		'''
+		assert self.dbpath != ':memory:', 'Can not share an in-memory index'
+		db = sqlite3.Connection(self.dbpath)
+		db.row_factory = sqlite3.Row
+		try:
+			db.execute('PRAGMA query_only=ON;')
+		except sqlite3.OperationalError:
+			pass # sqlite < 3.8.0
+		return db
+
 	def _db_check(self):
 		try:
 			if self.get_property('db_version') == DB_VERSION:
@@ -122,7 +149,9 @@ class Index(SignalEmitter):
 			'WHERE type="table" and name NOT LIKE "sqlite%"'
 		)]
 		for table in tables:
-			self._db.execute('DROP TABLE %s' % table)
+			self._db.execute('DROP TABLE IF EXISTS %s' % table)
+				# "IF EXISTS" because dropping a virtual table also
+				# drops the tables that belong to it
 
 		logger.debug('(Re-)Initializing database for index')
 		self._db.executescript('''
@@ -192,20 +221,79 @@ class Index(SignalEmitter):
 			(STATUS_NEED_UPDATE,)
 		)
 
-	def start_background_check(self, notebook):
-		self.check_async(notebook, [Path(':')], recursive=True)
+	def start_background_check(self, notebook, full_check=False):
+		'''Start checking the index for changes in the background.
+		If supported, also starts watching the notebook folder for
+		changes with file system monitors.
+
+		If the previous session was stopped cleanly with
+		L{stop_background_check()} while the watcher was running, the
+		first check only checks folders, and the files in a folder are
+		checked when the folder changed. This finds pages that were
+		added, removed or moved while we were not running, as well as
+		files replaced by editors or sync tools that write a new file.
+		Files modified in place do not change the folder, these are
+		only found when all files are checked. Once the check is done,
+		the watcher keeps the index up to date.
+
+		@param notebook: the L{Notebook}
+		@param full_check: if C{True} always check all files and
+		folders, also after a clean shutdown
+		'''
+		clean_shutdown = self.get_property('clean_shutdown')
+		if clean_shutdown:
+			self.set_property('clean_shutdown', None)
+			self._db.commit()
+
+		if not self._watcher.running:
+			if self._watcher.start():
+				self._watcher_handler = self._watcher.connect('out-of-date',
+					lambda o: on_watcher_out_of_date(notebook))
+			else:
+				clean_shutdown = False
+
+		if clean_shutdown and not full_check:
+			logger.debug('Previous session was closed cleanly - only check folders')
+			self._checker.queue_check(folders_only=True)
+			self.background_check.callback = lambda *a: on_out_of_date_found(notebook, self.background_check)
+			self.background_check.start()
+		else:
+			self.check_async(notebook, [Path(':')], recursive=True)
 
 	def stop_background_check(self):
+		'''Stop the background check and the watcher. If the watcher
+		was running, the index is marked to be in sync with the notebook
+		folder, see L{start_background_check()}.
+		'''
 		self.background_check.stop()
+		if self._watcher.running:
+			self._watcher.stop()
+			self._watcher.disconnect(self._watcher_handler)
+			self.set_property('clean_shutdown', '1')
+			self._db.commit()
 
 	def update_file(self, file):
-		path = file.relpath(self.layout.root)
+		'''Update the index for a single file or folder and commit
+		@param file: a L{File} or L{Folder} object
+		'''
+		self.update_files([file])
+
+	def update_files(self, files):
+		'''Update the index for a number of files or folders in a
+		single transaction. This is used to apply the changes of a
+		batch of pages written at once without a commit per page.
+		@param files: a list of L{File} or L{Folder} objects
+		'''
 		filesindexer = self.update_iter.files
-		row = self._db.execute('SELECT id FROM files WHERE path=?', (path,)).fetchone()
-		if row is None and not file.exists():
-			pass
-		else:
-			filesindexer.emit('start-update')
+		started = False
+		for file in files:
+			path = file.relpath(self.layout.root)
+			row = self._db.execute('SELECT id FROM files WHERE path=?', (path,)).fetchone()
+			if row is None and not file.exists():
+				continue
+			elif not started:
+				filesindexer.emit('start-update')
+				started = True
 
 			if row:
 				node_id = row[0]
@@ -229,15 +317,65 @@ class Index(SignalEmitter):
 				else:
 					raise TypeError
 
+		if started:
 			filesindexer.emit('finish-update')
 			self._db.commit()
 			self.on_commit(None)
 
 	def file_moved(self, oldfile, newfile):
-		# TODO: make this more efficient, specific for moved folders
-		#       by supporting moved pages in indexers
-		self.update_file(oldfile)
-		self.update_file(newfile)
+		'''Update the index for a file or folder that was moved. The
+		rows for the files and pages are updated in place, so moved
+		pages do not need to be read and indexed again. Falls back to
+		updating both locations if the move can not be done in place.
+		@param oldfile: the old location as L{File} or L{Folder}
+		@param newfile: the new location as L{File} or L{Folder}
+		'''
+		filesindexer = self.update_iter.files
+		oldpath = oldfile.relpath(self.layout.root)
+		newpath = newfile.relpath(self.layout.root)
+		row = self._db.execute(
+			'SELECT id FROM files WHERE path=?', (oldpath,)
+		).fetchone()
+		if row is None or not newfile.exists() \
+		or not self._can_move_in_place(oldpath, newpath, isinstance(newfile, Folder)) \
+		or self._db.execute(
+			'SELECT id FROM files WHERE path=?', (newpath,)
+		).fetchone() is not None:
+			self.update_file(oldfile)
+			self.update_file(newfile)
+			return
+
+		filesindexer.emit('start-update')
+		if isinstance(newfile, Folder):
+			filesindexer.move_folder(row[0], newfile)
+		else:
+			filesindexer.move_file(row[0], newfile)
+		filesindexer.emit('finish-update')
+		self._db.commit()
+		self.on_commit(None)
+
+	def _can_move_in_place(self, oldpath, newpath, isfolder):
+		# Moving pages in place is not supported if the page moves
+		# below itself or the other way around, or if a file changes
+		# from attachment to page source
+		if isfolder:
+			oldpath += self.layout.default_extension
+			newpath += self.layout.default_extension
+		try:
+			oldname, oldtype = self.layout.map_filepath(oldpath)
+			newname, newtype = self.layout.map_filepath(newpath)
+		except AssertionError: # invalid page name
+			return False
+		if oldtype != newtype:
+			return False
+		elif oldtype == FILE_TYPE_ATTACHMENT:
+			return True
+		else:
+			return not (
+				oldname == newname
+				or oldname.ischild(newname)
+				or newname.ischild(oldname)
+			)
 
 	def touch_current_page_placeholder(self, path):
 		'''Create a placeholder for C{path} if the page does not
@@ -276,13 +414,16 @@ class IndexUpdateIter(SignalEmitter):
 		'commit': (None, None, ()),
 	}
 
-	def __init__(self, db, layout):
+	def __init__(self, db, layout, resolve_cache=None):
 		self.db = db
 		self.layout = layout
 		self.files = FilesIndexer(db, layout.root)
 		self.pages = PagesIndexer(db, layout, self.files)
-		self.links = LinksIndexer(db, self.pages, self.files)
+		if resolve_cache is not None:
+			resolve_cache.connect_to_indexer(self.pages)
+		self.links = LinksIndexer(db, self.pages, self.files, resolve_cache)
 		self.tags = TagsIndexer(db, self.pages, self.files)
+		self.fulltext = FullTextIndexer(db, self.pages)
 
 	def __call__(self):
 		return self
@@ -298,6 +439,24 @@ class IndexUpdateIter(SignalEmitter):
 			pass
 		self.emit('commit')
 
+	def parallel_update_iter(self, jobs, check=False):
+		'''Like iterating this object, but page source files are read
+		and parsed by a pool of worker processes. All updates of the
+		database are still done in the current process.
+		Intended for building a new index of a large notebook.
+		@param jobs: the number of worker processes
+		@param check: if C{True} iterate L{check_and_update_iter()}
+		instead, e.g. to continue an update that was interrupted
+		'''
+		parser = MultiProcessPageSourceParser(self.layout, jobs)
+		self.pages.parser = parser
+		try:
+			for i in (self.check_and_update_iter() if check else self):
+				yield
+		finally:
+			self.pages.parser = PageSourceParser(self.layout)
+			parser.close()
+
 	def check_and_update(self, file=None):
 		'''Convenience method to do a full update and check at once'''
 		for i in self.check_and_update_iter(file):
@@ -351,6 +510,14 @@ class BackgroundCheck(object):
 			self.running = False
 
 
+def on_watcher_out_of_date(notebook):
+	op = IndexUpdateOperation(notebook)
+	try:
+		op.run_on_idle()
+	except NotebookOperationOngoing:
+		pass # rows stay flagged, picked up by the next index update
+
+
 def on_out_of_date_found(notebook, background_check):
 	op = IndexUpdateOperation(notebook)
 	op.connect('finished', lambda *a: background_check.start()) # continue checking
@@ -1,6 +1,7 @@
 
 
 import os
+import time
 import logging
 
 logger = logging.getLogger('zim.notebook.index')
@@ -21,8 +22,8 @@ STATUS_NEED_UPDATE = 2
 TYPE_FOLDER = 1
 TYPE_FILE = 2
 
-from zim.newfs import File, Folder
-from zim.signals import SignalEmitter
+from zim.newfs import File, Folder, FilePath, FSObjectMonitor
+from zim.signals import SignalEmitter, ConnectorMixin
 
 
 class FilesIndexer(SignalEmitter):
@@ -34,6 +35,12 @@ class FilesIndexer(SignalEmitter):
 	@signal: C{file-row-inserted (row, file)}: on new file found
 	@signal: C{file-row-changed (row, file)}: on file content changed
 	@signal: C{file-row-deleted (row)}: on file deleted
+	@signal: C{file-row-moved (row, oldpath)}: on file or folder moved,
+	for a folder the paths of all children are updated as well, but the
+	signal is only emitted for the folder itself
+	@signal: C{file-rows-queued (rows)}: before updating a batch of
+	rows, gives the rows that will be updated next (rows have the
+	"id", "path" and "node_type" columns only)
 
 	'''
 
@@ -51,11 +58,17 @@ class FilesIndexer(SignalEmitter):
 		'file-row-inserted': (None, None, (object,)),
 		'file-row-changed': (None, None, (object,)),
 		'file-row-deleted': (None, None, (object,)),
+		'file-row-moved': (None, None, (object, object)),
+		'file-rows-queued': (None, None, (object,)),
 	}
 
+	BATCH_SIZE = 100 #: max number of rows to update in one transaction
+	BATCH_TIME = 0.5 #: max number of seconds for one transaction
+
 	def __init__(self, db, folder):
 		self.db = db
 		self.folder = folder
+		self.n_updated = 0 #: number of rows updated by the update iter
 
 		self.db.executescript('''
 		CREATE TABLE IF NOT EXISTS files(
@@ -68,6 +81,8 @@ class FilesIndexer(SignalEmitter):
 
 			index_status INTEGER DEFAULT 3
 		);
+		CREATE INDEX IF NOT EXISTS files_parent ON files(parent);
+		CREATE INDEX IF NOT EXISTS files_index_status ON files(index_status, node_type);
 		''')
 		row = self.db.execute('SELECT * FROM files WHERE id == 1').fetchone()
 		if row is None:
@@ -79,52 +94,98 @@ class FilesIndexer(SignalEmitter):
 			assert c.lastrowid == 1 # ensure we start empty
 
 	def update_iter(self):
-		'''Generator function for the actual update'''
+		'''Generator function for the actual update. Yields once for
+		each file or folder that is updated.
+		'''
 		self.emit('start-update')
+		start = time.time()
+		count = 0
 		for i in self._update_iter_inner():
+			count += 1
 			yield
 		self.emit('finish-update')
+		self.db.commit()
+
+		if count:
+			seconds = time.time() - start
+			logger.info(
+				'Indexed %i files in %.2fs (%.1f files/s)',
+				count, seconds, count / max(seconds, 0.001)
+			)
 
 	def _update_iter_inner(self, prefix=''):
 		# sort folders before files: first index structure, then contents
 		# this makes e.g. index links more efficient and robust
 		# sort by id to ensure parents are found before children
-		while True:
-			row = self.db.execute(
-				'SELECT id, path, node_type FROM files'
-				' WHERE index_status = ? AND path LIKE ?'
-				' ORDER BY node_type, id',
-				(STATUS_NEED_UPDATE, prefix + '%')
-			).fetchone()
+		#
+		# The queue is fetched in batches of BATCH_SIZE rows, and changes
+		# are committed once per BATCH_SIZE rows or BATCH_TIME seconds,
+		# whichever comes first. We still yield after each row.
+		n_rows = 0
+		t_start = time.time()
+		try:
+			while True:
+				rows = self.db.execute(
+					'SELECT id, path, node_type FROM files'
+					' WHERE index_status = ? AND path LIKE ?'
+					' ORDER BY node_type, id LIMIT ?',
+					(STATUS_NEED_UPDATE, prefix + '%', self.BATCH_SIZE)
+				).fetchall()
+
+				if not rows:
+					break
+				elif rows[0][2] == TYPE_FOLDER:
+					# Updating folders can queue new sub folders, these
+					# need to go before any files in the next batch
+					rows = [r for r in rows if r[2] == TYPE_FOLDER]
+
+				self.emit('file-rows-queued', rows)
+
+				for node_id, path, node_type in rows:
+					if not self._needs_update(node_id):
+						continue # updated or deleted as part of a previous row
+					#print ">> UPDATE", node_id, path, node_type
+
+					self._update_node(node_id, path, node_type)
+					self.n_updated += 1
+
+					n_rows += 1
+					if n_rows >= self.BATCH_SIZE \
+					or time.time() - t_start > self.BATCH_TIME:
+						self.db.commit()
+						n_rows = 0
+						t_start = time.time()
+
+					yield
+		finally:
+			self.db.commit()
 
-			if row:
-				node_id, path, node_type = row
-				#print ">> UPDATE", node_id, path, node_type
+	def _needs_update(self, node_id):
+		row = self.db.execute(
+			'SELECT index_status FROM files WHERE id = ?', (node_id,)
+		).fetchone()
+		return row is not None and row[0] == STATUS_NEED_UPDATE
+
+	def _update_node(self, node_id, path, node_type):
+		try:
+			if node_type == TYPE_FOLDER:
+				folder = self.folder.folder(path)
+				if folder.exists():
+					self.update_folder(node_id, folder)
+				else:
+					self.delete_folder(node_id)
 			else:
-				break
-
-			try:
-				if node_type == TYPE_FOLDER:
-					folder = self.folder.folder(path)
-					if folder.exists():
-						self.update_folder(node_id, folder)
-					else:
-						self.delete_folder(node_id)
+				file = self.folder.file(path)
+				if file.exists():
+					self.update_file(node_id, file)
 				else:
-					file = self.folder.file(path)
-					if file.exists():
-						self.update_file(node_id, file)
-					else:
-						self.delete_file(node_id)
-			except:
-				logger.exception('Error while indexing: %s', path)
-				self.db.execute( # avoid looping
-					'UPDATE files SET index_status = ? WHERE id = ?',
-					(STATUS_UPTODATE, node_id)
-				)
-
-			self.db.commit()
-			yield
+					self.delete_file(node_id)
+		except:
+			logger.exception('Error while indexing: %s', path)
+			self.db.execute( # avoid looping
+				'UPDATE files SET index_status = ? WHERE id = ?',
+				(STATUS_UPTODATE, node_id)
+			)
 
 	def interactive_add_file(self, file):
 		assert isinstance(file, File) and file.exists()
@@ -253,6 +314,45 @@ class FilesIndexer(SignalEmitter):
 		self.emit('file-row-deleted', row)
 		self.db.execute('DELETE FROM files WHERE id == ?', (node_id,))
 
+	def move_file(self, node_id, file):
+		'''Update the row for a file that was moved to a new location
+		@param node_id: the id of the row for the old location
+		@param file: a L{File} object for the new location
+		'''
+		self._move_node(node_id, file)
+
+	def move_folder(self, node_id, folder):
+		'''Update the rows for a folder, and all its children, that was
+		moved to a new location
+		@param node_id: the id of the row for the old location
+		@param folder: a L{Folder} object for the new location
+		'''
+		self._move_node(node_id, folder)
+
+	def _move_node(self, node_id, obj):
+		# Rows keep their id and mtime, so the contents are not
+		# indexed again
+		row = self.db.execute('SELECT * FROM files WHERE id=?', (node_id,)).fetchone()
+		oldpath = row['path']
+		path = obj.relpath(self.folder)
+		logger.debug('Move file: %s to %s', oldpath, path)
+
+		parent_id = self._add_parent(obj.parent())
+		if row['node_type'] == TYPE_FOLDER:
+			prefix = oldpath + os.path.sep
+			self.db.execute(
+				'UPDATE files SET path = ? || substr(path, ?) '
+				'WHERE substr(path, 1, ?) = ?',
+				(path + os.path.sep, len(prefix) + 1, len(prefix), prefix)
+			)
+		self.db.execute(
+			'UPDATE files SET path = ?, parent = ? WHERE id = ?',
+			(path, parent_id, node_id)
+		)
+
+		row = self.db.execute('SELECT * FROM files WHERE id=?', (node_id,)).fetchone()
+		self.emit('file-row-moved', row, oldpath)
+
 	def delete_folder(self, node_id):
 		for child_id, child_type in self.db.execute(
 			'SELECT id, node_type FROM files WHERE parent == ?',
@@ -274,7 +374,25 @@ class FilesIndexChecker(object):
 		self.db = db
 		self.folder = folder
 
-	def queue_check(self, file=None, recursive=True):
+	def queue_check(self, file=None, recursive=True, folders_only=False):
+		'''Flag files and folders to be checked by L{check_iter()}
+		@param file: the file or folder to check, if C{None} the whole
+		notebook folder is checked
+		@param recursive: if C{True} also check all children of a folder
+		@param folders_only: if C{True} only folders are flagged. The
+		files in a folder that changed are checked when the folder is
+		updated. This finds files that were added, removed, moved or
+		replaced, but not files that were modified in place.
+		'''
+		if folders_only:
+			assert file is None and recursive
+			self.db.execute(
+				'UPDATE files SET index_status = ? WHERE index_status < ? AND node_type = ?',
+				(STATUS_CHECK, STATUS_CHECK, TYPE_FOLDER)
+			)
+			self.db.commit()
+			return
+
 		if file is None:
 			file = self.folder
 		elif not (file == self.folder or file.ischild(self.folder)):
@@ -383,6 +501,175 @@ class FilesIndexChecker(object):
 
 
 
+class FilesIndexWatcher(ConnectorMixin, SignalEmitter):
+	'''Object that uses file system monitors to watch all folders in
+	the "files" table for changes. Changed paths are flagged with
+	C{STATUS_NEED_UPDATE}, so the next update picks them up without
+	the need to check all files with L{FilesIndexChecker}.
+
+	@signal: C{out-of-date ()}: emitted when paths have been flagged
+	for update
+
+	@ivar running: C{True} when the watcher is started
+	'''
+
+	__signals__ = {
+		'out-of-date': (None, None, ()),
+	}
+
+	def __init__(self, db, folder):
+		self.db = db
+		self.folder = folder
+		self.running = False
+		self._monitors = {}
+		self._indexer = None
+		self._queued = set()
+		self._resync = True
+
+	def connect_to_indexer(self, filesindexer):
+		'''Connect to the L{FilesIndexer} to know which folders are
+		updated, see L{update_monitors()}. Disconnects from the previous
+		indexer, if any.
+		@param filesindexer: a L{FilesIndexer}
+		'''
+		if self._indexer is not None:
+			self.disconnect_from(self._indexer)
+		self._indexer = filesindexer
+		self.connectto_all(filesindexer, ('file-rows-queued', 'file-row-moved'))
+		self._resync = True # e.g. index was flushed
+
+	def on_file_rows_queued(self, o, rows):
+		self._queued.update(r[1] for r in rows if r[2] == TYPE_FOLDER)
+
+	def on_file_row_moved(self, o, row, oldpath):
+		if row['node_type'] == TYPE_FOLDER:
+			self._resync = True # children moved as well
+
+	@property
+	def is_supported(self):
+		'''C{True} if file system monitors can be used for this
+		folder
+		'''
+		return FSObjectMonitor.is_supported(self.folder)
+
+	def start(self):
+		'''Start watching
+		@returns: C{True} if succesful, C{False} if file system
+		monitors are not supported
+		'''
+		if not self.is_supported:
+			return False
+
+		self.running = True
+		self.update_monitors()
+		return True
+
+	def stop(self):
+		'''Stop watching'''
+		self.running = False
+		for monitor in self._monitors.values():
+			self.disconnect_from(monitor)
+		self._monitors.clear()
+		self._resync = True
+
+	def update_monitors(self):
+		'''Ensure there is a monitor for each folder in the "files"
+		table. Called after each commit of the index update to pick up
+		new folders and drop removed ones. Only the folders that were
+		updated since the previous call are looked at, all folders are
+		only listed when the watcher starts, after a folder was moved,
+		or when connected to a new indexer.
+		'''
+		queued, self._queued = self._queued, set()
+		if not self.running:
+			return
+
+		if self._resync:
+			self._resync = False
+			paths = set(r[0] for r in self.db.execute(
+				'SELECT path FROM files WHERE node_type = ?', (TYPE_FOLDER,)
+			))
+			for path in set(self._monitors) - paths:
+				self._remove_monitor(path)
+		else:
+			paths = set()
+			for path in queued:
+				row = self.db.execute(
+					'SELECT id FROM files WHERE path = ? AND node_type = ?',
+					(path, TYPE_FOLDER)
+				).fetchone()
+				if row is not None:
+					paths.add(path)
+				else:
+					# Children of a removed folder are removed without
+					# being updated themselves
+					prefix = path + os.path.sep
+					for p in list(self._monitors):
+						if p == path or p.startswith(prefix):
+							self._remove_monitor(p)
+
+		for path in paths - set(self._monitors):
+			folder = self.folder if path == '.' else self.folder.folder(path)
+			monitor = FSObjectMonitor(folder)
+			self.connectto(monitor, 'changed', self.on_monitor_changed)
+			self._monitors[path] = monitor
+
+	def _remove_monitor(self, path):
+		self.disconnect_from(self._monitors.pop(path))
+
+	def on_monitor_changed(self, monitor, path, other_path):
+		flagged = False
+		for p in (path, other_path):
+			if p is not None:
+				try:
+					relpath = FilePath(p).relpath(self.folder)
+				except ValueError:
+					continue # outside notebook folder
+				flagged = self.flag_path(relpath) or flagged
+
+		if flagged:
+			self.db.commit()
+			self.emit('out-of-date')
+
+	def flag_path(self, path):
+		'''Flag a path for update if it does not match the index.
+		Paths that are not yet in the index cause their parent folder
+		to be flagged.
+		@param path: a path relative to the notebook folder
+		@returns: C{True} if a path was flagged
+		'''
+		row = self.db.execute(
+			'SELECT id, node_type, mtime, index_status FROM files WHERE path = ?',
+			(path or '.',)
+		).fetchone()
+		if row is None:
+			if not path or path == '.':
+				return False
+			parent = os.path.dirname(path) or '.'
+			return self.flag_path(parent) # recurs
+		elif row['index_status'] == STATUS_NEED_UPDATE:
+			return False
+
+		if row['node_type'] == TYPE_FOLDER:
+			obj = self.folder if path == '.' else self.folder.folder(path)
+		else:
+			obj = self.folder.file(path)
+
+		try:
+			uptodate = obj.mtime() == row['mtime']
+		except:
+			uptodate = False # e.g. file was removed
+
+		if uptodate:
+			return False # e.g. change was done by ourselves
+		else:
+			self.db.execute(
+				'UPDATE files SET index_status = ? WHERE id = ?',
+				(STATUS_NEED_UPDATE, row['id'])
+			)
+			return True
+
+
 class TestFilesDBTable(object):
 	# Mixin for test cases, defined here to have all SQL in one place
 
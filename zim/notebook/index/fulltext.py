@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017 Jaap Karssenberg <jaap.karssenberg@gmail.com>
+
+from __future__ import with_statement
+
+import struct
+import sqlite3
+import logging
+
+logger = logging.getLogger('zim.notebook.index')
+
+
+from .base import IndexerBase, IndexView
+from .pages import PageIndexRecord, ROOT_ID
+
+
+# The "fulltext" table is a sqlite FTS4 table that contains the text
+# of each page, the "docid" of each row is the id of the page in the
+# "pages" table. We use the "unicode61" tokenizer without removing
+# diacritics, this gives (case insensitive) tokens that are close to
+# the words matched by the regexes used by the search, see
+# L{zim.search.SearchSelection._content_regex()}. Terms that can not be
+# mapped exactly on tokens are not looked up in this table but still
+# require a full scan of the page contents.
+#
+# If the sqlite library does not support FTS4 or the tokenizer, the
+# table is not created and the view will report C{enabled = False}.
+# With the fallback tokenizer "_" splits words, the view reports this
+# with an empty C{tokenchars} attribute.
+
+
+_TOKENIZERS = (
+	'unicode61 "remove_diacritics=0" "tokenchars=_"',
+		# "_" is a word character for the regex "\w"
+	'unicode61 "remove_diacritics=0"',
+		# older sqlite versions do not support "tokenchars"
+)
+
+
+def _init_fulltext_table(db):
+	for tokenizer in _TOKENIZERS:
+		try:
+			db.execute(
+				'CREATE VIRTUAL TABLE IF NOT EXISTS fulltext '
+				'USING fts4(text, tokenize=%s)' % tokenizer
+			)
+		except sqlite3.OperationalError:
+			pass
+		else:
+			return True
+	else:
+		logger.info('No FTS4 support in sqlite - full text search disabled')
+		return False
+
+
+def _get_fulltext_table_sql(db):
+	row = db.execute(
+		'SELECT sql FROM sqlite_master WHERE type="table" and name="fulltext"'
+	).fetchone()
+	return row[0] if row else None
+
+
+class FullTextIndexer(IndexerBase):
+	'''Indexer for the "fulltext" table, keeps the text of each page
+	in a sqlite full text search table.
+
+	@ivar enabled: C{False} when the sqlite library does not support
+	full text search, in that case this indexer does nothing
+	'''
+
+	__signals__ = {}
+
+	def __init__(self, db, pagesindexer):
+		IndexerBase.__init__(self, db)
+		self.enabled = _init_fulltext_table(db)
+		if self.enabled:
+			self.connectto_all(pagesindexer, (
+				'page-changed', 'page-row-deleted'
+			))
+
+	def on_page_changed(self, o, row, doc):
+		self.db.execute('DELETE FROM fulltext WHERE docid=?', (row['id'],))
+		self.db.execute(
+			'INSERT INTO fulltext(docid, text) VALUES (?, ?)',
+			(row['id'], '\n'.join(doc.iter_text()))
+				# Join with newline so text segments of different
+				# elements never run together into a single token
+		)
+
+	def on_page_row_deleted(self, o, row):
+		self.db.execute('DELETE FROM fulltext WHERE docid=?', (row['id'],))
+
+
+class FullTextView(IndexView):
+	'''Index view that exposes the "fulltext" table in the index
+
+	@ivar enabled: C{False} when the index does not have a full text
+	table, in that case the methods of this view should not be used
+	@ivar tokenchars: C{"_"} when the tokenizer treats "_" as part of
+	a word, like the regex "\w" does, an empty string when the table
+	uses the fallback tokenizer that splits words on "_"
+	'''
+
+	def __init__(self, db):
+		IndexView.__init__(self, db)
+		sql = _get_fulltext_table_sql(db)
+		self.enabled = sql is not None
+		self.tokenchars = '_' if sql and 'tokenchars=_' in sql else ''
+
+	def list_pages(self):
+		'''Generator for all pages that have text in the index
+		@returns: yields L{PageIndexRecord} objects
+		'''
+		for row in self.db.execute(
+			'SELECT * FROM pages WHERE source_file IS NOT NULL and id<>?',
+			(ROOT_ID,)
+		):
+			yield PageIndexRecord(row)
+
+	def list_matching_pages(self, word, prefix=False):
+		'''Generator for pages that contain a word
+		@param word: a single word, must not contain whitespace or
+		punctuation
+		@param prefix: if C{True} also match words that start with
+		C{word}
+		@returns: yields 2-tuples of a L{PageIndexRecord} and the
+		number of occurences of the word in the page
+		'''
+		assert word and not '"' in word
+		query = '"%s*"' % word if prefix else '"%s"' % word
+		for row in self.db.execute(
+			'SELECT pages.*, matchinfo(fulltext, "x") AS matchinfo '
+			'FROM fulltext INNER JOIN pages ON fulltext.docid = pages.id '
+			'WHERE fulltext MATCH ?',
+			(query,)
+		):
+			# First integer of "x" is the number of hits in this row
+			count, = struct.unpack_from('=I', row['matchinfo'])
+			yield PageIndexRecord(row), count
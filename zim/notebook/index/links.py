@@ -64,19 +64,19 @@ class LinksIndexer(IndexerBase):
 
 	__signals__ = {}
 
-	def __init__(self, db, pagesindexer, filesindexer):
+	def __init__(self, db, pagesindexer, filesindexer, resolve_cache=None):
 		IndexerBase.__init__(self, db)
-		self._pages = PagesViewInternal(db)
+		self._pages = PagesViewInternal(db, resolve_cache)
 		self._pagesindexer = pagesindexer
 		self.connectto_all(pagesindexer, (
 			'page-row-inserted', 'page-row-changed', 'page-row-deleted',
-			'page-changed'
+			'page-row-moved', 'page-changed'
 		))
 		self.connectto(filesindexer,
 			'finish-update'
 		)
 
-		self.db.execute('''
+		self.db.executescript('''
 			CREATE TABLE IF NOT EXISTS links (
 				source INTEGER REFERENCES pages(id),
 				target INTEGER REFERENCES pages(id),
@@ -93,35 +93,62 @@ class LinksIndexer(IndexerBase):
 
 				CONSTRAINT uc_LinkOnce UNIQUE (source, rel, names)
 			);
+			CREATE INDEX IF NOT EXISTS links_target ON links(target);
+			CREATE INDEX IF NOT EXISTS links_anchorkey ON links(anchorkey);
+			CREATE INDEX IF NOT EXISTS links_needscheck ON links(needscheck);
 		''')
 
 	def on_page_changed(self, o, row, doc):
-		# Drop links for this page and add new ones (don't bother
-		# determining delta and updating).
-		self.db.execute(
-			'DELETE FROM links WHERE source=?',
-			(row['id'],)
+		# Only update the delta between the links in the index and the
+		# links in the new content. Links that did not change keep
+		# their row and target, they are flagged by the other handlers
+		# when they need to be resolved again. So saving a page without
+		# changing links does not resolve any link.
+		old = set(
+			(r['rel'], r['names']) for r in self.db.execute(
+				'SELECT rel, names FROM links WHERE source=?', (row['id'],)
+			)
 		)
-		pagename = Path(row['name'])
+		new = []
+		seen = set()
 		for href in doc.iter_href():
-			target_id, targetname = self._pages.resolve_link(pagename, href)
-			if target_id is None:
-				target_id = self._pagesindexer.insert_link_placeholder(targetname)
+			key = (href.rel, href.names)
+			if key not in seen:
+				seen.add(key)
+				if key not in old:
+					new.append(href)
+
+		removed = old - seen
+		if removed:
+			self.db.executemany(
+				'DELETE FROM links WHERE source=? and rel=? and names=?',
+				[(row['id'], rel, names) for rel, names in removed]
+			)
 
-			anchorkey = natural_sort_key(href.parts()[0])
-			self.db.execute(
+		if new:
+			pagename = Path(row['name'])
+			values = []
+			for href in new:
+				target_id, targetname = self._pages.resolve_link(pagename, href)
+				if target_id is None:
+					target_id = self._pagesindexer.insert_link_placeholder(targetname)
+
+				anchorkey = natural_sort_key(href.parts()[0])
+				values.append((row['id'], target_id, href.rel, href.names, anchorkey))
+
+			self.db.executemany(
 				'INSERT INTO links(source, target, rel, names, anchorkey) '
 				'VALUES (?, ?, ?, ?, ?)',
-				(row['id'], target_id, href.rel, href.names, anchorkey)
+				values
 			)
 
 	def on_page_row_inserted(self, o, row):
 		# Placeholders for pages of the same name need to be
 		# recalculated, flag links to be checked with same anchorkey.
-		self.db.execute( # TODO turn query into a JOIN
+		self.db.execute(
 			'UPDATE links SET needscheck=1 '
-			'WHERE rel=? and anchorkey=? and target in ( '
-			'	SELECT id FROM pages WHERE is_link_placeholder=1 '
+			'WHERE rel=? and anchorkey=? and EXISTS ( '
+			'	SELECT id FROM pages WHERE id=links.target and is_link_placeholder=1 '
 			')',
 			(HREF_REL_FLOATING, row['sortkey'])
 		)
@@ -143,6 +170,19 @@ class LinksIndexer(IndexerBase):
 			(ROOT_ID, row['id'],)
 		) # Need to link somewhere, if target is gone, use ROOT instead
 
+	def on_page_row_moved(self, o, row, oldrow):
+		# Links from and to the moved pages keep their rows, but are
+		# flagged to be checked. Links are resolved again from their
+		# text, so e.g. links to the old name will result in
+		# placeholders, just like for a page that was deleted.
+		prefix = row['name'] + ':'
+		self.db.execute(
+			'UPDATE links SET needscheck=1 '
+			'WHERE source IN (SELECT id FROM pages WHERE id=? OR substr(name, 1, ?)=?) '
+			'OR target IN (SELECT id FROM pages WHERE id=? OR substr(name, 1, ?)=?)',
+			(row['id'], len(prefix), prefix) * 2
+		)
+
 	def on_finish_update(self, o):
 		# Check for ghost links - warn but still clean them up
 		for row in self.db.execute('''
@@ -266,6 +306,25 @@ class LinksView(IndexView):
 
 		return c.fetchone()[0]
 
+	def list_hrefs(self, pagename):
+		'''Generator listing the links from a page together with the
+		link target as resolved by the index. Use this to find the
+		target of links in the page content without resolving them
+		again.
+		@param pagename: the L{Path} for the source page
+		@returns: yields 2-tuples of a L{HRef} and a L{Path} for the
+		target of the link
+		@raises IndexNotFoundError: if C{pagename} is not found in the
+		index
+		'''
+		page_id = self._pages.get_page_id(pagename) # can raise IndexNotFoundError
+		for row in self.db.execute(
+			'SELECT links.rel, links.names, pages.name '
+			'FROM links INNER JOIN pages ON links.target=pages.id '
+			'WHERE links.source=?', (page_id,)
+		):
+			yield HRef(row['rel'], row['names']), Path(row['name'])
+
 	def list_links_section(self, pagename, direction=LINK_DIR_FORWARD):
 		page_id = self._pages.get_page_id(pagename)
 		return self._list_links_section(page_id, pagename, direction)
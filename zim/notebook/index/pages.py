@@ -7,18 +7,21 @@ from __future__ import with_statement
 
 from datetime import datetime
 
+import time
 import logging
 
 logger = logging.getLogger('zim.notebook.index')
 
-from zim.utils import natural_sort_key
+from zim.utils import natural_sort_key, LRUCache
+from zim.signals import ConnectorMixin
 from zim.notebook.page import Path, HRef, \
 	HREF_REL_ABSOLUTE, HREF_REL_FLOATING, HREF_REL_RELATIVE
 from zim.tokenparser import TokenBuilder
 
-from zim.formats import ParseTreeBuilder
+from zim.formats import ParseTree, ParseTreeBuilder, get_format_module
 
 from .base import *
+from .files import TYPE_FOLDER
 
 
 from zim.notebook.layout import \
@@ -41,12 +44,105 @@ def emptyParseTree():
 	return b.get_parsetree()
 
 
+class PageSourceParser(object):
+	'''Object used by the L{PagesIndexer} to read and parse the source
+	files of pages.
+	'''
+
+	def __init__(self, layout):
+		self.layout = layout
+
+	def prefetch(self, files):
+		'''Hint that the given files will be parsed soon, does nothing
+		in this class
+		@param files: a list of L{File} objects
+		'''
+		pass
+
+	def parse(self, file):
+		'''Read and parse a page source file
+		@param file: a L{File} object
+		@returns: a L{ParseTree}
+		'''
+		format = self.layout.get_format(file)
+		return format.Parser().parse(file.read())
+
+	def close(self):
+		'''Release any resources held by this object'''
+		pass
+
+
+def _parse_page_source(filepath, formatname):
+	# Function executed in the worker processes of
+	# MultiProcessPageSourceParser - must be at module level to be
+	# pickled. Returns the tree serialized as XML because ParseTree
+	# objects can not be pickled.
+	from zim.newfs import LocalFile
+	format = get_format_module(formatname)
+	tree = format.Parser().parse(LocalFile(filepath).read())
+	return tree.tostring()
+
+
+class MultiProcessPageSourceParser(PageSourceParser):
+	'''Like L{PageSourceParser} but uses a pool of worker processes to
+	read and parse files that are passed to L{prefetch()}. The result is
+	still returned to the process calling L{parse()}, so all updates to
+	the database are done from one process.
+
+	Only files on the local file system are prefetched, for other files
+	this class behaves like L{PageSourceParser}.
+	'''
+
+	def __init__(self, layout, jobs):
+		'''Constructor
+		@param layout: a L{NotebookLayout}
+		@param jobs: the number of worker processes
+		'''
+		import multiprocessing
+		PageSourceParser.__init__(self, layout)
+		self._pool = multiprocessing.Pool(jobs)
+		self._pending = {}
+
+	def prefetch(self, files):
+		from zim.newfs import LocalFile
+		for file in files:
+			if isinstance(file, LocalFile) and not file.path in self._pending:
+				format = self.layout.get_format(file)
+				self._pending[file.path] = self._pool.apply_async(
+					_parse_page_source,
+					(file.path, format.__name__.rsplit('.', 1)[-1])
+				)
+
+	def parse(self, file):
+		result = self._pending.pop(file.path, None)
+		if result is not None:
+			try:
+				xml = result.get()
+			except:
+				# Parse again below to get a proper error
+				logger.debug('Error in worker process while parsing: %s', file)
+			else:
+				return ParseTree().fromstring(xml)
+
+		return PageSourceParser.parse(self, file)
+
+	def close(self):
+		self._pool.terminate()
+		self._pool.join()
+		self._pending.clear()
+
+
 class PagesIndexer(IndexerBase):
 	'''Indexer for the "pages" table.
 
 	@signal: C{page-row-inserted (row)}: new row inserted
 	@signal: C{page-row-changed (row, oldrow)}: row changed
 	@signal: C{page-row-deleted (row)}: row to be deleted
+	@signal: C{page-row-moving (row)}: row, and all its children, to be
+	moved
+	@signal: C{page-row-moved (row, oldrow)}: row, and all its children,
+	moved to a new name; the rows keep their id, so data that refers
+	to the id of the page does not need to be updated
 
 	@signal: C{page-changed (row, content)}: page contents changed
 	'''
@@ -55,14 +151,20 @@ class PagesIndexer(IndexerBase):
 		'page-row-inserted': (None, None, (object,)),
 		'page-row-changed': (None, None, (object, object)),
 		'page-row-deleted': (None, None, (object,)),
+		'page-row-moving': (None, None, (object,)),
+		'page-row-moved': (None, None, (object, object)),
 		'page-changed': (None, None, (object, object))
 	}
 
 	def __init__(self, db, layout, filesindexer):
 		IndexerBase.__init__(self, db)
 		self.layout = layout
+		self.parser = PageSourceParser(layout)
+		self.n_parsed = 0 #: number of page sources parsed
+		self.parse_time = 0.0 #: seconds spent waiting for the parser
 		self.connectto_all(filesindexer, (
-			'file-row-inserted', 'file-row-changed', 'file-row-deleted'
+			'file-row-inserted', 'file-row-changed', 'file-row-deleted',
+			'file-row-moved', 'file-rows-queued'
 		))
 
 		self.db.executescript('''
@@ -78,7 +180,10 @@ class PagesIndexer(IndexerBase):
 				source_file INTEGER REFERENCES files(id),
 				is_link_placeholder BOOLEAN DEFAULT 0
 			);
-			CREATE UNIQUE INDEX IF NOT EXISTS pages_name ON pages(name)
+			CREATE UNIQUE INDEX IF NOT EXISTS pages_name ON pages(name);
+			CREATE INDEX IF NOT EXISTS pages_parent ON pages(parent, sortkey, name);
+			CREATE INDEX IF NOT EXISTS pages_sortkey ON pages(sortkey, name);
+			CREATE INDEX IF NOT EXISTS pages_source_file ON pages(source_file);
 		''')
 		row = self.db.execute('SELECT * FROM pages WHERE id == 1').fetchone()
 		if row is None:
@@ -130,22 +235,37 @@ class PagesIndexer(IndexerBase):
 
 		if row['source_file'] == filerow['id']:
 			file = self.layout.root.file(filerow['path'])
-			format = self.layout.get_format(file)
 			mtime = file.mtime()
-			tree = format.Parser().parse(file.read())
+			start = time.time()
+			tree = self.parser.parse(file)
+			self.parse_time += time.time() - start
+			self.n_parsed += 1
 			self.update_page(pagename, mtime, tree)
 		else:
 			pass # some conflict file changed
 
+	def on_file_rows_queued(self, o, filerows):
+		files = []
+		for filerow in filerows:
+			pagename, file_type = self.layout.map_filepath(filerow['path'])
+			if file_type == FILE_TYPE_PAGE_SOURCE:
+				files.append(self.layout.root.file(filerow['path']))
+
+		if files:
+			self.parser.prefetch(files)
+
 	def on_file_row_deleted(self, o, filerow):
 		pagename, file_type = self.layout.map_filepath(filerow['path'])
 		if file_type != FILE_TYPE_PAGE_SOURCE:
 			return # nothing to do
 
+		self._delete_page_source(pagename, filerow['id'])
+
+	def _delete_page_source(self, pagename, file_id):
 		row = self._select(pagename)
 		assert row is not None
 
-		if row['source_file'] == filerow['id']:
+		if row['source_file'] == file_id:
 			if row['n_children'] > 0:
 				self.db.execute(
 					'UPDATE pages SET source_file=?, mtime=? WHERE name=?',
@@ -163,6 +283,131 @@ class PagesIndexer(IndexerBase):
 		else:
 			raise NotImplemented # some conflict removed
 
+	def on_file_row_moved(self, o, filerow, oldpath):
+		if filerow['node_type'] == TYPE_FOLDER:
+			# The pages in the folder are the children of the page
+			# that maps to the folder, the page itself does not move
+			oldname = self._map_folder(oldpath)
+			newname = self._map_folder(filerow['path'])
+			row = self._select(oldname)
+			if row is not None:
+				for child in self.db.execute(
+					'SELECT name FROM pages WHERE parent=?', (row['id'],)
+				).fetchall():
+					child = Path(child['name'])
+					self.move_page(child, newname + child.basename)
+		else:
+			oldname, file_type = self.layout.map_filepath(oldpath)
+			if file_type != FILE_TYPE_PAGE_SOURCE:
+				return # nothing to do
+
+			newname, file_type = self.layout.map_filepath(filerow['path'])
+			row = self._select(oldname)
+			if row is not None \
+			and row['source_file'] == filerow['id'] \
+			and not self._has_children_with_source(oldname):
+				self.move_page(oldname, newname)
+			else:
+				# Children do not move with the page, fall back to
+				# removing and inserting the page
+				if row is not None:
+					self._delete_page_source(oldname, filerow['id'])
+				self.on_file_row_inserted(o, filerow)
+				self.on_file_row_changed(o, filerow)
+
+	def _map_folder(self, path):
+		# The page for a folder is the page that has the source file
+		# with the same name
+		pagename, file_type = \
+			self.layout.map_filepath(path + self.layout.default_extension)
+		return pagename
+
+	def _has_children_with_source(self, pagename):
+		prefix = pagename.name + ':'
+		row = self.db.execute(
+			'SELECT id FROM pages WHERE substr(name, 1, ?)=? '
+			'AND source_file IS NOT NULL LIMIT 1',
+			(len(prefix), prefix)
+		).fetchone()
+		return row is not None
+
+	def move_page(self, oldname, newname):
+		'''Move the row for a page, and the rows of all its children, to
+		a new name. Rows keep their id, only the name, sortkey and parent
+		are updated. If rows exist already for the new names, they are
+		merged with the rows that are moved, one of the two must be a
+		placeholder or a namespace without source.
+		@param oldname: the L{Path} of the page to move
+		@param newname: the new L{Path}, can not be a child or a parent
+		of C{oldname}
+		'''
+		assert not (newname == oldname
+			or newname.ischild(oldname) or oldname.ischild(newname))
+		row = self._select(oldname)
+		assert row is not None
+
+		existing = self._select(newname)
+		if existing is not None:
+			# Merge children first, the row itself can only move if it
+			# has no children left
+			for child in self.db.execute(
+				'SELECT name FROM pages WHERE parent=?', (row['id'],)
+			).fetchall():
+				child = Path(child['name'])
+				self.move_page(child, newname + child.basename) # recurs
+
+			row = self._select(oldname)
+			if row is None:
+				return # cleaned up after moving the last child
+			elif row['source_file'] is None:
+				# The existing row takes the place of this row
+				if row['n_children'] == 0:
+					self.remove_page(oldname)
+				return
+			elif existing['source_file'] is not None:
+				raise AssertionError('Page exists: %s' % newname)
+
+		parent_row = self._select(newname.parent)
+		if parent_row is None:
+			self._insert_page(newname.parent, bool(row['is_link_placeholder']))
+			parent_row = self._select(newname.parent)
+
+		self.emit('page-row-moving', row)
+
+		if existing is None:
+			# Children keep their parent and sortkey
+			oldprefix = oldname.name + ':'
+			self.db.execute(
+				'UPDATE pages SET name = ? || substr(name, ?) '
+				'WHERE substr(name, 1, ?) = ?',
+				(newname.name + ':', len(oldprefix) + 1, len(oldprefix), oldprefix)
+			)
+		else:
+			# Replace the existing namespace or placeholder
+			self.db.execute(
+				'UPDATE pages SET parent=? WHERE parent=?',
+				(row['id'], existing['id'])
+			)
+			self.emit('page-row-deleted', existing)
+			self.db.execute('DELETE FROM pages WHERE id=?', (existing['id'],))
+			self.db.execute(
+				'UPDATE pages SET n_children = '
+				'(SELECT COUNT(*) FROM pages AS c WHERE c.parent = pages.id) '
+				'WHERE id=?',
+				(row['id'],)
+			)
+
+		self.db.execute(
+			'UPDATE pages SET name=?, sortkey=?, parent=? WHERE id=?',
+			(newname.name, natural_sort_key(newname.basename),
+				parent_row['id'], row['id'])
+		)
+
+		self.update_parent(newname.parent)
+		newrow = self._select(newname)
+		self.emit('page-row-moved', newrow, row)
+		self.update_parent(oldname.parent)
+
 	def insert_page(self, pagename, file_id):
 		return self._insert_page(pagename, False, file_id)
 
@@ -296,13 +541,125 @@ class PageIndexRecord(Path):
 		return not self._row['is_link_placeholder']
 
 
+class LinkResolverCache(ConnectorMixin):
+	'''Cache for the results of L{PagesViewInternal.resolve_link()}
+
+	The result of resolving a link only depends on the source page (or
+	for floating links only on the namespace of the source page) and
+	on the pages in the index with a matching "sortkey" for one of the
+	parts of the source page name and link. So cached results are
+	dropped selectively when a page row with such a sortkey is inserted
+	or deleted, or changes between placeholder and real page.
+
+	Connect the cache to a L{PagesIndexer} with L{connect_to_indexer()}
+	to keep it up to date. When pages are moved, the whole cache is
+	cleared.
+
+	@ivar hits: number of lookups that were found in the cache
+	@ivar misses: number of lookups that needed to be resolved
+	'''
+
+	def __init__(self, max_size=2000):
+		'''Constructor
+		@param max_size: the maximum number of results to keep
+		'''
+		self.max_size = max_size
+		self.hits = 0
+		self.misses = 0
+		self.clear()
+
+	def connect_to_indexer(self, pagesindexer):
+		'''Start listening to signals from a L{PagesIndexer},
+		disconnects from the previous one and clears the cache.
+		'''
+		self.disconnect_all()
+		self.clear()
+		self.connectto_all(pagesindexer, (
+			'page-row-inserted', 'page-row-changed', 'page-row-deleted',
+			'page-row-moved'
+		))
+
+	def clear(self):
+		'''Drop all cached results'''
+		self._results = LRUCache(self.max_size)
+		self._deps = {} # sortkey -> set of cache keys
+		self._n_deps = 0
+
+	def stats(self):
+		'''Returns a dict with the number of hits, misses and cached
+		results and the hit rate'''
+		total = self.hits + self.misses
+		return {
+			'hits': self.hits,
+			'misses': self.misses,
+			'size': len(self._results),
+			'hit_rate': float(self.hits) / total if total else 0.0,
+		}
+
+	def lookup(self, key):
+		'''Get a cached result
+		@raises KeyError: when C{key} is not in the cache
+		'''
+		try:
+			result = self._results[key][0]
+		except KeyError:
+			self.misses += 1
+			raise
+		else:
+			self.hits += 1
+			return result
+
+	def store(self, key, sortkeys, result):
+		'''Cache a result
+		@param key: the cache key
+		@param sortkeys: sortkeys of pages the result depends on
+		@param result: the result to cache
+		'''
+		self._results[key] = (result, sortkeys)
+		for sortkey in sortkeys:
+			self._deps.setdefault(sortkey, set()).add(key)
+		self._n_deps += 1
+		if self._n_deps > 4 * self.max_size:
+			# Drop references to results that were evicted already
+			self._deps = {}
+			self._n_deps = 0
+			for k in self._results.keys():
+				for sortkey in self._results[k][1]:
+					self._deps.setdefault(sortkey, set()).add(k)
+				self._n_deps += 1
+
+	def invalidate(self, sortkey):
+		'''Drop all results that depend on pages with C{sortkey}'''
+		for key in self._deps.pop(sortkey, ()):
+			self._results.pop(key)
+
+	def on_page_row_inserted(self, o, row):
+		self.invalidate(row['sortkey'])
+
+	def on_page_row_changed(self, o, newrow, oldrow):
+		if bool(newrow['is_link_placeholder']) != bool(oldrow['is_link_placeholder']):
+			self.invalidate(newrow['sortkey'])
+
+	def on_page_row_deleted(self, o, row):
+		self.invalidate(row['sortkey'])
+
+	def on_page_row_moved(self, o, row, oldrow):
+		self.clear() # Child pages are renamed without signals
+
+
 class PagesViewInternal(object):
 	'''This class defines private methods used by L{PagesView},
 	L{LinksView}, L{TagsView} and others.
 	'''
 
-	def __init__(self, db):
+	def __init__(self, db, cache=None):
+		'''Constructor
+		@param db: a C{sqlite3.Connection}
+		@param cache: optional L{LinkResolverCache} for L{resolve_link()},
+		only use a cache that is connected to the indexer for C{db}
+		'''
 		self.db = db
+		self.cache = cache
 
 	def get_pagename(self, page_id):
 		row = self.db.execute(
@@ -321,6 +678,34 @@ class PagesViewInternal(object):
 		return row['id']
 
 	def resolve_link(self, source, href, ignore_link_placeholders=True):
+		if self.cache is None:
+			return self._resolve_link(source, href, ignore_link_placeholders)
+
+		# Floating links resolve the same for all pages in a namespace,
+		# absolute links for all pages. But when the source is not in
+		# the index the result depends on the names of the source and
+		# parents that are missing, so then use the source name.
+		if href.rel == HREF_REL_ABSOLUTE or source.isroot:
+			key = ('', HREF_REL_ABSOLUTE, href.names)
+		elif href.rel == HREF_REL_FLOATING:
+			try:
+				self.get_page_id(source)
+			except IndexNotFoundError:
+				key = (source.name, href.rel, href.names, ignore_link_placeholders)
+			else:
+				key = (source.parent.name, href.rel, href.names, ignore_link_placeholders)
+		else:
+			key = (source.name, href.rel, href.names)
+
+		try:
+			return self.cache.lookup(key)
+		except KeyError:
+			result = self._resolve_link(source, href, ignore_link_placeholders)
+			sortkeys = set(map(natural_sort_key, source.parts + href.parts()))
+			self.cache.store(key, sortkeys, result)
+			return result
+
+	def _resolve_link(self, source, href, ignore_link_placeholders=True):
 		if href.rel == HREF_REL_ABSOLUTE or source.isroot:
 			return self.resolve_pagename(ROOT_PATH, href.parts())
 
@@ -481,9 +866,20 @@ class PagesViewInternal(object):
 class PagesView(IndexView):
 	'''Index view that exposes the "pages" table in the index'''
 
-	def __init__(self, db):
+	MAX_QUERY_VARIABLES = 500 #: max number of names per query, sqlite has a limit of 999 variables
+
+	@classmethod
+	def new_from_index(cls, index):
+		return cls(index._db, index.resolve_cache)
+
+	def __init__(self, db, resolve_cache=None):
+		'''Constructor
+		@param db: a C{sqlite3.Connection}
+		@param resolve_cache: optional L{LinkResolverCache}, see
+		L{PagesViewInternal}
+		'''
 		IndexView.__init__(self, db)
-		self._pages = PagesViewInternal(db)
+		self._pages = PagesViewInternal(db, resolve_cache)
 
 	def lookup_by_pagename(self, pagename):
 		r = self.db.execute(
@@ -494,6 +890,23 @@ class PagesView(IndexView):
 		else:
 			return PageIndexRecord(r)
 
+	def lookup_by_pagenames(self, pagenames):
+		'''Like L{lookup_by_pagename()} but for many pages at once
+		@param pagenames: a list of L{Path} objects
+		@returns: a dict mapping page names to L{PageIndexRecord}
+		objects, pages that are not found in the index are left out
+		'''
+		records = {}
+		names = [p.name for p in pagenames]
+		for i in range(0, len(names), self.MAX_QUERY_VARIABLES):
+			batch = names[i:i + self.MAX_QUERY_VARIABLES]
+			for r in self.db.execute(
+				'SELECT * FROM pages WHERE name IN (%s)' % ', '.join('?' * len(batch)),
+				batch
+			):
+				records[r['name']] = PageIndexRecord(r)
+		return records
+
 	def list_pages(self, path=None):
 		'''Generator for child pages of C{path}
 		@param path: a L{Path} object
@@ -744,7 +1157,8 @@ class PagesTreeModelMixin(TreeModelMixinBase):
 
 	def connect_to_updateiter(self, index, update_iter):
 		self.connectto_all(update_iter.pages,
-			('page-row-inserted', 'page-row-changed', 'page-row-deleted')
+			('page-row-inserted', 'page-row-changed', 'page-row-deleted',
+			'page-row-moving', 'page-row-moved')
 		)
 
 	def on_page_row_inserted(self, o, row):
@@ -775,6 +1189,30 @@ class PagesTreeModelMixin(TreeModelMixinBase):
 				self._check_parent_has_child_toggled(treepath)
 			self.emit('row-deleted', treepath)
 
+	def on_page_row_moving(self, o, row):
+		# Same as delete, but the row keeps existing in the index
+		self.on_page_row_deleted(o, row)
+
+	def on_page_row_moved(self, o, row, oldrow):
+		self.on_page_row_inserted(o, row)
+		if row['n_children'] > 0:
+			for treepath in self._find_all_pages(row['name']):
+				self._emit_children_inserted(row['id'], treepath)
+
+	def _emit_children_inserted(self, pageid, treepath):
+		treeiter = self.get_iter(treepath) # not mytreeiter !
+		self.emit('row-has-child-toggled', treepath, treeiter)
+		for row in self.db.execute(
+			'SELECT id, name, n_children FROM pages WHERE parent = ?',
+			(pageid,)
+		):
+			for childtreepath in self._find_all_pages(row['name']):
+				if childtreepath[:-1] == treepath:
+					treeiter = self.get_iter(childtreepath) # not mytreeiter !
+					self.emit('row-inserted', childtreepath, treeiter)
+					if row['n_children'] > 0:
+						self._emit_children_inserted(row['id'], childtreepath) # recurs
+
 	def n_children_top(self):
 		return self.db.execute(
 			'SELECT COUNT(*) FROM pages WHERE parent=?', (ROOT_ID,)
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017 Jaap Karssenberg <jaap.karssenberg@gmail.com>
+
+'''This module defines an object to collect statistics while running
+an index update, see L{IndexUpdateStats}.
+'''
+
+import time
+import logging
+
+logger = logging.getLogger('zim.notebook.index')
+
+
+from .files import STATUS_NEED_UPDATE
+
+
+INDEXER_NAMES = ('files', 'pages', 'links', 'tags', 'fulltext', 'plugins', 'other')
+
+
+def _indexer_name(handler, emitter):
+	# Map a signal handler to the name of the indexer it belongs to,
+	# based on the module that defines the object of a bound method
+	obj = getattr(handler, '__self__', None)
+	if obj is None:
+		module = getattr(handler, '__module__', None) or type(emitter).__module__
+	else:
+		module = type(obj).__module__
+
+	if module.startswith('zim.notebook.index.'):
+		name = module.rsplit('.', 1)[-1]
+		return name if name in INDEXER_NAMES else 'other'
+	elif module.startswith('zim.plugins.'):
+		return 'plugins'
+	else:
+		return 'other'
+
+
+class IndexUpdateStats(object):
+	'''Runs an index update and collects statistics on where the time
+	goes. The indexers are only connected to each other by signals, so
+	the time spent in each indexer is measured by timing the signal
+	handlers of the indexers while the update runs, using
+	L{SignalEmitter.set_signal_hook()}. Time spent in a handler that
+	is called from a handler of another indexer is only counted for
+	the inner handler. Time not spent in any handler is
+	counted for the "files" indexer, which drives the update.
+
+	Usage::
+
+		stats = IndexUpdateStats(index.update_iter)
+		result = stats.run(index.update_iter.check_and_update_iter())
+
+	@ivar progress_interval: seconds between calls to the C{progress}
+	callback of L{run()}
+	'''
+
+	def __init__(self, update_iter, progress_interval=5.0):
+		'''Constructor
+		@param update_iter: the L{IndexUpdateIter} of the index
+		@param progress_interval: seconds between progress updates
+		'''
+		self.update_iter = update_iter
+		self.progress_interval = progress_interval
+		self._seconds = dict((n, 0.0) for n in INDEXER_NAMES)
+		self._rows = dict((n, 0) for n in INDEXER_NAMES)
+		self._stack = []
+
+	def _emitters(self):
+		u = self.update_iter
+		return (u, u.files, u.pages, u.links, u.tags, u.fulltext)
+
+	def _install(self):
+		for emitter in self._emitters():
+			emitter.set_signal_hook(self._call_handler)
+
+	def _uninstall(self):
+		for emitter in self._emitters():
+			emitter.set_signal_hook(None)
+
+	def _call_handler(self, handler, emitter, *args):
+		name = _indexer_name(handler, emitter)
+		db = self.update_iter.db
+		stack = self._stack
+		stack.append([0.0, 0]) # time and rows in nested handlers
+		start = time.time()
+		rows = db.total_changes
+		try:
+			return handler(emitter, *args)
+		finally:
+			seconds = time.time() - start
+			rows = db.total_changes - rows
+			nested = stack.pop()
+			self._seconds[name] += seconds - nested[0]
+			self._rows[name] += rows - nested[1]
+			if stack:
+				stack[-1][0] += seconds
+				stack[-1][1] += rows
+
+	def count_pending(self):
+		'''Returns the number of files and folders that are flagged to
+		be updated in the index
+		'''
+		return self.update_iter.db.execute(
+			'SELECT count(*) FROM files WHERE index_status=?',
+			(STATUS_NEED_UPDATE,)
+		).fetchone()[0]
+
+	def run(self, iterator, progress=None):
+		'''Run an index update
+		@param iterator: the update iterator, e.g. as returned by
+		L{IndexUpdateIter.check_and_update_iter()}
+		@param progress: a callback function that is called every
+		C{progress_interval} seconds with a dict with the keys "done",
+		"pending", "files_per_second" and "eta" (in seconds, or
+		C{None} if unknown)
+		@returns: a dict with statistics, with keys:
+		  - C{seconds}: total time
+		  - C{files}: number of files and folders updated
+		  - C{files_per_second}
+		  - C{rows_written}: number of database rows inserted,
+		    updated or deleted
+		  - C{pages_parsed}: number of page sources parsed
+		  - C{parse_seconds}: time spent waiting for the parser
+		  - C{indexers}: a dict that gives for each indexer a dict with
+		    C{seconds} and C{rows_written}
+		'''
+		db = self.update_iter.db
+		files = self.update_iter.files
+		pages = self.update_iter.pages
+		n_updated, n_parsed, parse_time = files.n_updated, pages.n_parsed, pages.parse_time
+		rows = db.total_changes
+
+		self._install()
+		start = last_progress = time.time()
+		try:
+			for i in iterator:
+				if progress and time.time() - last_progress > self.progress_interval:
+					last_progress = time.time()
+					progress(self._progress_info(files.n_updated - n_updated, start))
+		finally:
+			self._uninstall()
+
+		seconds = time.time() - start
+		rows = db.total_changes - rows
+		n_updated = files.n_updated - n_updated
+		self._seconds['files'] += max(0.0, seconds - sum(self._seconds.values()))
+		self._rows['files'] += max(0, rows - sum(self._rows.values()))
+
+		return {
+			'seconds': seconds,
+			'files': n_updated,
+			'files_per_second': n_updated / max(seconds, 0.001),
+			'rows_written': rows,
+			'pages_parsed': pages.n_parsed - n_parsed,
+			'parse_seconds': pages.parse_time - parse_time,
+			'indexers': dict(
+				(name, {'seconds': self._seconds[name], 'rows_written': self._rows[name]})
+					for name in INDEXER_NAMES
+			),
+		}
+
+	def _progress_info(self, done, start):
+		pending = self.count_pending()
+		rate = done / max(time.time() - start, 0.001)
+		return {
+			'done': done,
+			'pending': pending,
+			'files_per_second': rate,
+			'eta': pending / rate if rate > 0 else None,
+		}
@@ -78,6 +78,8 @@ class TagsIndexer(IndexerBase):
 
 				CONSTRAINT uc_TagSourceOnce UNIQUE (source, tag)
 			);
+			CREATE INDEX IF NOT EXISTS tags_sortkey ON tags(sortkey);
+			CREATE INDEX IF NOT EXISTS tagsources_tag ON tagsources(tag);
 		''')
 
 	def on_page_changed(self, pagesindexer, pagerow, doc):
@@ -315,23 +317,10 @@ class TagsTreeModelBase(PagesTreeModelMixin):
 		else:
 			self._tagquery = ' in %s' % (self._tagids,)
 
-	def _emit_children_inserted(self, pageid, treepath):
-		treeiter = self.get_iter(treepath) # not mytreeiter !
-		self.emit('row-has-child-toggled', treepath, treeiter)
-		for row in self.db.execute(
-			'SELECT id, name, n_children FROM pages WHERE parent = ?',
-			(pageid,)
-		):
-			for childtreepath in self._find_all_pages(row['name']):
-				if childtreepath[:-1] == treepath:
-					treeiter = self.get_iter(childtreepath) # not mytreeiter !
-					self.emit('row-inserted', childtreepath, treeiter)
-					if row['n_children'] > 0:
-						self._emit_children_inserted(row['id'], childtreepath) # recurs
-
 	def connect_to_updateiter(self, index, update_iter):
 		self.connectto_all(update_iter.pages,
-			('page-row-inserted', 'page-row-changed', 'page-row-deleted')
+			('page-row-inserted', 'page-row-changed', 'page-row-deleted',
+			'page-row-moving', 'page-row-moved')
 		)
 		self.connectto_all(update_iter.tags,
 			('tag-row-inserted', 'tag-row-deleted', 'tag-added-to-page', 'tag-removed-from-page')
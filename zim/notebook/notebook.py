@@ -7,6 +7,7 @@ from __future__ import with_statement
 
 import os
 import re
+import time
 import weakref
 import logging
 import threading
@@ -20,11 +21,12 @@ import zim.formats
 
 from zim.fs import File, Dir
 from zim.newfs import LocalFolder
-from zim.config import INIConfigFile, String, ConfigDefinitionByClass, Boolean, Choice
+from zim.config import INIConfigFile, String, ConfigDefinitionByClass, Boolean, Choice, Float
 from zim.errors import Error, TrashNotSupportedError
 from zim.config import HierarchicDict
 from zim.parsing import is_interwiki_keyword_re, link_type, is_win32_path_re
 from zim.signals import ConnectorMixin, SignalEmitter, SIGNAL_NORMAL
+from zim.utils import OrderedDict, LRUCache
 
 from .operations import notebook_state, NOOP, SimpleAsyncOperation, ongoing_operation
 from .page import Path, Page, HRef, HREF_REL_ABSOLUTE, HREF_REL_FLOATING
@@ -32,6 +34,10 @@ from .index import IndexNotFoundError, LINK_DIR_BACKWARD
 
 DATA_FORMAT_VERSION = (0, 4)
 
+CHECK_ALWAYS = 'always' #: check pages for changes on disk on every lookup
+CHECK_INTERVAL = 'interval' #: check pages at most once per interval
+CHECK_NOTIFY = 'notify' #: check pages only when a change was reported
+
 
 class NotebookConfig(INIConfigFile):
 	'''Wrapper for the X{notebook.zim} file'''
@@ -55,6 +61,8 @@ class NotebookConfig(INIConfigFile):
 			('endofline', Choice(endofline, set(('dos', 'unix')))),
 			('disable_trash', Boolean(False)),
 			('profile', String(None)),
+			('page_check', Choice(CHECK_ALWAYS, (CHECK_ALWAYS, CHECK_INTERVAL, CHECK_NOTIFY))),
+			('page_check_interval', Float(2.0)),
 		))
 
 
@@ -146,6 +154,161 @@ def assert_index_uptodate(method):
 	return wrapper
 
 
+def _replace_first(replacefuncs, elt):
+	# Replace function for ParseTree.replace() that combines several
+	# replace functions, the first one that does not skip the element
+	# gives the replacement
+	for func in replacefuncs:
+		try:
+			return func(elt)
+		except zim.formats.VisitorSkip:
+			pass
+	raise zim.formats.VisitorSkip
+
+
+def _write_page_lines(job):
+	# Helper for Notebook._store_pages_iter(), runs in a worker thread
+	page, lines = job
+	page._write_lines(lines)
+	return page
+
+
+class PageChangeChecker(ConnectorMixin):
+	'''Decides when a cached L{Page} object should check whether its
+	source file changed on disk. Each check costs one or more stat
+	calls on the source file, which adds up for frequent lookups and
+	on network file systems.
+
+	Supports three modes:
+	  - C{CHECK_ALWAYS}: check on every lookup (default)
+	  - C{CHECK_INTERVAL}: check a page at most once per C{interval}
+	    seconds, for platforms without file watcher
+	  - C{CHECK_NOTIFY}: only check pages for which a change was
+	    reported with L{notify()}, e.g. by a file watcher or by the
+	    index background check
+
+	The mode is set with the "page_check" and "page_check_interval"
+	keys in the notebook config.
+
+	@ivar mode: the check mode
+	@ivar interval: the interval in seconds for C{CHECK_INTERVAL}
+	@ivar checks: number of checks done
+	@ivar skipped: number of checks skipped
+	'''
+
+	def __init__(self, mode=CHECK_ALWAYS, interval=2.0, page_cache=None):
+		'''Constructor
+		@param mode: the check mode
+		@param interval: the interval in seconds for C{CHECK_INTERVAL}
+		@param page_cache: the dict with cached pages of the notebook,
+		if given only changes for pages in this cache are remembered
+		'''
+		assert mode in (CHECK_ALWAYS, CHECK_INTERVAL, CHECK_NOTIFY)
+		self.mode = mode
+		self.interval = interval
+		self._page_cache = page_cache
+		self._pagesindexer = None
+		self._last_check = LRUCache(1000)
+		self._changed = set()
+		self.reset_stats()
+
+	def connect_to_index(self, index):
+		'''Connect to the index to get notified of pages that changed
+		on disk when they are indexed, e.g. by the background check.
+		Also follows the index when it is flushed and gets a new
+		update iter.
+		'''
+		self.connectto(index, 'new-update-iter', self.on_new_update_iter)
+		self.on_new_update_iter(index, index.update_iter)
+
+	def on_new_update_iter(self, index, update_iter):
+		if self._pagesindexer is not None:
+			self.disconnect_from(self._pagesindexer)
+		self._pagesindexer = update_iter.pages
+		self.connectto_all(update_iter.pages, ('page-changed', 'page-row-deleted'))
+
+	def on_page_changed(self, o, row, content):
+		self.notify(row['name'])
+
+	def on_page_row_deleted(self, o, row):
+		self.notify(row['name'])
+
+	def notify(self, name):
+		'''Report a page that may have changed on disk. Ignored
+		unless the mode is C{CHECK_NOTIFY}.
+		@param name: the page name
+		'''
+		if self.mode == CHECK_NOTIFY:
+			if self._page_cache is None or name in self._page_cache:
+				self._changed.add(name)
+			# else a new page object is created on the next lookup,
+			# which reads the source file anyway
+
+	def check(self, page):
+		'''Let C{page} check its source file if needed by the current
+		mode. Emits "page-changed" on the page when it changed on disk.
+		@param page: a L{Page} object
+		'''
+		if self.mode == CHECK_NOTIFY:
+			if page.name not in self._changed:
+				self.skipped += 1
+				return
+		elif self.mode == CHECK_INTERVAL:
+			now = time.time()
+			last = self._last_check.get(page.name)
+			if last is not None and now - last < self.interval:
+				self.skipped += 1
+				return
+			self._last_check[page.name] = now
+
+		self._changed.discard(page.name)
+		self.checks += 1
+		page._check_source_etag()
+
+	def stats(self):
+		'''Returns a dict with the number of checks done and skipped
+		and the rate of checks per second since the last call to
+		L{reset_stats()}. Each check is at least one stat call.
+		'''
+		elapsed = time.time() - self._start
+		return {
+			'mode': self.mode,
+			'checks': self.checks,
+			'skipped': self.skipped,
+			'checks_per_second': self.checks / elapsed if elapsed > 0 else 0.0,
+		}
+
+	def reset_stats(self):
+		'''Reset the counters for L{stats()}'''
+		self.checks = 0
+		self.skipped = 0
+		self._start = time.time()
+
+
+def _read_page_source(file):
+	# Helper for Notebook.get_pages(), runs in a worker thread. Errors
+	# are ignored here, they are raised when the page is read again.
+	# The size is kept next to the etag to validate the content, see
+	# Page._read_source()
+	try:
+		size = file.size() # Get before read, like the mtime
+		text, etag = file.read_with_etag()
+		return text, etag, size
+	except Exception:
+		return None
+
+
+def _batched(iterable, n):
+	batch = []
+	for item in iterable:
+		batch.append(item)
+		if len(batch) == n:
+			yield batch
+			batch = []
+	if batch:
+		yield batch
+
+
 _NOTEBOOK_CACHE = weakref.WeakValueDictionary()
 
 
@@ -185,6 +348,9 @@ class Notebook(ConnectorMixin, SignalEmitter):
 	@ivar index: The L{Index} object used by the notebook
 	'''
 
+	N_STORE_THREADS = 4 #: number of threads for writing pages when updating links
+	N_PREFETCH_THREADS = 4 #: number of threads for reading pages ahead in get_pages()
+
 	# define signals we want to use - (closure type, return type and arg types)
 	__signals__ = {
 		'store-page': (SIGNAL_NORMAL, None, (object,)),
@@ -252,7 +418,7 @@ class Notebook(ConnectorMixin, SignalEmitter):
 		_NOTEBOOK_CACHE[dir.uri] = nb
 		return nb
 
-	def __init__(self, dir, cache_dir, config, folder, layout, index):
+	def __init__(self, dir, cache_dir, config, folder, layout, index, db=None):
 		self.dir = dir # TODO remove
 		self.folder = folder
 		self.cache_dir = cache_dir
@@ -270,15 +436,34 @@ class Notebook(ConnectorMixin, SignalEmitter):
 				'template': 'Default'
 			})
 		self._page_cache = weakref.WeakValueDictionary()
+		self._index_connected = db is None # False for get_read_only_copy()
+		self.change_checker = PageChangeChecker(page_cache=self._page_cache)
+			# mode and interval are set in do_properties_changed()
+		if self._index_connected:
+			self.change_checker.connect_to_index(self.index)
+
+		if isinstance(cache_dir, (Dir, LocalFolder)):
+			from .parsetreecache import ParseTreeCache
+			self._parsetree_cache = ParseTreeCache(
+				cache_dir.file('parsetrees.db').path, self.layout.root)
+		else:
+			self._parsetree_cache = None
 
 		self.name = None
 		self.icon = None
 		self.document_root = None
 
-		from .index import PagesView, LinksView, TagsView
-		self.pages = PagesView.new_from_index(self.index)
-		self.links = LinksView.new_from_index(self.index)
-		self.tags = TagsView.new_from_index(self.index)
+		from .index import PagesView, LinksView, TagsView, FullTextView
+		if db is None:
+			self.pages = PagesView.new_from_index(self.index)
+			self.links = LinksView.new_from_index(self.index)
+			self.tags = TagsView.new_from_index(self.index)
+			self.fulltext = FullTextView.new_from_index(self.index)
+		else: # see get_read_only_copy()
+			self.pages = PagesView(db)
+			self.links = LinksView(db)
+			self.tags = TagsView(db)
+			self.fulltext = FullTextView(db)
 
 		def on_page_row_changed(o, row, oldrow):
 			if row['name'] in self._page_cache:
@@ -290,11 +475,37 @@ class Notebook(ConnectorMixin, SignalEmitter):
 				self._page_cache[row['name']].haschildren = False
 				self.emit('page-info-changed', self._page_cache[row['name']])
 
-		self.index.update_iter.pages.connect('page-row-changed', on_page_row_changed)
-		self.index.update_iter.pages.connect('page-row-deleted', on_page_row_deleted)
+		if self._index_connected:
+			# A read-only copy does not connect to the index, its signals
+			# are emitted in the thread that owns the index and the
+			# handlers would keep the copy alive as long as the index
+			self.index.update_iter.pages.connect('page-row-changed', on_page_row_changed)
+			self.index.update_iter.pages.connect('page-row-deleted', on_page_row_deleted)
 
 		self.do_properties_changed()
 
+	def get_read_only_copy(self):
+		'''Returns a new notebook object for the same notebook folder
+		that uses its own connection to the index database for its
+		index views. The new object also has its own page cache and
+		its own L{PageChangeChecker}, so pages are never shared with
+		this object. Sqlite connections can not be shared between
+		threads or processes, so the copy can be used to read the
+		notebook from another thread or from a forked process.
+		The copy does not connect to any signals of the index, so
+		it does not get notified of index updates. If the notebook
+		uses C{CHECK_NOTIFY}, the copy checks its pages with
+		C{CHECK_ALWAYS} instead.
+		The copy is flagged C{readonly}, only use it for reading.
+		Requires the index to be stored on disk.
+		@returns: a L{Notebook} object
+		'''
+		db = self.index.new_read_only_connection()
+		notebook = self.__class__(self.dir, self.cache_dir, self.config,
+			self.folder, self.layout, self.index, db=db)
+		notebook.readonly = True
+		return notebook
+
 	@property
 	def uri(self):
 		'''Returns a file:// uri for this notebook that can be opened by zim'''
@@ -371,6 +582,12 @@ class Notebook(ConnectorMixin, SignalEmitter):
 			self.icon = None
 		self.document_root = document_root
 
+		mode = config['page_check']
+		if mode == CHECK_NOTIFY and not self._index_connected:
+			mode = CHECK_ALWAYS # not notified, see get_read_only_copy()
+		self.change_checker.mode = mode
+		self.change_checker.interval = config['page_check_interval']
+
 		# TODO - can we switch cache_dir on run time when 'shared' changed ?
 
 	def suggest_link(self, source, word):
@@ -402,31 +619,99 @@ class Notebook(ConnectorMixin, SignalEmitter):
 		# As a special case, using an invalid page as the argument should
 		# return a valid page object.
 		assert isinstance(path, Path)
-		if path.name in self._page_cache \
-		and self._page_cache[path.name].valid:
-			page = self._page_cache[path.name]
-			assert isinstance(page, Page)
-			page._check_source_etag()
-			return page
-		else:
-			file, folder = self.layout.map_page(path)
-			folder = self.layout.get_attachments_folder(path)
-			page = Page(path, False, file, folder)
+		page = self._get_cached_page(path)
+		if page is None:
 			try:
 				indexpath = self.pages.lookup_by_pagename(path)
 			except IndexNotFoundError:
-				pass
+				indexpath = None
 				# TODO trigger indexer here if page exists !
-			else:
-				if indexpath and indexpath.haschildren:
-					page.haschildren = True
-				# page might be the parent of a placeholder, in that case
-				# the index knows it has children, but the store does not
+			page = self._new_page(path, indexpath)
+		return page
+
+	def _get_cached_page(self, path):
+		page = self._page_cache.get(path.name)
+		if page is not None and page.valid:
+			assert isinstance(page, Page)
+			self.change_checker.check(page)
+			return page
+		else:
+			return None
+
+	def _new_page(self, path, indexpath):
+		file, folder = self.layout.map_page(path)
+		folder = self.layout.get_attachments_folder(path)
+		page = Page(path, False, file, folder, self._parsetree_cache)
+		if indexpath and indexpath.haschildren:
+			page.haschildren = True
+			# page might be the parent of a placeholder, in that case
+			# the index knows it has children, but the store does not
+
+		# TODO - set haschildren if page maps to a store namespace
+		self._page_cache[path.name] = page
+		return page
 
-			# TODO - set haschildren if page maps to a store namespace
-			self._page_cache[path.name] = page
+	def get_pages(self, paths, prefetch=20):
+		'''Generator for L{Page} objects for a number of paths. Like
+		calling L{get_page()} for each path, but the index is queried
+		in batches and the source files of upcoming pages are read
+		ahead in background threads. Use this when processing the
+		content of many pages, e.g. for search or export.
+
+		@param paths: an iterable of L{Path} objects, e.g. the result
+		of C{notebook.pages.walk()}
+		@param prefetch: number of pages to read ahead, use C{0} to
+		only batch the index queries
+		@returns: yields L{Page} objects in the same order as C{paths}
+		'''
+		from multiprocessing.pool import ThreadPool
+		from collections import deque
+
+		batchsize = max(prefetch, self.pages.MAX_QUERY_VARIABLES // 10)
+		pool = ThreadPool(self.N_PREFETCH_THREADS) if prefetch > 0 else None
+		queue = deque()
+
+		def finish(item):
+			page, job = item
+			if job is not None:
+				result = job.get()
+				if result is not None and page._parsetree is None:
+					page._prefetched = result
 			return page
 
+		def iter_pages():
+			for batch in _batched(paths, batchsize):
+				records = self.pages.lookup_by_pagenames(
+					[p for p in batch if p.name not in self._page_cache])
+				for path in batch:
+					page = self._get_cached_page(path)
+					if page is None:
+						page = self._new_page(path, records.get(path.name))
+					if pool and page._parsetree is None and not page._ui_object:
+						job = pool.apply_async(_read_page_source, (page.source_file,))
+					else:
+						job = None
+					queue.append((page, job))
+					while len(queue) > prefetch:
+						yield finish(queue.popleft())
+
+			while queue:
+				yield finish(queue.popleft())
+
+		try:
+			for page in iter_pages():
+				try:
+					yield page
+				finally:
+					# Page leaves the read-ahead window, drop content
+					# that was not used, else it stays in memory as
+					# long as the page is cached
+					page._prefetched = None
+		finally:
+			if pool:
+				pool.close()
+				pool.join()
+
 	def get_new_page(self, path):
 		'''Like get_page() but guarantees the page does not yet exist
 		by adding a number to the name to make it unique.
@@ -564,23 +849,24 @@ class Notebook(ConnectorMixin, SignalEmitter):
 	@assert_index_uptodate
 	@notebook_state
 	def move_page_iter(self, path, newpath, update_links=True):
-		'''Like L{move_page()} but yields pages that are being updated
-		if C{update_links} is C{True}
+		'''Like L{move_page()} but yields progress while updating
+		links if C{update_links} is C{True}. Each step is a 3-tuple of
+		C{(i, total, pagename)} as used by L{NotebookOperation}.
 		'''
 		logger.debug('Move page %s to %s', path, newpath)
 
 		self.emit('move-page', path, newpath)
 		n_links = self.links.n_list_links_section(path, LINK_DIR_BACKWARD)
+		if update_links:
+			oldtargets = self._list_link_targets_section(path)
 		self._move_file_and_folder(path, newpath)
 		self.flush_page_cache(path)
 		self.emit('moved-page', path, newpath)
 
 		if update_links:
-			for p in self._update_links_in_moved_page(path, newpath):
-				yield p
-
-			for p in self._update_links_to_moved_page(path, newpath):
-				yield p
+			updates = self._list_link_updates_for_moved_page(path, newpath, oldtargets)
+			for step in self._update_links_iter(updates):
+				yield step
 
 			new_n_links = self.links.n_list_links_section(newpath, LINK_DIR_BACKWARD)
 			if new_n_links != n_links:
@@ -642,8 +928,95 @@ class Notebook(ConnectorMixin, SignalEmitter):
 			self.index.file_moved(old, new)
 
 
-	def _update_links_in_moved_page(self, oldtarget, newtarget):
-		# Find (floating) links that originate from the moved page
+	def move_page_dry_run(self, path, newpath):
+		'''Report which pages would be checked for link updates when
+		moving C{path} to C{newpath} without changing anything.
+		This is an upper bound: links that turn out to still resolve
+		correctly after the move are left alone.
+		@param path: a L{Path} object for the old/current page name
+		@param newpath: a L{Path} object for the new page name
+		@returns: a list of 2-tuples of a L{Path} for a page to be
+		checked and a list of L{Path} objects for the link targets in
+		that page that are affected
+		'''
+		report = OrderedDict()
+
+		def add(link):
+			report.setdefault(link.source.name, (link.source, []))[1].append(link.target)
+
+		# Links from the moved pages that go outside the section
+		for link in self.links.list_links_section(path):
+			if not (link.target == path or link.target.ischild(path)):
+				add(link)
+
+		# Links to the moved pages and floating links anchored on
+		# the moved page name
+		for link in self.links.list_links_section(path, LINK_DIR_BACKWARD):
+			add(link)
+
+		parent = path.parent
+		for link in self.links.list_floating_links(path.basename):
+			if link.source.ischild(parent) \
+			and not (link.target == path or link.target.ischild(path)) \
+			and not link.target in report.get(link.source.name, (None, ()))[1]:
+				add(link)
+
+		return report.values()
+
+	def _list_link_targets_section(self, path):
+		# Returns a dict mapping the names of a page and its children
+		# to a dict with the link targets per href, see links.list_hrefs()
+		targets = {}
+		try:
+			paths = [path] + list(self.pages.walk(path))
+		except IndexNotFoundError:
+			return targets
+
+		for p in paths:
+			targets[p.name] = dict(
+				((href.rel, href.names), target)
+					for href, target in self.links.list_hrefs(p)
+			)
+		return targets
+
+	def _list_link_updates_for_moved_page(self, oldtarget, newtarget, oldtargets):
+		# Collect all pages that need their links updated after a
+		# move. Returns a dict mapping page names to a 2-tuple of a
+		# Path and a list of functions that return a replace function
+		# for the page parsetree. The "oldtargets" are the link targets
+		# of the moved pages from before the move, see
+		# _list_link_targets_section().
+		#
+		# The link targets of each page are taken from the links table
+		# once, the replace functions look them up by href instead of
+		# resolving every link again. For the moved pages the targets
+		# from the old location are known from before the move, the
+		# old location can not be resolved after the move because the
+		# index no longer has the pages of the old section.
+		#
+		# A moved page can be found by step 1 and by step 2, e.g. when
+		# it has links to pages outside the moved section and absolute
+		# links to its own section. All collected links are resolved
+		# against the index state from before any page is rewritten,
+		# _update_links_iter() applies the functions for a page in a
+		# single pass where the first function that updates a link
+		# wins, so no link is rewritten twice based on stale targets.
+		updates = OrderedDict()
+		targets = {}
+
+		def get_targets(path):
+			if path.name not in targets:
+				targets[path.name] = dict(
+					((href.rel, href.names), target)
+						for href, target in self.links.list_hrefs(path)
+				)
+			return targets[path.name]
+
+		def add(path, func, *args):
+			updates.setdefault(path.name, (path, []))[1].append(
+				partial(func, *(args + (get_targets(path),))))
+
+		# 1. Find (floating) links that originate from the moved page
 		# check if they would resolve different from the old location
 		seen = set()
 		for link in list(self.links.list_links_section(newtarget)):
@@ -657,45 +1030,12 @@ class Notebook(ConnectorMixin, SignalEmitter):
 				else:
 					oldpath = oldtarget + link.source.relname(newtarget)
 
-				yield link.source
-				self._update_moved_page(link.source, oldpath, newtarget, oldtarget)
+				add(link.source, self._update_moved_page_func,
+					oldpath, newtarget, oldtarget, oldtargets.get(oldpath.name, {}))
 				seen.add(link.source.name)
 
-	def _update_moved_page(self, path, oldpath, newroot, oldroot):
-		logger.debug('Updating links in page moved from %s to %s', oldpath, path)
-		page = self.get_page(path)
-		tree = page.get_parsetree()
-		if not tree:
-			return 0
-
-		def replacefunc(elt):
-			text = elt.attrib['href']
-			if link_type(text) != 'page':
-				raise zim.formats.VisitorSkip
-
-			href = HRef.new_from_wiki_link(text)
-			if href.rel == HREF_REL_FLOATING:
-				newtarget = self.pages.resolve_link(page, href)
-				oldtarget = self.pages.resolve_link(oldpath, href)
-
-				if newtarget != oldtarget:
-					try:
-						update = \
-							newtarget.relname(newroot) != oldtarget.relname(oldroot)
-					except ValueError:
-						update = True
-
-					if update:
-						return self._update_link_tag(elt, page, oldtarget, href)
-
-			raise zim.formats.VisitorSkip
-
-		tree.replace(zim.formats.LINK, replacefunc)
-		page.set_parsetree(tree)
-		self.store_page(page)
-
-	def _update_links_to_moved_page(self, oldtarget, newtarget):
-		# 1. Check remaining placeholders, update pages causing them
+		# 2. Check remaining placeholders, update pages causing them
+		# (pages from step 1 can need this as well, see above)
 		seen = set()
 		try:
 			oldtarget = self.pages.lookup_by_pagename(oldtarget)
@@ -704,11 +1044,10 @@ class Notebook(ConnectorMixin, SignalEmitter):
 		else:
 			for link in list(self.links.list_links_section(oldtarget, LINK_DIR_BACKWARD)):
 				if link.source.name not in seen:
-					yield link.source
-					self._move_links_in_page(link.source, oldtarget, newtarget)
+					add(link.source, self._move_links_func, oldtarget, newtarget)
 					seen.add(link.source.name)
 
-		# 2. Check for links that have anchor of same name as the moved page
+		# 3. Check for links that have anchor of same name as the moved page
 		# and originate from a (grand)child of the parent of the moved page
 		# and no longer resolve to the moved page
 		parent = oldtarget.parent
@@ -719,16 +1058,81 @@ class Notebook(ConnectorMixin, SignalEmitter):
 				link.target == newtarget
 				or link.target.ischild(newtarget)
 			):
-				yield link.source
-				self._move_links_in_page(link.source, oldtarget, newtarget)
+				add(link.source, self._move_links_func, oldtarget, newtarget)
 				seen.add(link.source.name)
 
-	def _move_links_in_page(self, path, oldtarget, newtarget):
-		logger.debug('Updating page %s to move link from %s to %s', path, oldtarget, newtarget)
-		page = self.get_page(path)
-		tree = page.get_parsetree()
-		if not tree:
-			return 0
+		return updates
+
+	def _update_links_iter(self, updates):
+		# Apply the replace functions from updates to each page, then
+		# write all modified pages at once with _store_pages_iter().
+		# All links are resolved against the index state from before
+		# the update, this is not changed until all pages are written.
+		total = 2 * len(updates)
+		pages = []
+		for i, (path, funcs) in enumerate(updates.values()):
+			yield (i, total, path.name)
+			page = self.get_page(path)
+			tree = page.get_parsetree()
+			if not tree:
+				continue
+
+			tree.replace(zim.formats.LINK,
+				partial(_replace_first, [func(page) for func in funcs]))
+			page.set_parsetree(tree)
+			pages.append((page, tree))
+
+		offset = total - len(pages)
+		for i, page in enumerate(self._store_pages_iter(pages)):
+			yield (offset + i, total, page.name)
+
+	def _store_pages_iter(self, pages):
+		# Store a batch of pages, writing the files in a pool of
+		# threads and updating the index in a single transaction
+		# afterwards. The threads only do the file I/O, all notebook
+		# and page state is handled in the main thread.
+		# Yields pages as they are written.
+		from multiprocessing.pool import ThreadPool
+
+		if not pages:
+			return
+
+		jobs = []
+		for page, tree in pages:
+			assert page.valid, 'BUG: page object no longer valid'
+			logger.debug('Store page: %s', page)
+			self.emit('store-page', page)
+			if tree and tree.hascontent:
+				lines = page._dump_tree(tree)
+				if lines is not None:
+					jobs.append((page, lines))
+			else:
+				page._store_tree(tree) # remove
+
+		pool = ThreadPool(min(self.N_STORE_THREADS, len(jobs) or 1))
+		try:
+			for page in pool.imap_unordered(_write_page_lines, jobs):
+				yield page
+		finally:
+			pool.close()
+			pool.join()
+			self.index.update_files(
+				[self.layout.map_page(page)[0] for page, tree in pages])
+
+		for page, tree in pages:
+			page.modified = False
+			self.emit('stored-page', page)
+
+	def _lookup_link_target(self, targets, source, href):
+		# Returns the target from the index, only links that are not
+		# in the index are resolved
+		try:
+			return targets[(href.rel, href.names)]
+		except KeyError:
+			return self.pages.resolve_link(source, href)
+
+	def _update_moved_page_func(self, oldpath, newroot, oldroot, oldtargets, targets, page):
+		logger.debug('Updating links in page moved from %s to %s', oldpath, page)
 
 		def replacefunc(elt):
 			text = elt.attrib['href']
@@ -736,7 +1140,34 @@ class Notebook(ConnectorMixin, SignalEmitter):
 				raise zim.formats.VisitorSkip
 
 			href = HRef.new_from_wiki_link(text)
-			target = self.pages.resolve_link(page, href)
+			if href.rel == HREF_REL_FLOATING:
+				newtarget = self._lookup_link_target(targets, page, href)
+				oldtarget = self._lookup_link_target(oldtargets, oldpath, href)
+
+				if newtarget != oldtarget:
+					try:
+						update = \
+							newtarget.relname(newroot) != oldtarget.relname(oldroot)
+					except ValueError:
+						update = True
+
+					if update:
+						return self._update_link_tag(elt, page, oldtarget, href)
+
+			raise zim.formats.VisitorSkip
+
+		return replacefunc
+
+	def _move_links_func(self, oldtarget, newtarget, targets, page):
+		logger.debug('Updating page %s to move link from %s to %s', page, oldtarget, newtarget)
+
+		def replacefunc(elt):
+			text = elt.attrib['href']
+			if link_type(text) != 'page':
+				raise zim.formats.VisitorSkip
+
+			href = HRef.new_from_wiki_link(text)
+			target = self._lookup_link_target(targets, page, href)
 
 			if target == newtarget or target.ischild(newtarget):
 				raise zim.formats.VisitorSkip
@@ -750,9 +1181,12 @@ class Notebook(ConnectorMixin, SignalEmitter):
 			elif href.rel == HREF_REL_FLOATING \
 			and href.parts()[0] == oldtarget.basename \
 			and page.ischild(oldtarget.parent):
-				targetrecord = self.pages.lookup_by_pagename(target)
-				if not target.ischild(oldtarget.parent) \
-				or not targetrecord.exists():
+				try:
+					exists = self.pages.lookup_by_pagename(target).exists()
+				except IndexNotFoundError:
+					exists = False # no placeholder for this link (yet)
+
+				if not target.ischild(oldtarget.parent) or not exists:
 					# An link that was anchored to the moved page,
 					# but now resolves somewhere higher in the tree
 					# Or a link that no longer resolves
@@ -762,12 +1196,9 @@ class Notebook(ConnectorMixin, SignalEmitter):
 						mynewtarget = newtarget.child(':'.join(href.parts()[1:]))
 						return self._update_link_tag(elt, page, mynewtarget, href)
 
-			else:
-				raise zim.formats.VisitorSkip
+			raise zim.formats.VisitorSkip # returning None would remove the link
 
-		tree.replace(zim.formats.LINK, replacefunc)
-		page.set_parsetree(tree)
-		self.store_page(page)
+		return replacefunc
 
 	def _update_link_tag(self, elt, source, target, oldhref):
 		if oldhref.rel == HREF_REL_ABSOLUTE: # prefer to keep absolute links
@@ -811,8 +1242,8 @@ class Notebook(ConnectorMixin, SignalEmitter):
 	@assert_index_uptodate
 	@notebook_state
 	def rename_page_iter(self, path, newbasename, update_heading=True, update_links=True):
-		'''Like L{rename_page()} but yields pages that are being updated
-		if C{update_links} is C{True}
+		'''Like L{rename_page()} but yields progress while updating
+		links if C{update_links} is C{True}, see L{move_page_iter()}
 		'''
 		logger.debug('Rename %s to "%s" (%s, %s)',
 			path, newbasename, update_heading, update_links)
@@ -385,7 +385,7 @@ class Page(Path, SignalEmitter):
 		'page-changed': (SIGNAL_NORMAL, None, (bool,))
 	}
 
-	def __init__(self, path, haschildren, file, folder):
+	def __init__(self, path, haschildren, file, folder, parsetree_cache=None):
 		assert isinstance(path, Path)
 		self.name = path.name
 		self.haschildren = haschildren
@@ -399,11 +399,13 @@ class Page(Path, SignalEmitter):
 
 		self._readonly = None
 		self._last_etag = None
+		self._prefetched = None
 		#TODO this is probably where we need to edit - need to implement the google drive parser/dumper
 		self.format = zim.formats.get_format('wiki') # TODO make configurable
 		self.source = SourceFile(file.path) # XXX
 		self.source_file = file
 		self.attachments_folder = folder
+		self._parsetree_cache = parsetree_cache
 
 	@property
 	def readonly(self):
@@ -440,31 +442,52 @@ class Page(Path, SignalEmitter):
 
 	def _store_tree(self, tree):
 		if tree and tree.hascontent:
-			if self._meta is not None:
-				tree.meta.update(self._meta) # Preserver headers
-			elif self.source_file.exists():
-				# Try getting headers from file
-				try:
-					text = self.source_file.read()
-				except zim.newfs.FileNotFoundError:
-					return None
-				else:
-					parser = self.format.Parser()
-					tree = parser.parse(text)
-					self._meta = tree.meta
-					tree.meta.update(self._meta) # Preserver headers
-			else: # not self.source_file.exists()
-				now = datetime.now()
-				tree.meta['Creation-Date'] = now.isoformat()
-
-			lines = self.format.Dumper().dump(tree, file_output=True)
-			self._last_etag = self.source_file.writelines_with_etag(lines, self._last_etag)
-			self._meta = tree.meta
+			if self._update_meta(tree):
+				# Dump while writing, avoids keeping a copy of the
+				# whole page content in memory
+				lines = self.format.Dumper().dump_iter(tree, file_output=True)
+				self._write_lines(lines)
+				self._meta = tree.meta
 		else:
 			self.source_file.remove()
 			self._last_etag = None
 			self._meta = None
 
+	def _dump_tree(self, tree):
+		# Serialize tree for writing, preserving the headers of the
+		# page. Does not touch the file, so the lines can be written
+		# by another thread using _write_lines()
+		if not self._update_meta(tree):
+			return None
+
+		lines = self.format.Dumper().dump(tree, file_output=True)
+		self._meta = tree.meta
+		return lines
+
+	def _update_meta(self, tree):
+		# Preserve the headers of the page for writing the tree,
+		# returns False if the source file went missing while reading
+		if self._meta is not None:
+			tree.meta.update(self._meta) # Preserver headers
+		elif self.source_file.exists():
+			# Try getting headers from file
+			try:
+				text = self.source_file.read()
+			except zim.newfs.FileNotFoundError:
+				return False
+			else:
+				parser = self.format.Parser()
+				self._meta = parser.parse(text).meta
+				tree.meta.update(self._meta) # Preserver headers
+		else: # not self.source_file.exists()
+			now = datetime.now()
+			tree.meta['Creation-Date'] = now.isoformat()
+
+		return True
+
+	def _write_lines(self, lines):
+		self._last_etag = self.source_file.writelines_with_etag(lines, self._last_etag)
+
 	def _check_source_etag(self):
 		if (
 			self._last_etag
@@ -517,16 +540,41 @@ class Page(Path, SignalEmitter):
 			return self._ui_object.get_parsetree()
 		else:
 			try:
-				text, self._last_etag = self.source_file.read_with_etag()
+				text, self._last_etag = self._read_source()
 			except zim.newfs.FileNotFoundError:
 				return None
 			else:
-				parser = self.format.Parser()
-				self._parsetree = parser.parse(text)
+				cache = self._parsetree_cache
+				tree = None
+				if cache is not None:
+					tree = cache.get(self.source_file, self._last_etag, self.format)
+				if tree is None:
+					parser = self.format.Parser()
+					tree = parser.parse(text)
+					if cache is not None:
+						cache.set(self.source_file, self._last_etag, self.format, tree)
+				self._parsetree = tree
 				self._meta = self._parsetree.meta
 				assert self._meta is not None
 				return self._parsetree
 
+	def _read_source(self):
+		# Use content read ahead by Notebook.get_pages() if the file
+		# did not change since, checking the mtime and the size is
+		# cheaper than reading the file again. The size catches writes
+		# within the mtime resolution of the file system
+		if self._prefetched:
+			text, etag, size = self._prefetched
+			self._prefetched = None
+			try:
+				if self.source_file.mtime() == etag[0] \
+				and self.source_file.size() == size:
+					return text, etag
+			except zim.newfs.FileNotFoundError:
+				pass
+
+		return self.source_file.read_with_etag()
+
 	def set_parsetree(self, tree):
 		'''Set the parsetree with content for this page
 
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017 Jaap Karssenberg <jaap.karssenberg@gmail.com>
+
+'''This module defines a cache for parsed pages that is kept on disk
+in the notebook cache folder. It allows L{Page.get_parsetree()} to skip
+parsing page sources that did not change since they were last parsed,
+which benefits e.g. search and export on a cold start.
+
+The parse trees are stored as a marshalled token stream in a sqlite
+database. Entries are keyed by the file path relative to the notebook
+folder and only used when the md5 sum of the file content is the same
+as when the entry was stored.
+'''
+
+from __future__ import with_statement
+
+import os
+import time
+import zlib
+import marshal
+import sqlite3
+import threading
+import logging
+
+logger = logging.getLogger('zim.notebook')
+
+
+import zim
+
+from zim.utils import OrderedDict
+from zim.formats import ParseTree, ElementTreeModule
+
+
+CACHE_VERSION = 1 #: increase when the serialization changes
+
+
+def tree_to_bytes(tree):
+	'''Serialize a parsetree to a compact binary string
+	@param tree: a L{ParseTree}
+	@returns: a string
+	@raises ValueError: if the tree contains attributes that can not
+	be serialized
+	'''
+	tokens = []
+
+	def visit(elt):
+		tokens.append((elt.tag, dict(elt.attrib)))
+		if elt.text:
+			tokens.append(elt.text)
+		for child in elt:
+			visit(child) # recurs
+			if child.tail:
+				tokens.append(child.tail)
+		tokens.append(None)
+
+	visit(tree._etree.getroot())
+	data = marshal.dumps((tree.meta.items(), tokens), 2)
+	return zlib.compress(data, 1)
+
+
+def tree_from_bytes(data):
+	'''Construct a parsetree from data returned by L{tree_to_bytes()}
+	@param data: a string
+	@returns: a L{ParseTree}
+	'''
+	meta, tokens = marshal.loads(zlib.decompress(data))
+	builder = ElementTreeModule.TreeBuilder()
+	stack = []
+	for t in tokens:
+		if t is None:
+			builder.end(stack.pop())
+		elif isinstance(t, tuple):
+			builder.start(*t)
+			stack.append(t[0])
+		else:
+			builder.data(t)
+
+	tree = ParseTree(builder.close())
+	tree.meta = OrderedDict(meta)
+	return tree
+
+
+class ParseTreeCache(object):
+	'''Cache for parsed pages stored in a sqlite database
+
+	The cache can be shared between threads and between processes,
+	each thread and each process opens its own database connection.
+	All errors from the database are logged and ignored, the cache is
+	a best effort. The total size of the stored data is limited to
+	C{max_size}, when it grows larger the least recently used entries
+	are dropped.
+
+	@ivar hits: number of trees found in the cache
+	@ivar misses: number of lookups that were not found
+	'''
+
+	ATIME_RESOLUTION = 3600 #: seconds between updates of the access time of an entry
+	CHECK_SIZE_INTERVAL = 100 #: number of stored trees between size checks
+
+	def __init__(self, dbpath, root, max_size=64 * 1024 * 1024):
+		'''Constructor
+		@param dbpath: file path for the sqlite database
+		@param root: the notebook folder, used to determine relative
+		paths for source files
+		@param max_size: maximum size in bytes for the stored data
+		'''
+		self.dbpath = dbpath
+		self.root = root
+		self.max_size = max_size
+		self.hits = 0
+		self.misses = 0
+		self._local = threading.local()
+		self._n_stored = 0
+		self._lock = threading.Lock()
+
+	def _db(self):
+		# Connections can not be shared between threads or after a fork
+		db = getattr(self._local, 'db', None)
+		if db is None or self._local.pid != os.getpid():
+			db = sqlite3.Connection(self.dbpath, timeout=1)
+			db.execute('PRAGMA synchronous=OFF;')
+			db.execute(
+				'CREATE TABLE IF NOT EXISTS parsetrees ('
+				'	path TEXT PRIMARY KEY,'
+				'	key TEXT,'
+				'	md5 BLOB,'
+				'	atime REAL,'
+				'	size INTEGER,'
+				'	data BLOB'
+				')'
+			)
+			db.execute('CREATE INDEX IF NOT EXISTS parsetrees_atime ON parsetrees(atime)')
+			db.commit()
+			self._local.db = db
+			self._local.pid = os.getpid()
+		return db
+
+	def _key(self, format):
+		return '%s:%s:%i' % (format.__name__, zim.__version__, CACHE_VERSION)
+
+	def get(self, file, etag, format):
+		'''Get a parsetree from the cache
+		@param file: the source L{File}
+		@param etag: the etag for the content of the file as returned
+		by C{File.read_with_etag()}
+		@param format: the format module used for parsing
+		@returns: a L{ParseTree} or C{None}
+		'''
+		path = file.relpath(self.root)
+		try:
+			db = self._db()
+			row = db.execute(
+				'SELECT md5, atime, data FROM parsetrees WHERE path=? AND key=?',
+				(path, self._key(format))
+			).fetchone()
+			if row is None or str(row[0]) != etag[1]:
+				self.misses += 1
+				return None
+
+			tree = tree_from_bytes(str(row[2]))
+			now = time.time()
+			if now - row[1] > self.ATIME_RESOLUTION:
+				db.execute('UPDATE parsetrees SET atime=? WHERE path=?', (now, path))
+				db.commit()
+		except Exception:
+			logger.exception('Error reading parsetree cache for: %s', path)
+			self.misses += 1
+			return None
+		else:
+			self.hits += 1
+			return tree
+
+	def set(self, file, etag, format, tree):
+		'''Store a parsetree in the cache
+		@param file: the source L{File}
+		@param etag: the etag for the content of the file as returned
+		by C{File.read_with_etag()}
+		@param format: the format module used for parsing
+		@param tree: the L{ParseTree}
+		'''
+		path = file.relpath(self.root)
+		try:
+			data = tree_to_bytes(tree)
+		except ValueError:
+			logger.debug('Could not serialize parsetree for: %s', path)
+			return
+
+		try:
+			db = self._db()
+			db.execute(
+				'INSERT OR REPLACE INTO parsetrees(path, key, md5, atime, size, data) '
+				'VALUES (?, ?, ?, ?, ?, ?)',
+				(path, self._key(format), sqlite3.Binary(etag[1]), time.time(), len(data), sqlite3.Binary(data))
+			)
+			db.commit()
+
+			with self._lock:
+				self._n_stored += 1
+				check = self._n_stored % self.CHECK_SIZE_INTERVAL == 1
+			if check:
+				self._check_size(db)
+		except sqlite3.Error:
+			logger.exception('Error writing parsetree cache for: %s', path)
+
+	def _check_size(self, db):
+		total, = db.execute('SELECT sum(size) FROM parsetrees').fetchone()
+		if total and total > self.max_size:
+			# Drop least recently used entries till below 80% of max
+			drop = total - int(0.8 * self.max_size)
+			paths = []
+			for path, size in db.execute(
+				'SELECT path, size FROM parsetrees ORDER BY atime'
+			):
+				paths.append((path,))
+				drop -= size
+				if drop <= 0:
+					break
+			db.executemany('DELETE FROM parsetrees WHERE path=?', paths)
+			db.commit()
+			logger.debug('Dropped %i entries from parsetree cache', len(paths))
+
+	def clear(self):
+		'''Remove all entries from the cache'''
+		db = self._db()
+		db.execute('DELETE FROM parsetrees')
+		db.commit()
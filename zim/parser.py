@@ -346,8 +346,8 @@ class Parser(object):
 	based on the match call the correct rules for processing.
 
 	@ivar rules: list with L{Rule} objects, can be modified untill the
-	parser is used for the first time for parsing (the attribute
-	becomes a tuple afterwards)
+	parser is compiled or used for the first time for parsing (the
+	attribute becomes a tuple afterwards)
 	@ivar process_unmatched: function (or object) to process un-matched
 	text, or C{None}.
 	The function should take a L{Builder} object as first argument,
@@ -398,14 +398,7 @@ class Parser(object):
 
 		assert text, 'BUG: processing empty string'
 		if self._re is None:
-			# Generate the regex and cache it for re-use
-			self.rules = tuple(self.rules) # freeze list
-			pattern = r'|'.join([
-				r"(?P<rule%i>%s)" % (i, r.pattern)
-					for i, r in enumerate(self.rules)
-			])
-			#~ print 'PATTERN:\n', pattern.replace(')|(', ')\t|\n('), '\n...'
-			self._re = re.compile(pattern, re.U | re.M | re.X)
+			self.compile()
 
 		iter = 0
 		end = len(text)
@@ -440,6 +433,21 @@ class Parser(object):
 
 	parse = __call__
 
+	def compile(self):
+		'''Generate the regex for all rules and cache it for re-use.
+		After this call the parser is no longer modified while parsing,
+		so it can be used from multiple threads at the same time.
+		Called automatically on first use if not called before.
+		'''
+		rules = tuple(self.rules) # freeze list
+		pattern = r'|'.join([
+			r"(?P<rule%i>%s)" % (i, r.pattern)
+				for i, r in enumerate(rules)
+		])
+		#~ print 'PATTERN:\n', pattern.replace(')|(', ')\t|\n('), '\n...'
+		self.rules = rules
+		self._re = re.compile(pattern, re.U | re.M | re.X)
+
 	@staticmethod
 	def _raise_exception(error, text, start, end, builder, rule=None):
 		# Add parser state, line count etc. to error, then re-raise
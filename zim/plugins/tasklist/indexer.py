@@ -64,7 +64,7 @@ class TasksIndexer(IndexerBase):
 	'''
 
 	PLUGIN_NAME = "tasklist"
-	PLUGIN_DB_FORMAT = "0.8"
+	PLUGIN_DB_FORMAT = "0.9"
 
 	INIT_SCRIPT = '''
 		CREATE TABLE IF NOT EXISTS tasklist (
@@ -80,6 +80,9 @@ class TasksIndexer(IndexerBase):
 			tags TEXT,
 			description TEXT
 		);
+		CREATE INDEX IF NOT EXISTS tasklist_source ON tasklist(source);
+		CREATE INDEX IF NOT EXISTS tasklist_parent ON tasklist(parent, open, start);
+		CREATE INDEX IF NOT EXISTS tasklist_open ON tasklist(open, hasopenchildren, start);
 		INSERT OR REPLACE INTO zim_index VALUES (%r, %r);
 	''' % (PLUGIN_NAME, PLUGIN_DB_FORMAT)
 
@@ -45,11 +45,14 @@ For content '*' can occur on both sides, but does not match whitespace
 
 
 import re
+import time
 import logging
 
+from collections import deque
+
 from zim.parsing import split_quoted_strings, unescape_quoted_string, Re
 from zim.notebook import Path, \
-	PageNotFoundError, IndexNotFoundError, \
+	IndexNotFoundError, \
 	LINK_DIR_BACKWARD, LINK_DIR_FORWARD
 
 
@@ -78,6 +81,101 @@ KEYWORDS = (
 keyword_re = Re('(' + '|'.join(KEYWORDS) + '):(.*)', re.I)
 operators_re = Re(r'^(\|\||\&\&|\+|\-)')
 tag_re = Re(r'^\@(\w+)$', re.U)
+_fulltext_word_re = re.compile(r'^\w+\*?$', re.U)
+
+
+_worker_parsetree_caches = {} # ParseTreeCache objects per database in a worker process
+
+_worker_pool = None # Pool started by start_worker_pool()
+_worker_pool_jobs = 1
+
+
+def start_worker_pool(jobs):
+	'''Start a pool of worker processes for scanning page content that
+	is used by all searches in this process, see L{SearchSelection}.
+	The pool is created by forking the current process, so this must be
+	called before any threads are started and before the gtk main loop
+	runs, e.g. when the application starts. Does nothing when a pool is
+	already running or C{jobs} is less than 2.
+	@param jobs: number of worker processes
+	'''
+	global _worker_pool, _worker_pool_jobs
+	if _worker_pool is None and jobs > 1:
+		import multiprocessing
+		logger.debug('Starting %i search worker processes', jobs)
+		_worker_pool = multiprocessing.Pool(jobs)
+		_worker_pool_jobs = jobs
+
+
+def stop_worker_pool():
+	'''Stop the pool started by L{start_worker_pool()}'''
+	global _worker_pool, _worker_pool_jobs
+	if _worker_pool is not None:
+		_worker_pool.terminate()
+		_worker_pool.join()
+		_worker_pool = None
+		_worker_pool_jobs = 1
+
+
+def get_worker_pool_jobs():
+	'''Returns the number of processes in the pool started by
+	L{start_worker_pool()}, or 1 if no pool is running. Use this as the
+	C{jobs} argument for L{SearchSelection} in processes where no new
+	pool can be forked.
+	'''
+	return _worker_pool_jobs
+
+
+def _count_batch_matches(tasks):
+	# Function executed in the worker processes, handles a batch of
+	# tasks for _count_content_matches()
+	return [_count_content_matches(task) for task in tasks]
+
+
+def _count_content_matches(task):
+	# Function executed in the worker processes of
+	# SearchSelection._scan_content_parallel() - must be at module
+	# level to be pickled. Returns the number of matches per regex,
+	# False if the page has no source file or None if the page should
+	# be scanned by the main process instead. Errors are caught here
+	# because an exception ends the results of Pool.imap() for the
+	# remaining tasks in the same batch.
+	if task is None:
+		return None
+
+	try:
+		return _count_file_matches(*task)
+	except:
+		return None # main process scans again to get a proper error
+
+
+def _count_file_matches(filepath, formatname, regexes, cacheinfo):
+	from zim.newfs import LocalFile, LocalFolder, FileNotFoundError
+	from zim.formats import get_format_module
+	from zim.notebook.parsetreecache import ParseTreeCache
+
+	file = LocalFile(filepath)
+	try:
+		text, etag = file.read_with_etag()
+	except FileNotFoundError:
+		return False
+
+	format = get_format_module(formatname)
+	cache = None
+	if cacheinfo is not None:
+		if not cacheinfo in _worker_parsetree_caches:
+			dbpath, root = cacheinfo
+			_worker_parsetree_caches[cacheinfo] = ParseTreeCache(dbpath, LocalFolder(root))
+		cache = _worker_parsetree_caches[cacheinfo]
+
+	tree = cache.get(file, etag, format) if cache else None
+	if tree is None:
+		tree = format.Parser().parse(text)
+		if cache is not None:
+			cache.set(file, etag, format, tree)
+
+	return [tree.countre(regex) for regex in regexes]
+
 
 class QueryTerm(object):
 	'''Wrapper for a single term in a query. Consists of a keyword,
@@ -221,13 +319,41 @@ class SearchSelection(PageSelection):
 	from processing a search query. The attribute 'scores' gives a dict
 	with an arbitrary integer for each path in this set to rank how well
 	they match the query.
+
+	The attribute 'timings' gives a dict with the seconds spent in the
+	last search on terms answered from the index ("index") and on terms
+	that need the page content or the full text index ("content").
+
+	Terms that can not be answered by the full text index need a scan
+	of the page content. When C{jobs} is larger than 1 and many pages
+	need to be scanned, they are read, parsed and matched in a pool of
+	worker processes. Results are still scored and passed to the
+	callback page by page in the main process, so the callback can
+	still show progress and cancel the search. If a pool was started
+	with L{start_worker_pool()} that pool is used, else a pool is
+	forked from the current process for each search. In the GUI only
+	the persistent pool is safe to use.
+
+	@cvar MIN_PAGES_PARALLEL: minimum number of pages to scan before
+	using worker processes, starting the pool costs more than scanning
+	a small number of pages
 	'''
 
-	def __init__(self, notebook):
+	MIN_PAGES_PARALLEL = 200
+
+	def __init__(self, notebook, jobs=1):
+		'''Constructor
+		@param notebook: a L{Notebook} object
+		@param jobs: number of worker processes to use for scanning
+		page content, by default all pages are scanned in the current
+		process
+		'''
 		self.notebook = notebook
+		self.jobs = jobs
 		self.cancelled = False
 		self.query = None
 		self.scores = {}
+		self.timings = {'index': 0.0, 'content': 0.0}
 
 	def search(self, query, selection=None, callback=None):
 		'''Populate this SearchSelection with results for a query.
@@ -251,6 +377,7 @@ class SearchSelection(PageSelection):
 		self.query = query
 		self.clear()
 		self.scores = {}
+		self.timings = {'index': 0.0, 'content': 0.0}
 
 		# Actual search
 		self.update(self._process_group(query.root, selection, callback))
@@ -296,8 +423,10 @@ class SearchSelection(PageSelection):
 		# First process index terms - no callback in between - this is fast
 		results = None
 		for term in indexterms:
-			results, scope = op_func(results, scope,
-				self._process_from_index(term, scope))
+			start = time.time()
+			myresults = self._process_from_index(term, scope)
+			self.timings['index'] += time.time() - start
+			results, scope = op_func(results, scope, myresults)
 
 		if callback:
 			if group.operator == OPERATOR_AND:
@@ -337,8 +466,10 @@ class SearchSelection(PageSelection):
 				scope = scope.copy()
 			myscope = scope # local copy here, need to pass full scope to _process_content
 			if term.keyword == 'contentorname':
-				results, myscope = op_func(results, myscope,
-					self._process_from_index(term, myscope, scoring=10))
+				start = time.time()
+				myresults = self._process_from_index(term, myscope, scoring=10)
+				self.timings['index'] += time.time() - start
+				results, myscope = op_func(results, myscope, myresults)
 
 		if callback and (
 			group.operator == OPERATOR_OR or
@@ -351,8 +482,10 @@ class SearchSelection(PageSelection):
 
 		# Now do the content terms all at once per page - slow or very slow
 		if contentterms:
+			start = time.time()
 			results = self._process_content(
 				contentterms, results, scope, group.operator, callback)
+			self.timings['content'] += time.time() - start
 
 		# And return our results as summed by the operator
 		return results or set()
@@ -488,76 +621,255 @@ class SearchSelection(PageSelection):
 		# contentorname optimization
 		# For OR 'results' is whatever was found so far while 'scope' can be larger
 		# we extend the results with any matches from scope
+		#
+		# Terms that are plain words are looked up in the full text
+		# index, only if any term can not be answered by the index we
+		# need to read the pages. Terms with a "*" at the end are
+		# used to narrow down the pages to read, but the number of
+		# matches is still counted with the regex. The same goes for
+		# all terms when the index uses the fallback tokenizer that
+		# splits words on "_", e.g. "foo" then also matches the token
+		# in "foo_bar" while the regex does not.
 		for term in terms:
 			term.content_regex = self._content_regex(term.string)
+			term.fulltext_word = self._fulltext_word(term.string)
 			# term.name_regex already defined in _process_from_index
 
+		if results is None:
+			results = SearchSelection(None)
+
+		if all(term.fulltext_word and not term.fulltext_word[1] for term in terms) \
+		and self.notebook.fulltext.tokenchars:
+			return self._process_content_from_index(
+				terms, results, scope, operator, callback)
+
+		if operator == OPERATOR_AND \
+		and any(term.fulltext_word and not term.inverse for term in terms):
+			# Only pages that match all positive terms can match the
+			# query, so use the index to narrow down the pages to read
+			scope = self._fulltext_candidates(terms, scope)
+			if not scope:
+				return results
+
 		if scope:
-			def page_generator():
-				for path in scope:
-					try:
-						yield self.notebook.get_page(path)
-					except PageNotFoundError:
-						pass
-			generator = page_generator()
+			paths, n_pages = scope, len(scope)
 		else:
-			generator = map(self.notebook.get_page, self.notebook.pages.walk())
+			paths, n_pages = self.notebook.pages.walk(), self.notebook.pages.n_all_pages()
 
-		if results is None:
-			results = SearchSelection(None)
+		if self.jobs > 1 and n_pages >= self.MIN_PAGES_PARALLEL:
+			scanner = self._scan_content_parallel(paths, terms, self.jobs)
+		else:
+			scanner = self._scan_content(paths, terms)
+
+		try:
+			for path, counts in scanner:
+				self._score_content(path, terms, counts, results, operator)
+
+				if callback:
+					# Since we are always last in the processing of the
+					# (top-level) group, we can call the callback with all results
+					cont = callback(results, path)
+					if not cont:
+						self.cancelled = True
+						break
+		finally:
+			scanner.close() # stops scanning when cancelled
 
-		for page in generator:
+		return results
+
+	def _scan_content(self, paths, terms):
+		# Generator yielding the path and the number of matches per
+		# term for each page in "paths" that has content
+		for page in self.notebook.get_pages(paths):
 			#~ print '!! Search content', page
-			try:
-				tree = page.get_parsetree()
-			except:
-				logger.exception('Exception while reading: %s', page)
-				continue
-
-			if tree is None:
-				continue # Assume need to have content even for negative query
-
-			path = Path(page.name)
-			if operator == OPERATOR_AND:
-				score = 0
-				for term in terms:
-					#~ print '!! Count AND %s' % term
-					myscore = tree.countre(term.content_regex)
-					if term.keyword == 'contentorname' \
-					and term.name_regex.match(path.name):
-						myscore += 1 # effective score going to 11
-
-					if bool(myscore) != term.inverse: # implicit XOR
-						score += myscore or 1
-					else:
-						score = 0
-						break
+			counts = self._count_page_matches(page, terms)
+			if counts is not None:
+				yield Path(page.name), counts
+
+	def _scan_content_parallel(self, paths, terms, jobs):
+		# Like _scan_content() but pages are read, parsed and matched
+		# by a pool of worker processes. Pages that are open with
+		# changes in memory, or that do not have a local source file,
+		# are still scanned in this process. Workers use the same
+		# parsetree cache as the pages in this process.
+		import multiprocessing
+		from zim.newfs import LocalFile
+
+		# Build all tasks first, the pool consumes its input in a
+		# separate thread, which can not access the index
+		layout = self.notebook.layout
+		regexes = [term.content_regex for term in terms]
+		cache = self.notebook._parsetree_cache
+		if cache is not None:
+			cacheinfo = (cache.dbpath, cache.root.path)
+		else:
+			cacheinfo = None
+		paths = [Path(p.name) for p in paths]
+		tasks = []
+		for path in paths:
+			page = self.notebook._get_cached_page(path)
+			file = layout.map_page(path)[0]
+			if (page is not None and (page._parsetree or page._ui_object)) \
+			or not isinstance(file, LocalFile):
+				tasks.append(None)
+			else:
+				format = layout.get_format(file)
+				tasks.append((file.path, format.__name__.rsplit('.', 1)[-1], regexes, cacheinfo))
 
-				if score:
-					results.add(path)
-					self._count_score(path, score)
-			else: # OPERATOR_OR
-				for term in terms:
-					#~ print '!! Count OR %s' % term
-					score = tree.countre(term.content_regex)
-					if term.keyword == 'contentorname' \
-					and term.name_regex.match(path.name):
-						score += 1 # effective score going to 11
-
-					if bool(score) != term.inverse: # implicit XOR
-						results.add(path)
-						self._count_score(path, score or 1)
+		if _worker_pool is not None:
+			pool, jobs = _worker_pool, _worker_pool_jobs
+		else:
+			pool = multiprocessing.Pool(jobs)
+
+		# Only a few batches are queued at any time, so a cancelled
+		# search does not leave a persistent pool busy with the rest
+		batchsize = max(1, min(20, len(tasks) // (jobs * 4)))
+		starts = iter(range(0, len(tasks), batchsize))
+		queue = deque()
+		try:
+			while True:
+				for start in starts:
+					batch = tasks[start:start + batchsize]
+					queue.append((start, pool.apply_async(_count_batch_matches, (batch,))))
+					if len(queue) >= jobs * 2:
+						break
 
-			if callback:
-				# Since we are always last in the processing of the
-				# (top-level) group, we can call the callback with all results
-				cont = callback(results, path)
-				if not cont:
-					self.cancelled = True
+				if not queue:
 					break
 
+				start, job = queue.popleft()
+				for i, counts in enumerate(job.get(), start):
+					path = paths[i]
+					if counts is None:
+						counts = self._count_page_matches(self.notebook.get_page(path), terms)
+					if counts:
+						yield path, counts
+		finally:
+			if pool is not _worker_pool:
+				pool.terminate()
+				pool.join()
+
+	def _count_page_matches(self, page, terms):
+		# Returns the number of matches per term in the page content
+		# or None if the page has no content
+		try:
+			tree = page.get_parsetree()
+		except:
+			logger.exception('Exception while reading: %s', page)
+			return None
+
+		if tree is None:
+			return None # Assume need to have content even for negative query
+
+		return [tree.countre(term.content_regex) for term in terms]
+
+	def _process_content_from_index(self, terms, results, scope, operator, callback=None):
+		# Like _process_content() but all terms are looked up in the
+		# full text index, so we do not need to read any pages.
+		# Pages are considered in the same way as the page scan does:
+		# the scope, or else all pages that have content.
+		matches = [self._fulltext_matches(term) for term in terms]
+		positive = [
+			self._fulltext_term_candidates(term, m, scope)
+				for term, m in zip(terms, matches) if not term.inverse
+		]
+		if operator == OPERATOR_AND and positive:
+			candidates = positive[0]
+			for c in positive[1:]:
+				candidates &= c
+		elif operator == OPERATOR_OR and len(positive) == len(terms):
+			candidates = set()
+			for c in positive:
+				candidates |= c
+		else:
+			# Inverse terms match all pages that do not contain the word
+			candidates = set(self.notebook.fulltext.list_pages())
+
+		if scope:
+			candidates &= scope
+
+		for path in candidates:
+			path = Path(path.name)
+			counts = [m.get(path, 0) for m in matches]
+			self._score_content(path, terms, counts, results, operator)
+
+		if callback:
+			cont = callback(results, None)
+			if not cont:
+				self.cancelled = True
+
 		return results
 
+	def _fulltext_candidates(self, terms, scope):
+		# Returns the set of pages that match all positive terms that
+		# are answered by the index, limitted to the scope if any
+		candidates = None
+		for term in terms:
+			if term.fulltext_word and not term.inverse:
+				matches = self._fulltext_term_candidates(
+					term, self._fulltext_matches(term), scope)
+				if candidates is None:
+					candidates = matches
+				else:
+					candidates &= matches
+
+		if scope:
+			candidates &= scope
+		return candidates
+
+	def _fulltext_term_candidates(self, term, matches, scope):
+		# Returns the set of pages that can match a positive term,
+		# for "contentorname" this includes pages with content that
+		# only match by name, because those get a score for the name
+		# as well
+		candidates = set(matches)
+		if term.keyword == 'contentorname':
+			for record in self.notebook.fulltext.list_pages():
+				if term.name_regex.match(record.name) \
+				and (not scope or record in scope):
+					candidates.add(Path(record.name))
+		return candidates
+
+	def _fulltext_matches(self, term):
+		# Returns a dict with the number of matches per page for a term
+		word, prefix = term.fulltext_word
+		return dict(
+			(Path(record.name), count)
+				for record, count in
+					self.notebook.fulltext.list_matching_pages(word, prefix)
+		)
+
+	def _score_content(self, path, terms, counts, results, operator):
+		# Add path to results and update scores based on the number of
+		# matches per term in the page content
+		if operator == OPERATOR_AND:
+			score = 0
+			for term, myscore in zip(terms, counts):
+				#~ print '!! Count AND %s' % term
+				if term.keyword == 'contentorname' \
+				and term.name_regex.match(path.name):
+					myscore += 1 # effective score going to 11
+
+				if bool(myscore) != term.inverse: # implicit XOR
+					score += myscore or 1
+				else:
+					score = 0
+					break
+
+			if score:
+				results.add(path)
+				self._count_score(path, score)
+		else: # OPERATOR_OR
+			for term, score in zip(terms, counts):
+				#~ print '!! Count OR %s' % term
+				if term.keyword == 'contentorname' \
+				and term.name_regex.match(path.name):
+					score += 1 # effective score going to 11
+
+				if bool(score) != term.inverse: # implicit XOR
+					results.add(path)
+					self._count_score(path, score or 1)
+
 	def _name_regex(self, string, case=False):
 		# Build a regex for matching a glob against a page name
 		# Don't use word delimiters here, since page names could be in
@@ -592,6 +904,30 @@ class SearchSelection(PageSelection):
 		else:
 			return re.compile(regex, re.I)
 
+	def _fulltext_word(self, string):
+		# Check whether a content search term can be answered by the
+		# full text index. Returns a 2-tuple of the word and a boolean
+		# for prefix matching, or None if we need to use the regex
+		# from _content_regex() instead. Only plain words (optionally
+		# with a "*" at the end) map exactly on the tokens in the index.
+		if not (self.notebook and self.notebook.fulltext.enabled):
+			return None
+
+		if not isinstance(string, unicode):
+			string = string.decode('UTF-8')
+
+		if not _fulltext_word_re.match(string) \
+		or any(c >= u'\u2e80' for c in string):
+			# No tokens for chinese etc. - see _content_regex()
+			return None
+		elif '_' in string and not '_' in self.notebook.fulltext.tokenchars:
+			# Fallback tokenizer splits the word in multiple tokens
+			return None
+		elif string.endswith('*'):
+			return string[:-1], True
+		else:
+			return string, False
+
 	def _content_regex(self, string, case=False):
 		# Build a regex for a content search term, expands wildcards
 		# and sets case sensitivity. Tries to guess if we look for
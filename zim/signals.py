@@ -252,6 +252,8 @@ class SignalEmitter(object):
 	# E.g. {signal: (SIGNAL_RUN_LAST, None, (object, object))}
 	__signals__ = {} #: signals supported by this class
 
+	_signal_hook = None
+
 	def __new__(cls, *arg, **kwarg):
 		# New instance: init attributes for signal handling
 		obj = super(SignalEmitter, cls).__new__(cls, *arg, **kwarg)
@@ -323,6 +325,21 @@ class SignalEmitter(object):
 	def _teardown_signal(self, signal):
 		pass
 
+	def set_signal_hook(self, hook):
+		'''Set a function that is called for each signal handler of
+		this object instead of calling the handler directly. Can be
+		used e.g. to measure the time spent in signal handlers. Only one
+		hook can be set per object.
+
+		@param hook: a function that is called as::
+
+			hook(handler, obj, *args)
+
+		and should call C{handler(obj, *args)} and return the result.
+		Use C{None} to remove the hook.
+		'''
+		self._signal_hook = hook
+
 	def emit(self, signal, *args):
 		assert signal in self.__signals__, 'No such signal: %s::%s' % (self.__class__.__name__, signal)
 
@@ -333,9 +350,13 @@ class SignalEmitter(object):
 			return # ignore emit
 
 		return_first = self.__signals__[signal][1] is not None
+		hook = self._signal_hook
 		for c, i, handler in self._signal_handlers.get(signal, []):
 			try:
-				r = handler(self, *args)
+				if hook is None:
+					r = handler(self, *args)
+				else:
+					r = hook(handler, self, *args)
 			except:
 				logger.exception('Exception in signal handler for %s on %s', signal, self)
 			else:
@@ -59,6 +59,7 @@ from zim.signals import SignalEmitter
 
 from zim.templates.parser import TemplateParser
 from zim.templates.processor import TemplateProcessor, TemplateContextDict
+from zim.templates.compiler import compile_template
 from zim.templates.functions import build_template_functions
 
 
@@ -131,11 +132,39 @@ def get_template(category, template):
 	return Template(file)
 
 
+_compiled_templates = {}
+	# Cache for parsed and compiled templates, maps the file path to a
+	# 3-tuple of the file (mtime, size), the parse tree and the function
+
+
+def _get_compiled_template(file):
+	# Returns parse tree and compiled function for a template file,
+	# parsing is skipped when the file did not change since last use
+	if file.exists():
+		key = (file.mtime(), file.size())
+		cached = _compiled_templates.get(file.path)
+		if cached and cached[0] == key:
+			return cached[1], cached[2]
+	else:
+		key = None # let read() raise the error
+
+	parts = TemplateParser().parse(file.read())
+	func = compile_template(parts)
+	if key is not None:
+		_compiled_templates[file.path] = (key, parts, func)
+	return parts, func
+
+
 class Template(SignalEmitter):
 	'''This class defines the main interface for templates
 	It takes care of parsing a template file and allows evaluating
 	the template with a given set of template parameters.
 
+	Templates are compiled to a python function, see
+	L{compile_template()}. Parsed and compiled templates are cached and
+	re-used as long as the modification time and size of the file do
+	not change.
+
 	@signal: C{process (output, context)}: emitted by the "process" method
 	'''
 
@@ -156,7 +185,7 @@ class Template(SignalEmitter):
 		'''
 		self.filename = file.path
 		try:
-			self.parts = TemplateParser().parse(file.read())
+			self.parts, self._compiled = _get_compiled_template(file)
 		except Exception as error:
 			error.parser_file = file
 			raise
@@ -182,5 +211,4 @@ class Template(SignalEmitter):
 		self.emit('process', output, context)
 
 	def do_process(self, output, context):
-		processor = TemplateProcessor(self.parts)
-		processor.process(output, context)
+		self._compiled(output, context)
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017 Jaap Karssenberg <jaap.karssenberg@gmail.com>
+
+'''This module contains a compiler that turns a parsed template into
+a python function. The result has the same behavior as running the
+template with the L{TemplateProcessor}, but the tree of instructions
+is only interpreted once. Each instruction is turned into a closure
+that already knows its arguments and sub-instructions, so processing
+the template does not need to look at tags and attributes anymore.
+
+Errors for instructions that can not be executed, like including a
+block that does not exist, are raised when the instruction is run, not
+when the template is compiled. This is the same as for the
+L{TemplateProcessor}.
+'''
+
+
+import collections
+
+from zim.utils import MovingWindowIter
+from zim.parser import SimpleTreeElement
+
+from zim.templates.expression import ExpressionParameter
+from zim.templates.processor import TemplateProcessor, \
+	TemplateContextDict, TemplateLoopState
+
+
+def compile_template(parts):
+	'''Compile a template
+	@param parts: A list of L{SimplerTreeElements} as produced by
+	L{TemplateParser.parse()}
+	@returns: a function that takes an C{output} and a C{context}
+	argument, see L{TemplateProcessor.process()}
+	'''
+	main = None
+	blocks = {}
+	for item in parts:
+		if item.tag == 'TEMPLATE':
+			main = item
+		elif item.tag == 'BLOCK':
+			blocks[item.get('name')] = item
+		else:
+			raise AssertionError('Unknown tag: %s' % item.tag)
+
+	if main is None:
+		raise AssertionError('Missing main part of template')
+
+	compiled_blocks = {}
+	for name, block in blocks.items():
+		compiled_blocks[name] = _compile_list(block, compiled_blocks)
+	run_main = _compile_list(main, compiled_blocks)
+
+	def process(output, context):
+		assert isinstance(context, TemplateContextDict)
+		run_main(output, context)
+
+	return process
+
+
+def _compile_list(elements, blocks):
+	steps = []
+	n = len(elements)
+	i = 0
+	while i < n:
+		element = elements[i]
+		i += 1
+		if isinstance(element, basestring):
+			steps.append(_compile_text(element))
+		elif element.tag in ('IF', 'ELIF', 'ELSE'):
+			# A clause is followed by any number of ELIF and ELSE
+			# clauses, they are evaluated in order till one matches
+			chain = [element]
+			while i < n \
+			and isinstance(elements[i], SimpleTreeElement) \
+			and elements[i].tag in ('ELIF', 'ELSE'):
+				chain.append(elements[i])
+				i += 1
+			steps.append(_compile_if(chain, blocks))
+		else:
+			steps.append(_compile_instruction(element, blocks))
+
+	if len(steps) == 1:
+		return steps[0]
+	else:
+		steps = tuple(steps)
+		def run_list(output, context):
+			for step in steps:
+				step(output, context)
+		return run_list
+
+
+def _compile_text(text):
+	def text_step(output, context):
+		output.append(text)
+	return text_step
+
+
+def _compile_if(chain, blocks):
+	clauses = tuple(
+		(
+			None if element.tag == 'ELSE' else element.attrib['expr'],
+			_compile_list(element, blocks) # recurs
+		)
+			for element in chain
+	)
+
+	def if_step(output, context):
+		for expr, body in clauses:
+			if expr is None:
+				body(output, context)
+			elif bool(expr(context)):
+				body(output, context)
+				break # skip subsequent ELIF / ELSE clauses
+	return if_step
+
+
+def _compile_instruction(element, blocks):
+	if element.tag == 'GET':
+		expr = element.attrib['expr']
+		def get_step(output, context):
+			output.append(unicode(expr(context)))
+		return get_step
+
+	elif element.tag == 'SET':
+		var = element.attrib['var']
+		expr = element.attrib['expr']
+		setter = _compile_set(var)
+		def set_step(output, context):
+			setter(context, expr(context))
+		return set_step
+
+	elif element.tag == 'FOR':
+		return _compile_for(element, blocks)
+
+	elif element.tag == 'INCLUDE':
+		expr = element.attrib['expr']
+		if isinstance(expr, ExpressionParameter):
+			name = expr.name
+			def include_step(output, context):
+				# Lookup at runtime, blocks may be defined after use
+				if name in blocks:
+					blocks[name](output, context)
+				else:
+					raise AssertionError('No such block defined: %s' % name)
+			return include_step
+		else:
+			def include_error(output, context):
+				raise AssertionError('TODO also allow files from template resources')
+			return include_error
+
+	else:
+		tag = element.tag
+		def unknown_error(output, context):
+			raise AssertionError('Unknown instruction: %s' % tag)
+		return unknown_error
+
+
+def _compile_set(var):
+	if len(var.parts) == 1:
+		# The context itself is always a TemplateContextDict
+		key = var.key
+		def set_key(context, value):
+			context[key] = value
+		return set_key
+	else:
+		def set_var(context, value):
+			TemplateProcessor._set(context, var, value)
+		return set_var
+
+
+def _compile_for(element, blocks):
+	expr = element.attrib['expr']
+	setter = _compile_set(element.attrib['var'])
+	body = _compile_list(element, blocks)
+
+	def for_step(output, context):
+		items = expr(context)
+		if not isinstance(items, collections.Iterable):
+			raise TypeError('Can not iterate over: %s' % items)
+		elif not isinstance(items, collections.Sized):
+			# cast to list to ensure we have a len()
+			items = list(items)
+
+		# set "loop"
+		outer = context.get('loop')
+		if isinstance(outer, TemplateLoopState):
+			loop = TemplateLoopState(len(items), outer)
+		else:
+			loop = TemplateLoopState(len(items), None)
+		context['loop'] = loop
+
+		# do the iterations
+		myiter = MovingWindowIter(items)
+		for i, window in enumerate(myiter):
+			loop._update(i, myiter)
+			setter(context, window[1]) # set var
+			body(output, context)
+
+		# restore "loop"
+		context['loop'] = outer
+
+	return for_step
@@ -242,7 +242,7 @@ class ExpressionFunctionCall(Expression):
 	the arguments and evaluates the function.
 	'''
 
-	__slots__ = ('param', 'args')
+	__slots__ = ('param', 'args', '_parent')
 
 	def __init__(self, param, args):
 		'''Constuctor
@@ -253,6 +253,7 @@ class ExpressionFunctionCall(Expression):
 		assert isinstance(args, ExpressionList)
 		self.param = param
 		self.args = args
+		self._parent = param.parent # avoid re-parsing the name on each call
 
 	def __eq__(self, other):
 		return (self.param, self.args) == (other.param, other.args)
@@ -260,7 +261,7 @@ class ExpressionFunctionCall(Expression):
 	def __call__(self, context):
 		## Lookup function:
 		## getitem dict / getattr objects / getattr on wrapper
-		obj = self.param.parent(context)
+		obj = self._parent(context)
 		name = self.param.key
 		try:
 			function = obj[name]
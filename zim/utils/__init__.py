@@ -251,6 +251,97 @@ class OrderedDict(collections.MutableMapping):
 		return len(self._values)
 
 
+class LRUCache(object):
+	'''Dict-like object for caching that keeps at most C{max_size}
+	items. When a new item is added to a full cache, the item that was
+	least recently used is dropped.
+	'''
+
+	# Order is kept in a circular doubly linked list of 4-item lists
+	# [prev, next, key, value], so lookups and updates are O(1).
+	# Same approach as the collections.OrderedDict recipe.
+
+	PREV, NEXT, KEY, VALUE = range(4)
+
+	def __init__(self, max_size):
+		assert max_size > 0
+		self.max_size = max_size
+		self.clear()
+
+	def __getitem__(self, k):
+		link = self._map[k]
+		self._move_to_end(link)
+		return link[self.VALUE]
+
+	def __setitem__(self, k, v):
+		if k in self._map:
+			link = self._map[k]
+			link[self.VALUE] = v
+			self._move_to_end(link)
+		else:
+			if len(self._map) >= self.max_size:
+				oldest = self._root[self.NEXT]
+				self._unlink(oldest)
+				del self._map[oldest[self.KEY]]
+			root = self._root
+			last = root[self.PREV]
+			link = [last, root, k, v]
+			last[self.NEXT] = root[self.PREV] = link
+			self._map[k] = link
+
+	def __delitem__(self, k):
+		link = self._map.pop(k)
+		self._unlink(link)
+
+	def __contains__(self, k):
+		return k in self._map
+
+	def __len__(self):
+		return len(self._map)
+
+	def _unlink(self, link):
+		prev, next = link[self.PREV], link[self.NEXT]
+		prev[self.NEXT] = next
+		next[self.PREV] = prev
+
+	def _move_to_end(self, link):
+		root = self._root
+		if root[self.PREV] is not link:
+			self._unlink(link)
+			last = root[self.PREV]
+			link[self.PREV] = last
+			link[self.NEXT] = root
+			last[self.NEXT] = root[self.PREV] = link
+
+	def keys(self):
+		'''Returns the keys, least recently used first'''
+		keys = []
+		link = self._root[self.NEXT]
+		while link is not self._root:
+			keys.append(link[self.KEY])
+			link = link[self.NEXT]
+		return keys
+
+	def get(self, k, default=None):
+		try:
+			return self[k]
+		except KeyError:
+			return default
+
+	def pop(self, k, default=None):
+		if k in self._map:
+			v = self._map[k][self.VALUE]
+			del self[k]
+			return v
+		else:
+			return default
+
+	def clear(self):
+		self._map = {}
+		self._root = [] # sentinel for the linked list
+		self._root[:] = [self._root, self._root, None, None]
+
+
 ## Special iterator class
 class MovingWindowIter(object):
 	'''Iterator yields a 3-tuple of the previous item, the current item
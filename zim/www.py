@@ -15,18 +15,25 @@ the standalone server.
 '''
 
 # TODO setting for doc_root_url when running in CGI mode
-# TODO support "etg" and "if-none-match' headers at least for icons
 # TODO: redirect server logging to logging module + set default level to -V in server process
 
+from __future__ import with_statement
 
 import sys
+import time
 import socket
+import threading
+import hashlib
 import logging
 import gobject
 
 from functools import partial
+from email.utils import formatdate, parsedate_tz, mktime_tz
 
 from wsgiref.headers import Headers
+from wsgiref.util import FileWrapper
+import wsgiref.simple_server
+import Queue
 import urllib
 
 from zim.errors import Error
@@ -35,6 +42,7 @@ from zim.fs import File, Dir, FileNotFoundError
 from zim.config import data_file, ConfigManager
 from zim.plugins import PluginManager
 from zim.parsing import url_encode
+from zim.utils import LRUCache
 
 from zim.export.linker import ExportLinker, StubLayout
 from zim.export.template import ExportTemplateContext
@@ -106,8 +114,24 @@ class WWWInterface(object):
 
 	For basic handlers to run this interface see the "wsgiref" package
 	in the standard library for python.
+
+	Responses have "ETag" and "Last-Modified" headers, so clients can
+	do a conditional request that is answered with "304 Not Modified".
+	For pages these are based on the mtime of the page source, the mtime
+	of the template and the last time the index changed. Rendered pages
+	are kept in a cache which is flushed when the index changes. Files
+	are streamed in blocks of C{BLOCK_SIZE} bytes.
+
+	Requests can be handled by multiple threads in parallel, see
+	L{ThreadPoolWSGIServer}. Since sqlite connections can not be shared
+	between threads, the L{notebook} attribute gives a read-only copy
+	of the notebook in threads other than the one that constructed
+	this object, see L{Notebook.get_read_only_copy()}.
 	'''
 
+	RENDER_CACHE_SIZE = 100 #: max number of rendered pages to cache
+	BLOCK_SIZE = 64 * 1024 #: block size for streaming files
+
 	def __init__(self, notebook, config=None, template='Default'):
 		'''Constructor
 		@param notebook: a L{Notebook} object
@@ -115,7 +139,9 @@ class WWWInterface(object):
 		@param template: html template for zim pages
 		'''
 		assert isinstance(notebook, Notebook)
-		self.notebook = notebook
+		self._notebook = notebook
+		self._thread = threading.current_thread()
+		self._local = threading.local()
 		self.config = config or ConfigManager(profile=notebook.profile)
 
 		self.output = None
@@ -131,15 +157,35 @@ class WWWInterface(object):
 		else:
 			self.template = template
 
-		self.linker_factory = partial(WWWLinker, self.notebook, self.template.resources_dir)
 		self.dumper_factory = get_format('html').Dumper # XXX
 
+		self._render_cache = LRUCache(self.RENDER_CACHE_SIZE)
+		self._render_cache_lock = threading.Lock()
+		self._index_mtime = time.time()
+		self.notebook.index.connect('changed', self.on_index_changed)
+
 		self.plugins = PluginManager(self.config)
 		self.plugins.extend(notebook)
 		self.plugins.extend(self)
 
 		#~ self.notebook.indexer.check_and_update()
 
+	@property
+	def notebook(self):
+		'''The L{Notebook} object for the current thread'''
+		if threading.current_thread() is self._thread:
+			return self._notebook
+
+		try:
+			return self._local.notebook
+		except AttributeError:
+			self._local.notebook = self._notebook.get_read_only_copy()
+			return self._local.notebook
+
+	@property
+	def linker_factory(self):
+		return partial(WWWLinker, self.notebook, self.template.resources_dir)
+
 	def __call__(self, environ, start_response):
 		'''Main function for handling a single request. Follows the
 		WSGI API.
@@ -153,7 +199,7 @@ class WWWInterface(object):
 
 			start_response(200, [('Content-Type', 'text/plain')])
 
-		@returns: the html page content as a list of lines
+		@returns: the response body as an iterable of strings
 		'''
 		headerlist = []
 		headers = Headers(headerlist)
@@ -185,22 +231,20 @@ class WWWInterface(object):
 
 			if path == '/':
 				headers.add_header('Content-Type', 'text/html', charset='utf-8')
-				content = self.render_index()
+				body = self._get_page_body(environ, headers, None)
 			elif path.startswith('/+docs/'):
 				dir = self.notebook.document_root
 				if not dir:
 					raise WebPageNotFoundError(path)
 				file = dir.file(path[7:])
-				content = [file.raw()]
+				body = self._get_file_body(environ, headers, file)
 					# Will raise FileNotFound when file does not exist
-				headers['Content-Type'] = file.get_mimetype()
 			elif path.startswith('/+file/'):
 				file = self.notebook.dir.file(path[7:])
 					# TODO: need abstraction for getting file from top level dir ?
-				content = [file.raw()]
+				body = self._get_file_body(environ, headers, file)
 					# Will raise FileNotFound when file does not exist
-				headers['Content-Type'] = file.get_mimetype()
- 			elif path.startswith('/+resources/'):
+			elif path.startswith('/+resources/'):
 				if self.template.resources_dir:
 					file = self.template.resources_dir.file(path[12:])
 					if not file.exists():
@@ -209,10 +253,9 @@ class WWWInterface(object):
 					file = data_file('pixmaps/%s' % path[12:])
 
 				if file:
-					content = [file.raw()]
+					body = self._get_file_body(environ, headers, file)
 						# Will raise FileNotFound when file does not exist
-					headers['Content-Type'] = file.get_mimetype()
-	 			else:
+				else:
 					raise WebPageNotFoundError(path)
 			else:
 				# Must be a page or a namespace (html file or directory path)
@@ -227,10 +270,8 @@ class WWWInterface(object):
 				path = self.notebook.pages.lookup_from_user_input(pagename)
 				try:
 					page = self.notebook.get_page(path)
-					if page.hascontent:
-						content = self.render_page(page)
-					elif page.haschildren:
-						content = self.render_index(page)
+					if page.hascontent or page.haschildren:
+						body = self._get_page_body(environ, headers, page)
 					else:
 						raise WebPageNotFoundError(path)
 				except PageNotFoundError:
@@ -261,13 +302,108 @@ class WWWInterface(object):
 			else:
 				return [string.encode('utf-8') for string in content]
 		else:
-			start_response('200 OK', headerlist)
-			if environ['REQUEST_METHOD'] == 'HEAD':
+			if body is None:
+				# Not modified, do not send any headers describing the body
+				del headers['Content-Type']
+				del headers['Content-Length']
+				start_response('304 Not Modified', headerlist)
 				return []
-			elif 'utf-8' in headers['Content-Type']:
-				return [string.encode('utf-8') for string in content]
 			else:
-				return content
+				start_response('200 OK', headerlist)
+				return body
+
+	def on_index_changed(self, index):
+		with self._render_cache_lock:
+			self._render_cache.clear()
+		self._index_mtime = time.time()
+
+	def _template_mtime(self):
+		filename = getattr(self.template, 'filename', None)
+		if filename:
+			file = File(filename)
+			if file.exists():
+				return file.mtime()
+		return None
+
+	def _check_not_modified(self, environ, headers, etag, mtime):
+		# Set the validators for a response and check them against
+		# the conditional request headers
+		headers['ETag'] = etag
+		headers['Last-Modified'] = formatdate(mtime, usegmt=True)
+
+		if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+		if if_none_match:
+			# Takes precedence over If-Modified-Since
+			tags = [t.strip() for t in if_none_match.split(',')]
+			return etag in tags or '*' in tags
+
+		if_modified_since = environ.get('HTTP_IF_MODIFIED_SINCE')
+		if if_modified_since:
+			date = parsedate_tz(if_modified_since)
+			if date is not None:
+				return int(mtime) <= mktime_tz(date)
+
+		return False
+
+	def _get_page_body(self, environ, headers, page):
+		# Returns the body for a page or namespace index as list of
+		# strings or None when the client copy is still valid
+		# Rendered pages are cached, the etag is used to check the
+		# cached version is still valid.
+		mtimes = (
+			page.mtime if page else None,
+			self._template_mtime(),
+			self._index_mtime
+		)
+		name = page.name if page else ':'
+		etag = '"%s"' % hashlib.md5(repr((name,) + mtimes)).hexdigest()
+		mtime = max(m for m in mtimes if m is not None)
+		if self._check_not_modified(environ, headers, etag, mtime):
+			return None
+
+		with self._render_cache_lock:
+			cached = self._render_cache.get(name)
+		if cached and cached[0] == etag:
+			html = cached[1]
+		else:
+			if page is None:
+				lines = self.render_index()
+			elif page.hascontent:
+				lines = self.render_page(page)
+			else:
+				lines = self.render_index(page)
+			html = ''.join(lines).encode('utf-8')
+			with self._render_cache_lock:
+				self._render_cache[name] = (etag, html)
+
+		headers['Content-Length'] = str(len(html))
+		if environ['REQUEST_METHOD'] == 'HEAD':
+			return []
+		else:
+			return [html]
+
+	def _get_file_body(self, environ, headers, file):
+		# Returns the body for a file as an iterable that streams the
+		# file content or None when the client copy is still valid
+		if not file.exists():
+			raise FileNotFoundError(file)
+
+		headers['Content-Type'] = file.get_mimetype()
+		mtime, size = file.mtime(), file.size()
+		etag = '"%x-%x"' % (int(mtime * 1000), size)
+		if self._check_not_modified(environ, headers, etag, mtime):
+			return None
+
+		headers['Content-Length'] = str(size)
+		if environ['REQUEST_METHOD'] == 'HEAD':
+			return []
+		else:
+			try:
+				fh = open(file.encodedpath, 'rb')
+			except IOError:
+				raise FileNotFoundError(file)
+			wrapper = environ.get('wsgi.file_wrapper', FileWrapper)
+			return wrapper(fh, self.BLOCK_SIZE)
 
 	def render_index(self, namespace=None):
 		'''Render an index page
@@ -344,25 +480,89 @@ class WWWLinker(ExportLinker):
 			return file.uri
 
 
+class ThreadPoolMixIn(object):
+	'''Mix-in class for C{SocketServer.BaseServer} sub-classes to handle
+	requests in a fixed pool of worker threads. Unlike
+	C{SocketServer.ThreadingMixIn} this limits the number of requests
+	that are handled in parallel, other requests wait in a queue.
+	The workers are started when the first request comes in.
+
+	@ivar n_threads: the number of worker threads
+	'''
+
+	n_threads = 4
+
+	daemon_threads = True #: do not wait for workers when the process exits
+
+	_queue = None
+
+	def process_request(self, request, client_address):
+		if self._queue is None:
+			self._queue = Queue.Queue()
+			self._workers = []
+			for i in range(self.n_threads):
+				worker = threading.Thread(target=self._worker_main)
+				worker.daemon = self.daemon_threads
+				worker.start()
+				self._workers.append(worker)
+		self._queue.put((request, client_address))
+
+	def _worker_main(self):
+		while True:
+			item = self._queue.get()
+			if item is None:
+				break # stop signal from server_close()
+
+			request, client_address = item
+			try:
+				self.finish_request(request, client_address)
+			except:
+				self.handle_error(request, client_address)
+			finally:
+				self.shutdown_request(request)
+
+	def server_close(self):
+		super(ThreadPoolMixIn, self).server_close()
+		if self._queue is not None:
+			for worker in self._workers:
+				self._queue.put(None)
+			for worker in self._workers:
+				worker.join()
+			self._queue = None
+
+
+class ThreadPoolWSGIServer(ThreadPoolMixIn, wsgiref.simple_server.WSGIServer):
+	'''C{WSGIServer} that handles requests in a pool of threads'''
+
+	def __init__(self, server_address, RequestHandlerClass, n_threads=4):
+		self.n_threads = n_threads
+		wsgiref.simple_server.WSGIServer.__init__(self, server_address, RequestHandlerClass)
+
+
 def main(notebook, port=8080, public=True, **opts):
 	httpd = make_server(notebook, port, public, **opts)
 	logger.info("Serving HTTP on %s port %i...", httpd.server_name, httpd.server_port)
 	httpd.serve_forever()
 
 
-def make_server(notebook, port=8080, public=True, **opts):
+def make_server(notebook, port=8080, public=True, threads=1, **opts):
 	'''Create a simple http server
 	@param notebook: the notebook location
 	@param port: the http port to serve on
 	@param public: allow connections to the server from other
 	computers - if C{False} can only connect from localhost
+	@param threads: the number of threads to handle requests, if
+	larger than 1 a L{ThreadPoolWSGIServer} is used, requires a notebook
+	with an index on disk
 	@param opts: options for L{WWWInterface.__init__()}
 	@returns: a C{WSGIServer} object
 	'''
-	import wsgiref.simple_server
 	app = WWWInterface(notebook, **opts) # FIXME make opts explicit
-	if public:
-		httpd = wsgiref.simple_server.make_server('', port, app)
+	if threads > 1:
+		server_class = partial(ThreadPoolWSGIServer, n_threads=threads)
 	else:
-		httpd = wsgiref.simple_server.make_server('localhost', port, app)
+		server_class = wsgiref.simple_server.WSGIServer
+
+	host = '' if public else 'localhost'
+	httpd = wsgiref.simple_server.make_server(host, port, app, server_class=server_class)
 	return httpd